@@ -0,0 +1,295 @@
+from grid import Grid
+from dispatch import dispatchStrategies
+import argparse, datetime, json, math, os, platform, sys, time
+import numpy as np
+
+
+# default share of each component type among the generated components
+defaultMix = {'providers': 0.15, 'users': 0.7, 'storages': 0.1, 'p2xs': 0.05}
+
+# generator settings of the benchmarked grids, see generateGrid()
+benchmarkPresets = {
+    'small': {'size': 40, 'islands': 4, 'density': 0.5, 'componentDensity': 0.2},
+    'medium': {'size': 120, 'islands': 16, 'density': 0.5, 'componentDensity': 0.1},
+    'large': {'size': 300, 'islands': 64, 'density': 0.5, 'componentDensity': 0.05}
+}
+
+# path of the stored benchmark baseline
+baselinePath = 'assets/benchmarks/baseline.json'
+
+def generateGrid(size: int, islands: int = 1, density: float = 0.5, componentDensity: float = 0.1,
+                 mix: dict = None, seed: int = 0) -> dict:
+    """Generates a grid setting in the format of assets/settings/grid.json. The grid is split into a square layout of
+    islands that are separated by one inactive row and column, so each island is a cell group of its own. The active
+    cells of an island form a comb: a vertical spine on its left edge with one horizontal branch of random length per
+    row, so the distances between the cells of an island are longer than their euclidean distances.
+
+    Args:
+        size(int): size of the square grid
+        islands(int): amount of islands, rounded up to a square number
+        density(float): expected share of active cells of an island
+        componentDensity(float): share of active cells that are occupied by a component
+        mix(dict): share of each component type, see defaultMix
+        seed(int): seed of the random number generator
+
+    Returns:
+        dict: the grid setting
+    """
+
+    rng = np.random.default_rng(seed)
+    mix = mix if mix is not None else defaultMix
+
+    perRow = math.ceil(math.sqrt(islands))
+    blockSize = (size + 1) // perRow - 1
+    if blockSize < 1:
+        print('a grid of size %d can not hold %d islands' % (size, islands))
+        sys.exit(1)
+
+    gridCells = []
+    activeCells = []
+    for islandX in range(perRow):
+        for islandY in range(perRow):
+            left, top = islandX*(blockSize+1), islandY*(blockSize+1)
+            gridCells.append([[left, top], [left, top + blockSize - 1]])
+            activeCells.extend((left, y) for y in range(top, top + blockSize))
+
+            # branch lengths are uniform in [1, 2*density*blockSize], so their mean is density*blockSize
+            lengths = rng.integers(1, max(2, round(2*density*blockSize)), size=blockSize, endpoint=True)
+            for y, length in zip(range(top, top + blockSize), np.minimum(lengths, blockSize).tolist()):
+                if length > 1:
+                    gridCells.append([[left + 1, y], [left + length - 1, y]])
+                    activeCells.extend((x, y) for x in range(left + 1, left + length))
+
+    # each component occupies its own random active cell
+    componentCount = round(componentDensity*len(activeCells))
+    positions = rng.choice(len(activeCells), size=componentCount, replace=False).tolist()
+
+    types = list(mix)
+    shares = np.array([mix[key] for key in types], dtype=np.float64)
+    typeIndices = rng.choice(len(types), size=componentCount, p=shares/shares.sum()).tolist()
+
+    gridData = {'providers': [], 'users': [], 'storages': [], 'p2xs': [], 'gridCells': gridCells, 'cellSize': 100}
+    for i, (position, typeIndex) in enumerate(zip(positions, typeIndices)):
+        key = types[typeIndex]
+        x, y = activeCells[position]
+        component = {'id': '%s_%d' % (key[:-1], i), 'displayName': '%s %d' % (key[:-1], i), 'coordX': x, 'coordY': y}
+        if key == 'providers':
+            component['maxKWH'] = int(rng.integers(50, 200))
+        elif key == 'storages':
+            component['maxKWH'] = int(rng.integers(20, 100))
+        gridData[key].append(component)
+
+    return gridData
+
+
+def generateScenario(gridData: dict, seed: int = 0) -> dict:
+    """Generates a scenario setting in the format of assets/settings/scenario.json for the components of the given
+    grid setting. Providers follow a daylight curve, users a curve with a morning and an evening peak, both scaled by
+    random noise per hour.
+
+    Args:
+        gridData(dict): the grid setting, see generateGrid()
+        seed(int): seed of the random number generator
+
+    Returns:
+        dict: the scenario setting
+    """
+
+    rng = np.random.default_rng(seed)
+    hours = np.arange(24)
+    daylight = np.clip(np.sin((hours - 6)/12*np.pi), 0, None)
+    demand = 0.5 + 0.5*np.exp(-(hours - 8)**2/8) + np.exp(-(hours - 19)**2/8)
+
+    providerKWHs = {}
+    for p in gridData['providers']:
+        providerKWHs[p['id']] = p['maxKWH']*(0.2 + 0.8*daylight)*rng.uniform(0.5, 1, 24)
+    userKWHs = {}
+    for u in gridData['users']:
+        userKWHs[u['id']] = rng.uniform(1, 10)*demand*rng.uniform(0.8, 1.2, 24)
+    p2xKWHs = {}
+    for p in gridData['p2xs']:
+        p2xKWHs[p['id']] = rng.uniform(0, 10, 24)
+
+    scenario = {}
+    for hour in hours.tolist():
+        scenario['%02d:00' % hour] = {
+            'providerKWHs': {componentID: round(kwhs[hour], 2) for componentID, kwhs in providerKWHs.items()},
+            'userKWHs': {componentID: round(kwhs[hour], 2) for componentID, kwhs in userKWHs.items()},
+            'p2xKWHs': {componentID: round(kwhs[hour], 2) for componentID, kwhs in p2xKWHs.items()}
+        }
+    return scenario
+
+
+def timeCase(run, setup=None, repeat: int = 5) -> float:
+    """Returns the shortest wall time of the given function out of repeat runs. The shortest run is the one least
+    disturbed by other processes.
+
+    Args:
+        run(callable): function to time, gets the return value of setup if given
+        setup(callable): function that prepares each run, it is not timed
+        repeat(int): amount of runs
+    """
+
+    best = math.inf
+    for _ in range(repeat):
+        args = (setup(),) if setup is not None else ()
+        startTime = time.perf_counter()
+        run(*args)
+        best = min(best, time.perf_counter() - startTime)
+    return best
+
+
+def runBenchmarks(gridData: dict, scenario: dict, size: int, arrayBacked: bool = False, repeat: int = 5,
+                  pairs: int = 1000, seed: int = 0, strategy: str = 'greedy') -> dict:
+    """Times the construction, the topology indices and the stepping of the given grid.
+
+    Cases:
+        init: constructing the grid
+        getCellGroups: labeling the cell groups after the topology changed
+        getCellDistance: the distances of random pairs of components of the same group after the topology changed
+        step: one step of a warm grid
+        day: a simulated day of a newly constructed grid
+
+    Args:
+        gridData(dict): the grid setting
+        scenario(dict): the scenario setting
+        size(int): size of the square grid
+        arrayBacked(bool): whether the grid keeps the component state in numpy arrays
+        repeat(int): amount of runs per case, the shortest one is reported
+        pairs(int): amount of component pairs of the getCellDistance case
+        seed(int): seed of the random pair selection
+        strategy(str): the dispatch strategy, see dispatch.dispatchStrategies
+
+    Returns:
+        dict: wall time of each case in seconds
+    """
+
+    def createGrid() -> Grid:
+        return Grid(gridData=gridData, scenario=scenario, gridSize=size, arrayBacked=arrayBacked, strategy=strategy)
+
+    grid = createGrid()
+    results = {'init': timeCase(createGrid, repeat=repeat)}
+
+    def invalidate() -> Grid:
+        grid.invalidateTopology()
+        return grid
+
+    results['getCellGroups'] = timeCase(lambda g: g.getCellGroups(), invalidate, repeat)
+
+    # pairs of components of the same group
+    rng = np.random.default_rng(seed)
+    components = grid.providers + grid.users + grid.storages + grid.p2xs
+    byGroup = {}
+    for c in components:
+        byGroup.setdefault(grid.groupOf(c.coordX, c.coordY), []).append(c)
+    groups = [members for members in byGroup.values() if len(members) > 1]
+    positions = []
+    for _ in range(pairs if groups else 0):
+        members = groups[rng.integers(len(groups))]
+        src, trg = rng.choice(len(members), size=2, replace=False).tolist()
+        positions.append((members[src].coordX, members[src].coordY, members[trg].coordX, members[trg].coordY))
+
+    def distances(g: Grid) -> None:
+        for srcX, srcY, trgX, trgY in positions:
+            g.getCellDistance(srcX, srcY, trgX, trgY)
+
+    def invalidateLabeled() -> Grid:
+        grid.invalidateTopology()
+        grid.getCellGroups()
+        return grid
+
+    results['getCellDistance'] = timeCase(distances, invalidateLabeled, repeat)
+
+    grid.step()
+    results['step'] = timeCase(grid.step, repeat=repeat)
+
+    def simulateDay(g: Grid) -> None:
+        end = g.simulationDayTime + datetime.timedelta(days=1)
+        while g.simulationDayTime < end:
+            g.step()
+
+    results['day'] = timeCase(simulateDay, createGrid, max(1, repeat // 2))
+    return results
+
+
+def compareResults(results: dict, baseline: dict, threshold: float = 0.25) -> list:
+    """Compares benchmark results with a baseline.
+
+    Args:
+        results(dict): wall time of each case in seconds
+        baseline(dict): wall time of each case in seconds of an earlier run
+        threshold(float): relative slowdown above which a case counts as regression
+
+    Returns:
+        list: (case, baseline seconds, seconds) of each regressed case
+    """
+
+    regressions = []
+    for case, seconds in results.items():
+        if case in baseline and seconds > baseline[case]*(1 + threshold):
+            regressions.append((case, baseline[case], seconds))
+    return regressions
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Benchmarks the grid on generated grids and scenarios.')
+    parser.add_argument('--preset', choices=list(benchmarkPresets), default='medium', help='size of the grid')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the generated grid and scenario')
+    parser.add_argument('--repeat', type=int, default=5, help='amount of runs per case')
+    parser.add_argument('--array-backed', action='store_true', help='keep the component state in numpy arrays')
+    parser.add_argument('--strategy', choices=list(dispatchStrategies), default='greedy',
+                        help='how the energy of each cell group is allocated')
+    parser.add_argument('--baseline', default=baselinePath, help='path to the baseline file')
+    parser.add_argument('--threshold', type=float, default=0.25, help='relative slowdown that counts as regression')
+    parser.add_argument('--save', action='store_true', help='store the results as baseline instead of comparing')
+    args = parser.parse_args(argv)
+
+    preset = benchmarkPresets[args.preset]
+    gridData = generateGrid(seed=args.seed, **preset)
+    scenario = generateScenario(gridData, seed=args.seed)
+    componentCount = sum(len(gridData[key]) for key in ('providers', 'users', 'storages', 'p2xs'))
+    print('benchmarking a %dx%d grid with %d islands and %d components' % (
+        preset['size'], preset['size'], preset['islands'], componentCount)
+    )
+
+    results = runBenchmarks(
+        gridData, scenario, preset['size'], args.array_backed, args.repeat, seed=args.seed, strategy=args.strategy
+    )
+
+    # baselines are stored per preset, seed, component storage and dispatch strategy
+    key = '%s-%d%s' % (args.preset, args.seed, '-array-backed' if args.array_backed else '')
+    if args.strategy != 'greedy':
+        key += '-' + args.strategy
+    baselines = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as file:
+            baselines = json.load(file)
+    baseline = baselines.get(key, {}).get('results', {})
+
+    for case, seconds in results.items():
+        if case in baseline:
+            print('%-16s %10.3f ms %+8.1f%%' % (case, seconds*1000, (seconds/baseline[case] - 1)*100))
+        else:
+            print('%-16s %10.3f ms' % (case, seconds*1000))
+
+    if args.save:
+        baselines[key] = {'machine': platform.platform(), 'python': platform.python_version(), 'results': results}
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w') as file:
+            json.dump(baselines, file, indent=4)
+        print('stored the results as baseline ' + key)
+        return
+
+    if not baseline:
+        print('no baseline %s in %s, run with --save to store one' % (key, args.baseline))
+        return
+
+    regressions = compareResults(results, baseline, args.threshold)
+    for case, baselineSeconds, seconds in regressions:
+        print('%s regressed from %.3f ms to %.3f ms' % (case, baselineSeconds*1000, seconds*1000))
+    if regressions:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
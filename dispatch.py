@@ -0,0 +1,940 @@
+import heapq
+from math import inf
+
+
+class CellNetwork:
+    """Plain data cell graph of a cell group with capacity limits on some of its cells or edges, see
+    allocateCapacitated().
+
+    The cells of the group are contracted into zones: cells that are connected through unlimited cells and edges form
+    one zone, as any amount of energy can pass between them, and each cell with a capacity limit is a zone of its own.
+    Only the edges between zones are kept, together with the distances within the zones that are needed to apply the
+    transmission loss, see Grid._buildCellNetwork().
+
+    Args:
+        zoneCount(int): amount of zones
+        zoneOf(dict): maps the position of each component cell and each cell of an edge to the index of its zone
+        cellCapacities(dict): maps the position of each cell with a capacity limit to the largest amount of kWh that
+            may pass it per 15 minutes
+        edges(list): (position, position, capacity) of each edge between two zones, the capacity is inf if unlimited
+        distances(dict): maps the position of each supplier cell and each cell of an edge to the distances within its
+            zone to the consumer cells and the cells of the edges
+        providerCells(list): position of each provider of the group
+        userCells(list): position of each user of the group
+        storageCells(list): position of each storage of the group
+        p2xCells(list): position of each p2x of the group
+    """
+
+    def __init__(self, zoneCount: int, zoneOf: dict, cellCapacities: dict, edges: list, distances: dict,
+                 providerCells: list, userCells: list, storageCells: list, p2xCells: list):
+        self.zoneCount = zoneCount
+        self.zoneOf = zoneOf
+        self.cellCapacities = cellCapacities
+        self.edges = edges
+        self.distances = distances
+        self.providerCells = providerCells
+        self.userCells = userCells
+        self.storageCells = storageCells
+        self.p2xCells = p2xCells
+
+
+class GroupProblem:
+    """Plain data snapshot of the energy state of one cell group. Groups share no state, so each problem can be
+    allocated on its own, also in another process.
+
+    The supplier orders hold, for each consumer, the indices of the suppliers of the same group ranked by the share
+    of their energy that arrives at the consumer. The supplier efficiencies and distances hold that share and the
+    amount of cells in between for each ranked supplier.
+
+    Args:
+        label(int): label of the cell group
+    """
+
+    def __init__(self, label: int):
+        self.label = label
+
+        self.providerIDs = []
+        self.providerKWHs = []
+
+        self.userIDs = []
+        self.userKWHs = []
+        self.userDesiredKWHs = []
+        self.userProviderOrders = []
+        self.userStorageOrders = []
+        self.userProviderEfficiencies = []
+        self.userStorageEfficiencies = []
+        self.userProviderDistances = []
+        self.userStorageDistances = []
+
+        self.storageIDs = []
+        self.storageKWHs = []
+        self.storageMaxKWHs = []
+        self.storageProviderOrders = []
+        self.storageProviderEfficiencies = []
+        self.storageProviderDistances = []
+
+        self.p2xIDs = []
+        self.p2xKWHs = []
+        self.p2xDesiredKWHs = []
+        self.p2xProviderOrders = []
+        self.p2xProviderEfficiencies = []
+        self.p2xProviderDistances = []
+
+        # state of the strategy after the previous allocation of the group, if any, see GroupResult
+        self.warmStart = None
+
+        # name of the dispatch strategy, see dispatchStrategies. groups with capacity limits have a cell network and
+        # are allocated by allocateCapacitated() instead
+        self.strategy = 'greedy'
+        self.cellNetwork = None
+        self.energyLossPerCell = 1.0
+
+        # length of the timestep relative to 15 minutes, the capacity limits of the cell network scale with it
+        self.timestepScale = 1.0
+
+
+class GroupResult:
+    """The energy state of one cell group after the allocation of a timestep.
+
+    Args:
+        label(int): label of the cell group
+        providerKWHs(list): currentKWH of each provider of the group
+        userKWHs(list): currentKWH of each user of the group
+        storageKWHs(list): currentKWH of each storage of the group
+        p2xKWHs(list): currentKWH of each p2x of the group
+        dependencyMap(dict): maps the ID of each consumer to the IDs of the components it consumed
+        warmStart: state of the strategy that the next allocation of the group starts from, None if the strategy
+            keeps no state
+        edgeLoads(dict): kWh that passed each edge with a capacity limit as ((x, y), (x, y)) pair, if the group has
+            a cell network
+        cellLoads(dict): kWh that passed each cell with a capacity limit, if the group has a cell network
+    """
+
+    def __init__(self, label: int, providerKWHs: list, userKWHs: list, storageKWHs: list, p2xKWHs: list,
+                 dependencyMap: dict, warmStart=None, edgeLoads: dict = None, cellLoads: dict = None):
+        self.label = label
+        self.providerKWHs = providerKWHs
+        self.userKWHs = userKWHs
+        self.storageKWHs = storageKWHs
+        self.p2xKWHs = p2xKWHs
+        self.dependencyMap = dependencyMap
+        self.warmStart = warmStart
+        self.edgeLoads = edgeLoads
+        self.cellLoads = cellLoads
+
+
+class SupplierPool:
+    """The suppliers of one kind within a cell group. Suppliers only lose energy during an allocation, so once a
+    supplier is exhausted it stays exhausted and the pool can count the suppliers that still have energy left.
+
+    Args:
+        ids(list): ID of each supplier
+        kwhs(list): currentKWH of each supplier, updated in place during the allocation
+    """
+
+    def __init__(self, ids: list, kwhs: list):
+        self.ids = ids
+        self.kwhs = kwhs
+        self.availableCount = 0
+        for kwh in kwhs:
+            if kwh > 0:
+                self.availableCount += 1
+
+
+def consume(pool: SupplierPool, consumerKWHs: list, consumerLimits: list, consumerIndex: int, supplierOrder: list,
+            supplierEfficiencies: list, dependencies: list) -> None:
+    """Lets a consumer greedily consume from the given suppliers until its limit is reached. Only the efficiency share
+    of the energy a supplier sends arrives at the consumer, the rest is lost on the way.
+
+    The supplier order is cached per topology, so no sorting happens here. The walk stops as soon as the consumer is
+    satisfied or the pool is exhausted, which makes consumers that come after the supply ran out O(1).
+
+    Args:
+        pool(SupplierPool): the suppliers to consume from
+        consumerKWHs(list): currentKWH of each consumer, updated in place
+        consumerLimits(list): the kWh each consumer wants to reach
+        consumerIndex(int): index of the consuming consumer
+        supplierOrder(list): indices of the suppliers ranked by their efficiency
+        supplierEfficiencies(list): share of the sent energy that arrives at the consumer for each ranked supplier
+        dependencies(list): IDs of the components the consumer consumed, updated in place
+    """
+
+    supplierKWHs = pool.kwhs
+    limit = consumerLimits[consumerIndex]
+
+    for i, efficiency in zip(supplierOrder, supplierEfficiencies):
+        if pool.availableCount == 0 or not consumerKWHs[consumerIndex] < limit:
+            return
+
+        # skip exhausted suppliers and suppliers whose energy would not arrive at all
+        if not supplierKWHs[i] > 0 or not efficiency > 0:
+            continue
+
+        # compute energy consumption, the supplier has to send more than the consumer needs
+        neededKWH = limit - consumerKWHs[consumerIndex]
+        sentKWH = neededKWH/efficiency
+        if supplierKWHs[i] < sentKWH:
+            # the supplier sends all it has left
+            consumerKWHs[consumerIndex] += supplierKWHs[i]*efficiency
+            supplierKWHs[i] = 0
+        else:
+            supplierKWHs[i] -= sentKWH
+            consumerKWHs[consumerIndex] += neededKWH
+
+        if not supplierKWHs[i] > 0:
+            pool.availableCount -= 1
+
+        # keep track of component dependency
+        if pool.ids[i] not in dependencies:
+            dependencies.append(pool.ids[i])
+
+
+def allocateGreedy(problem: GroupProblem) -> GroupResult:
+    """Greedily allocates the energy of a cell group. Consumers are served in list order, each by its most efficient
+    suppliers first.
+
+    prioritize: providers -> users -> storages -> p2x
+
+    Args:
+        problem(GroupProblem): the energy state of the group
+
+    Returns:
+        GroupResult: the energy state of the group after the allocation
+    """
+
+    providers = SupplierPool(problem.providerIDs, list(problem.providerKWHs))
+    storages = SupplierPool(problem.storageIDs, list(problem.storageKWHs))
+    userKWHs = list(problem.userKWHs)
+    p2xKWHs = list(problem.p2xKWHs)
+    dependencyMap = {}
+
+    # step 1, users get to consume from providers, then storages
+    for i, userID in enumerate(problem.userIDs):
+        dependencyMap[userID] = []
+        consume(
+            providers, userKWHs, problem.userDesiredKWHs, i, problem.userProviderOrders[i],
+            problem.userProviderEfficiencies[i], dependencyMap[userID]
+        )
+        consume(
+            storages, userKWHs, problem.userDesiredKWHs, i, problem.userStorageOrders[i],
+            problem.userStorageEfficiencies[i], dependencyMap[userID]
+        )
+
+    # step 2, storages can now consume from providers
+    storageKWHs = storages.kwhs
+    for i, storageID in enumerate(problem.storageIDs):
+        dependencyMap[storageID] = []
+        consume(
+            providers, storageKWHs, problem.storageMaxKWHs, i, problem.storageProviderOrders[i],
+            problem.storageProviderEfficiencies[i], dependencyMap[storageID]
+        )
+
+    # step three, p2x's can now consume from the provider's leftovers
+    for i, p2xID in enumerate(problem.p2xIDs):
+        dependencyMap[p2xID] = []
+        consume(
+            providers, p2xKWHs, problem.p2xDesiredKWHs, i, problem.p2xProviderOrders[i],
+            problem.p2xProviderEfficiencies[i], dependencyMap[p2xID]
+        )
+
+    return GroupResult(problem.label, providers.kwhs, userKWHs, storageKWHs, p2xKWHs, dependencyMap)
+
+
+# flows and excesses below this amount of kWh are treated as 0
+flowTolerance = 1e-9
+
+
+class FlowNetwork:
+    """Residual network of a min cost circulation, solved with successive shortest paths. Arc 2a is the a-th added arc
+    and arc 2a+1 its reverse.
+
+    Args:
+        nodeCount(int): amount of nodes
+    """
+
+    def __init__(self, nodeCount: int):
+        self.nodeCount = nodeCount
+        self.arcsOf = [[] for _ in range(nodeCount)]
+        self.heads = []
+        self.capacities = []
+        self.costs = []
+        self.flows = []
+
+
+    def addArc(self, tail: int, head: int, capacity: float, cost: int) -> int:
+        """Adds an arc and its reverse.
+
+        Args:
+            tail(int): node the arc leaves
+            head(int): node the arc enters
+            capacity(float): largest flow on the arc, inf if it is unbounded
+            cost(int): cost per unit of flow, unbounded arcs must not have a negative cost
+
+        Returns:
+            int: index of the arc
+        """
+
+        arc = len(self.heads)
+        for node, other, arcCapacity, arcCost in ((tail, head, capacity, cost), (head, tail, 0.0, -cost)):
+            self.arcsOf[node].append(len(self.heads))
+            self.heads.append(other)
+            self.capacities.append(arcCapacity)
+            self.costs.append(arcCost)
+            self.flows.append(0.0)
+        return arc
+
+
+    def solve(self, potentials: list = None, flows: list = None) -> list:
+        """Computes a min cost circulation.
+
+        The solver keeps node potentials under which no residual arc has a negative reduced cost and routes the excess
+        of the nodes along shortest paths of reduced costs until every node is balanced. Any flow can be the starting
+        point: it is clipped to the capacities and repaired, so starting from the solution of a similar network only
+        leaves a few imbalances to route.
+
+        Args:
+            potentials(list): node potentials of a previous solution of a network with the same arcs and costs
+            flows(list): flow on each added arc of a previous solution
+
+        Returns:
+            list: the node potentials of the solution, to warm start the next solve
+        """
+
+        heads, capacities, costs, flow = self.heads, self.capacities, self.costs, self.flows
+
+        h = list(potentials) if potentials is not None else [0]*self.nodeCount
+        for arc in range(0, len(heads), 2):
+            # unbounded arcs can't be saturated, so they must keep a non-negative reduced cost
+            if capacities[arc] == inf and costs[arc] + h[heads[arc+1]] - h[heads[arc]] < 0:
+                h = [0]*self.nodeCount
+                flows = None
+                break
+
+        # start from the given flows, then saturate the arcs with a negative reduced cost and empty the ones with a
+        # positive reduced cost, so that no residual arc has a negative reduced cost
+        for arc in range(0, len(heads), 2):
+            f = min(max(flows[arc // 2], 0.0), capacities[arc]) if flows is not None else 0.0
+            reducedCost = costs[arc] + h[heads[arc+1]] - h[heads[arc]]
+            if reducedCost < 0:
+                f = capacities[arc]
+            elif reducedCost > 0:
+                f = 0.0
+            flow[arc] = f
+            flow[arc+1] = -f
+
+        excess = [0.0]*self.nodeCount
+        for arc in range(0, len(heads), 2):
+            if flow[arc] != 0:
+                excess[heads[arc]] += flow[arc]
+                excess[heads[arc+1]] -= flow[arc]
+
+        while True:
+            sources = [v for v in range(self.nodeCount) if excess[v] > flowTolerance]
+            if not sources:
+                break
+
+            # dijkstra from all nodes with excess to the closest node with a deficit
+            distances = [inf]*self.nodeCount
+            parents = [-1]*self.nodeCount
+            for v in sources:
+                distances[v] = 0
+            heap = [(0, v) for v in sources]
+            target = -1
+            while heap:
+                d, u = heapq.heappop(heap)
+                if d > distances[u]:
+                    continue
+                if excess[u] < -flowTolerance:
+                    target = u
+                    break
+                for arc in self.arcsOf[u]:
+                    if capacities[arc] - flow[arc] > flowTolerance:
+                        v = heads[arc]
+                        dv = d + costs[arc] + h[u] - h[v]
+                        if dv < distances[v]:
+                            distances[v] = dv
+                            parents[v] = arc
+                            heapq.heappush(heap, (dv, v))
+
+            # only left over rounding errors can't be routed
+            if target == -1:
+                break
+
+            targetDistance = distances[target]
+            for v in range(self.nodeCount):
+                h[v] += min(distances[v], targetDistance)
+
+            # the shortest paths now consist of arcs with a reduced cost of 0, route along all of them at once
+            self._routeAdmissible(sources, h, excess)
+
+        return h
+
+
+    def maxFlow(self, source: int, sink: int) -> float:
+        """Pushes as much flow as possible from the source to the sink on top of the current flow, with Dinic's
+        algorithm: each phase only uses the arcs that lead one level further away from the source, so the shortest
+        paths are saturated first.
+
+        Args:
+            source(int): node the flow leaves
+            sink(int): node the flow enters
+
+        Returns:
+            float: the amount of flow that was added
+        """
+
+        heads, capacities, flow, arcsOf = self.heads, self.capacities, self.flows, self.arcsOf
+        total = 0.0
+
+        while True:
+            levels = [-1]*self.nodeCount
+            levels[source] = 0
+            queue = [source]
+            for u in queue:
+                for arc in arcsOf[u]:
+                    v = heads[arc]
+                    if levels[v] < 0 and capacities[arc] - flow[arc] > flowTolerance:
+                        levels[v] = levels[u] + 1
+                        queue.append(v)
+            if levels[sink] < 0:
+                return total
+
+            # blocking flow, iteratively so that long paths don't exceed the recursion limit
+            nextArc = [0]*self.nodeCount
+            while True:
+                path = []
+                u = source
+                while u != sink:
+                    arcs = arcsOf[u]
+                    while nextArc[u] < len(arcs):
+                        arc = arcs[nextArc[u]]
+                        v = heads[arc]
+                        if levels[v] == levels[u] + 1 and capacities[arc] - flow[arc] > flowTolerance:
+                            break
+                        nextArc[u] += 1
+                    else:
+                        # the sink can't be reached from this node in this phase, step back
+                        levels[u] = -1
+                        if not path:
+                            break
+                        u = heads[path.pop() ^ 1]
+                        nextArc[u] += 1
+                        continue
+
+                    path.append(arc)
+                    u = v
+
+                if not path:
+                    break
+
+                amount = min(capacities[arc] - flow[arc] for arc in path)
+                for arc in path:
+                    flow[arc] += amount
+                    flow[arc ^ 1] -= amount
+                total += amount
+
+
+    def decompose(self, source: int, sink: int, key=None) -> list:
+        """Splits the flow from the source to the sink into paths and removes it from the network. Cycles of flow are
+        cancelled on the way.
+
+        Args:
+            source(int): node the flow leaves
+            sink(int): node the flow enters
+            key(callable): gets the path so far and an arc with flow that leaves its last node, the path continues
+                with the arc of the smallest key. if None, it continues with the first arc
+
+        Returns:
+            list: (amount, arcs) of each path
+        """
+
+        heads, flow, arcsOf = self.heads, self.flows, self.arcsOf
+        nextArc = [0]*self.nodeCount
+        paths = []
+
+        for firstArc in arcsOf[source]:
+            while firstArc % 2 == 0 and flow[firstArc] > flowTolerance:
+                path = [firstArc]
+                nodes = [source, heads[firstArc]]
+                positions = {source: 0, heads[firstArc]: 1}
+                u = heads[firstArc]
+                while u != sink:
+                    # flow only ever decreases here, so arcs without flow can be skipped for good
+                    arcs = arcsOf[u]
+                    while nextArc[u] < len(arcs):
+                        arc = arcs[nextArc[u]]
+                        if arc % 2 == 0 and flow[arc] > flowTolerance:
+                            break
+                        nextArc[u] += 1
+                    else:
+                        break
+
+                    if key is not None:
+                        arc = min(
+                            (a for a in arcs[nextArc[u]:] if a % 2 == 0 and flow[a] > flowTolerance),
+                            key=lambda a: key(path, a)
+                        )
+
+                    v = heads[arc]
+                    if v in positions:
+                        # cancel the cycle and continue from where it started
+                        cycle = path[positions[v]:] + [arc]
+                        amount = min(flow[a] for a in cycle)
+                        for a in cycle:
+                            flow[a] -= amount
+                            flow[a ^ 1] += amount
+                        for w in nodes[positions[v]+1:]:
+                            del positions[w]
+                        del path[positions[v]:]
+                        del nodes[positions[v]+1:]
+                        u = v
+                        continue
+
+                    path.append(arc)
+                    nodes.append(v)
+                    positions[v] = len(nodes) - 1
+                    u = v
+
+                amount = min(flow[a] for a in path)
+                for a in path:
+                    flow[a] -= amount
+                    flow[a ^ 1] += amount
+
+                # only left over rounding errors don't reach the sink
+                if u == sink:
+                    paths.append((amount, path))
+
+        return paths
+
+
+    def _routeAdmissible(self, sources: list, h: list, excess: list) -> None:
+        """Routes the excess of the given nodes to nodes with a deficit along residual arcs with a reduced cost of 0,
+        with one depth first search per path that never revisits an arc it already ruled out."""
+
+        heads, capacities, costs, flow, arcsOf = self.heads, self.capacities, self.costs, self.flows, self.arcsOf
+
+        nextArc = [0]*self.nodeCount
+        dead = [False]*self.nodeCount
+        for s in sources:
+            while excess[s] > flowTolerance:
+                path = []
+                onPath = {s}
+                u = s
+                while excess[u] >= -flowTolerance:
+                    arcs = arcsOf[u]
+                    while nextArc[u] < len(arcs):
+                        arc = arcs[nextArc[u]]
+                        v = heads[arc]
+                        if not dead[v] and v not in onPath and capacities[arc] - flow[arc] > flowTolerance and \
+                                costs[arc] + h[u] - h[v] == 0:
+                            break
+                        nextArc[u] += 1
+                    else:
+                        # no deficit is reachable from this node, step back
+                        dead[u] = True
+                        if not path:
+                            break
+                        onPath.discard(u)
+                        u = heads[path.pop() ^ 1]
+                        nextArc[u] += 1
+                        continue
+
+                    path.append(arc)
+                    onPath.add(v)
+                    u = v
+
+                if not path:
+                    break
+
+                # push as much as the path, its source and its target allow
+                amount = min(excess[s], -excess[u])
+                for arc in path:
+                    amount = min(amount, capacities[arc] - flow[arc])
+                for arc in path:
+                    flow[arc] += amount
+                    flow[arc ^ 1] -= amount
+                excess[s] -= amount
+                excess[u] += amount
+
+
+def allocateMinCostFlow(problem: GroupProblem) -> GroupResult:
+    """Allocates the energy of a cell group as a min cost flow, so the outcome does not depend on the order of the
+    consumers.
+
+    Energy flows from the providers and from the stock of the storages to the consumers, at a cost of the distance
+    per kWh. Each kWh that reaches a consumer earns a reward, which is larger for users than for storages and larger
+    for storages than for p2xs, and larger than the cost of any path. So the flow serves as much as possible in the
+    order of priority of the greedy allocation, and at the least distance. The flow keeps the previous solution of the
+    group as warm start.
+
+    The flow is computed in sent kWh and caps each consumer at the kWh it would need from its most efficient supplier.
+    The transmission losses are applied to the result, and what the losses leave unserved is topped up greedily from
+    the remaining supply.
+
+    prioritize: providers -> users -> storages -> p2x
+
+    Args:
+        problem(GroupProblem): the energy state of the group
+
+    Returns:
+        GroupResult: the energy state of the group after the allocation
+    """
+
+    providerCount, storageCount = len(problem.providerIDs), len(problem.storageIDs)
+    userCount, p2xCount = len(problem.userIDs), len(problem.p2xIDs)
+
+    # nodes: source, sink, providers, storage stocks, storage charges, users, p2xs
+    source, sink = 0, 1
+    providerNodes = range(2, 2 + providerCount)
+    stockNodes = range(providerNodes.stop, providerNodes.stop + storageCount)
+    chargeNodes = range(stockNodes.stop, stockNodes.stop + storageCount)
+    userNodes = range(chargeNodes.stop, chargeNodes.stop + userCount)
+    p2xNodes = range(userNodes.stop, userNodes.stop + p2xCount)
+    network = FlowNetwork(p2xNodes.stop)
+
+    # the rewards outweigh the cost of any path, which passes each node at most once
+    maxDistance = 0
+    for distances in (problem.userProviderDistances, problem.userStorageDistances, problem.storageProviderDistances,
+                      problem.p2xProviderDistances):
+        for consumerDistances in distances:
+            for d in consumerDistances:
+                if d != inf and d > maxDistance:
+                    maxDistance = d
+    gap = network.nodeCount*(maxDistance + 1) + 1
+
+    network.addArc(sink, source, inf, 0)
+    providerArcs = [
+        network.addArc(source, node, max(kwh, 0), 0) for node, kwh in zip(providerNodes, problem.providerKWHs)
+    ]
+    stockArcs = [network.addArc(source, node, max(kwh, 0), 0) for node, kwh in zip(stockNodes, problem.storageKWHs)]
+
+    # the stock that is not consumed stays in the storage and fills it like a charge
+    keepArcs = []
+    for stockNode, chargeNode, maxKWH in zip(stockNodes, chargeNodes, problem.storageMaxKWHs):
+        keepArcs.append(network.addArc(stockNode, chargeNode, inf, 0))
+        network.addArc(chargeNode, sink, max(maxKWH, 0), -2*gap)
+
+    def addSupplierArcs(supplierNodes, consumerNode, order, efficiencies, distances) -> list:
+        arcs = []
+        for i, efficiency, distance in zip(order, efficiencies, distances):
+            if efficiency > 0:
+                arcs.append((network.addArc(supplierNodes[i], consumerNode, inf, distance), i, efficiency))
+        return arcs
+
+    def addConsumerArc(consumerNode, neededKWH, efficiencies, reward) -> None:
+        bestEfficiency = max(efficiencies, default=1.0)
+        if neededKWH > 0 and bestEfficiency > 0:
+            network.addArc(consumerNode, sink, neededKWH/bestEfficiency, -reward)
+
+    userArcs = []
+    for j, node in enumerate(userNodes):
+        arcs = addSupplierArcs(
+            providerNodes, node, problem.userProviderOrders[j], problem.userProviderEfficiencies[j],
+            problem.userProviderDistances[j]
+        )
+        storageArcs = addSupplierArcs(
+            stockNodes, node, problem.userStorageOrders[j], problem.userStorageEfficiencies[j],
+            problem.userStorageDistances[j]
+        )
+        userArcs.append((arcs, storageArcs))
+        addConsumerArc(
+            node, problem.userDesiredKWHs[j] - problem.userKWHs[j],
+            problem.userProviderEfficiencies[j] + problem.userStorageEfficiencies[j], 3*gap
+        )
+
+    chargeArcs = []
+    for k, node in enumerate(chargeNodes):
+        chargeArcs.append(addSupplierArcs(
+            providerNodes, node, problem.storageProviderOrders[k], problem.storageProviderEfficiencies[k],
+            problem.storageProviderDistances[k]
+        ))
+
+    p2xArcs = []
+    for j, node in enumerate(p2xNodes):
+        p2xArcs.append(addSupplierArcs(
+            providerNodes, node, problem.p2xProviderOrders[j], problem.p2xProviderEfficiencies[j],
+            problem.p2xProviderDistances[j]
+        ))
+        addConsumerArc(
+            node, problem.p2xDesiredKWHs[j] - problem.p2xKWHs[j], problem.p2xProviderEfficiencies[j], gap
+        )
+
+    # the previous solution only fits if the group has the same arcs
+    potentials, flows = None, None
+    if problem.warmStart is not None and len(problem.warmStart[0]) == network.nodeCount and \
+            len(problem.warmStart[1])*2 == len(network.heads):
+        potentials, flows = problem.warmStart
+    potentials = network.solve(potentials, flows)
+    flow = network.flows
+
+    # apply the flow, only the efficiency share of the sent kWh arrives
+    providerKWHs = [max(kwh - flow[arc], 0) for kwh, arc in zip(problem.providerKWHs, providerArcs)]
+    # the stock that was kept never left the storage, so it comes back without loss
+    storageKWHs = [
+        max(kwh - flow[stockArc] + flow[keepArc], 0)
+        for kwh, stockArc, keepArc in zip(problem.storageKWHs, stockArcs, keepArcs)
+    ]
+    userKWHs = list(problem.userKWHs)
+    p2xKWHs = list(problem.p2xKWHs)
+    dependencyMap = {}
+
+    for j, (arcs, storageArcs) in enumerate(userArcs):
+        dependencies = dependencyMap[problem.userIDs[j]] = []
+        for supplierArcs, supplierIDs, supplierKWHs in ((arcs, problem.providerIDs, None),
+                                                        (storageArcs, problem.storageIDs, storageKWHs)):
+            for arc, i, efficiency in supplierArcs:
+                if flow[arc] > flowTolerance:
+                    userKWHs[j] += flow[arc]*efficiency
+                    dependencies.append(supplierIDs[i])
+
+    # the stock the storages gave away is already deducted, what they charged is added
+    for k, arcs in enumerate(chargeArcs):
+        dependencies = dependencyMap[problem.storageIDs[k]] = []
+        for arc, i, efficiency in arcs:
+            if flow[arc] > flowTolerance:
+                storageKWHs[k] = min(storageKWHs[k] + flow[arc]*efficiency, problem.storageMaxKWHs[k])
+                dependencies.append(problem.providerIDs[i])
+
+    for j, arcs in enumerate(p2xArcs):
+        dependencies = dependencyMap[problem.p2xIDs[j]] = []
+        for arc, i, efficiency in arcs:
+            if flow[arc] > flowTolerance:
+                p2xKWHs[j] += flow[arc]*efficiency
+                dependencies.append(problem.providerIDs[i])
+
+    # top up what the losses left unserved from the remaining supply
+    providers = SupplierPool(problem.providerIDs, providerKWHs)
+    storages = SupplierPool(problem.storageIDs, storageKWHs)
+    for i, userID in enumerate(problem.userIDs):
+        consume(
+            providers, userKWHs, problem.userDesiredKWHs, i, problem.userProviderOrders[i],
+            problem.userProviderEfficiencies[i], dependencyMap[userID]
+        )
+        consume(
+            storages, userKWHs, problem.userDesiredKWHs, i, problem.userStorageOrders[i],
+            problem.userStorageEfficiencies[i], dependencyMap[userID]
+        )
+    for i, storageID in enumerate(problem.storageIDs):
+        consume(
+            providers, storageKWHs, problem.storageMaxKWHs, i, problem.storageProviderOrders[i],
+            problem.storageProviderEfficiencies[i], dependencyMap[storageID]
+        )
+    for i, p2xID in enumerate(problem.p2xIDs):
+        consume(
+            providers, p2xKWHs, problem.p2xDesiredKWHs, i, problem.p2xProviderOrders[i],
+            problem.p2xProviderEfficiencies[i], dependencyMap[p2xID]
+        )
+
+    return GroupResult(
+        problem.label, providerKWHs, userKWHs, storageKWHs, p2xKWHs, dependencyMap, (potentials, flow[::2])
+    )
+
+
+def allocateCapacitated(problem: GroupProblem) -> GroupResult:
+    """Allocates the energy of a cell group whose cells or edges have capacity limits as a max flow through the zones
+    of the group, so no more energy than allowed passes any cell or edge.
+
+    The flow is maximized in the order of priority of the greedy allocation: first to the users from the providers and
+    storages, then to the storages from the providers, then to the p2xs from the providers. Each phase adds to the
+    flow of the previous ones without reducing what they delivered. The transmission loss is applied to each path of
+    the flow by the amount of cells it passes.
+
+    prioritize: providers -> users -> storages -> p2x
+
+    Args:
+        problem(GroupProblem): the energy state of the group, with its cell network
+
+    Returns:
+        GroupResult: the energy state of the group after the allocation and the load of each cell and edge with a
+            capacity limit
+    """
+
+    cellNetwork = problem.cellNetwork
+    zoneOf = cellNetwork.zoneOf
+
+    # every zone is a node, zones of cells with a capacity limit are split into an entry and an exit node
+    source, sink = 0, 1
+    entryNodes = list(range(2, 2 + cellNetwork.zoneCount))
+    exitNodes = list(entryNodes)
+    for k, cell in enumerate(cellNetwork.cellCapacities):
+        exitNodes[zoneOf[cell]] = 2 + cellNetwork.zoneCount + k
+    network = FlowNetwork(2 + cellNetwork.zoneCount + len(cellNetwork.cellCapacities))
+
+    # the limits are given per 15 minutes
+    scale = problem.timestepScale
+    cellArcs = {}
+    for cell, capacity in cellNetwork.cellCapacities.items():
+        cellArcs[cell] = network.addArc(entryNodes[zoneOf[cell]], exitNodes[zoneOf[cell]], capacity*scale, 0)
+
+    # edge arcs map to the cell they leave and the cell they enter
+    edgeArcs = []
+    crossingOf = {}
+    for a, b, capacity in cellNetwork.edges:
+        forward = network.addArc(exitNodes[zoneOf[a]], entryNodes[zoneOf[b]], capacity*scale, 0)
+        backward = network.addArc(exitNodes[zoneOf[b]], entryNodes[zoneOf[a]], capacity*scale, 0)
+        crossingOf[forward], crossingOf[backward] = (a, b), (b, a)
+        edgeArcs.append((forward, backward))
+
+    # supplier arcs and consumer arcs map to (kind, index) of their component
+    supplierOf = {}
+    consumerOf = {}
+
+    def addConsumerArc(kind: str, index: int, cell: tuple, neededKWH: float, efficiencies: list) -> None:
+        # the flow is counted in sent kWh, at least the kWh that arrive via the most efficient supplier are needed
+        bestEfficiency = max(efficiencies, default=1.0)
+        if neededKWH > 0 and bestEfficiency > 0:
+            consumerOf[network.addArc(exitNodes[zoneOf[cell]], sink, neededKWH/bestEfficiency, 0)] = (kind, index)
+
+    for i, (cell, kwh) in enumerate(zip(cellNetwork.providerCells, problem.providerKWHs)):
+        supplierOf[network.addArc(source, entryNodes[zoneOf[cell]], max(kwh, 0), 0)] = ('provider', i)
+    stockArcs = []
+    for k, (cell, kwh) in enumerate(zip(cellNetwork.storageCells, problem.storageKWHs)):
+        stockArcs.append(network.addArc(source, entryNodes[zoneOf[cell]], max(kwh, 0), 0))
+        supplierOf[stockArcs[-1]] = ('storage', k)
+
+    consumerCells = {'user': cellNetwork.userCells, 'storage': cellNetwork.storageCells, 'p2x': cellNetwork.p2xCells}
+    supplierCells = {'provider': cellNetwork.providerCells, 'storage': cellNetwork.storageCells}
+
+    # the path crosses each zone on the shortest way from the cell it entered at to the cell it leaves at
+    distances = cellNetwork.distances
+
+    def getEntryCell(path: list) -> tuple:
+        for arc in reversed(path):
+            if arc in crossingOf:
+                return crossingOf[arc][1]
+        kind, i = supplierOf[path[0]]
+        return supplierCells[kind][i]
+
+    def getZoneDistance(path: list, arc: int) -> float:
+        # within a zone the flow is split so that the nearest way out is taken first
+        if arc in crossingOf:
+            return distances[getEntryCell(path)][crossingOf[arc][0]]
+        if arc in consumerOf:
+            kind, j = consumerOf[arc]
+            return distances[getEntryCell(path)][consumerCells[kind][j]]
+        return 0
+
+    def isSelfPath(path: list) -> bool:
+        # a storage whose stock flows into its own charge keeps that stock
+        return supplierOf[path[0]][0] == 'storage' and consumerOf[path[-1]] == supplierOf[path[0]]
+
+    def cancelSelfPaths() -> None:
+        # the flow of a phase may reroute the stock a storage gave away into its own charge, which would take up
+        # capacity of the cells and edges on the way for nothing. the charge a storage has room for shrinks with the
+        # stock it keeps, so the storages are frozen at what they take now
+        flows = list(network.flows)
+        for amount, path in network.decompose(source, sink, getZoneDistance):
+            if isSelfPath(path):
+                for arc in path:
+                    flows[arc] -= amount
+                    flows[arc ^ 1] += amount
+        network.flows[:] = flows
+        for arc in stockArcs:
+            network.capacities[arc] = network.flows[arc]
+        for arc, (kind, k) in consumerOf.items():
+            if kind == 'storage':
+                network.capacities[arc] = network.flows[arc]
+
+    # step 1, users get to consume from providers and storages
+    for j, cell in enumerate(cellNetwork.userCells):
+        addConsumerArc(
+            'user', j, cell, problem.userDesiredKWHs[j] - problem.userKWHs[j],
+            problem.userProviderEfficiencies[j] + problem.userStorageEfficiencies[j]
+        )
+    network.maxFlow(source, sink)
+
+    # step 2, storages can now consume from providers, what they gave away can't be given again
+    for k, (cell, arc) in enumerate(zip(cellNetwork.storageCells, stockArcs)):
+        network.capacities[arc] = network.flows[arc]
+        addConsumerArc(
+            'storage', k, cell, problem.storageMaxKWHs[k] - (problem.storageKWHs[k] - network.flows[arc]),
+            problem.storageProviderEfficiencies[k]
+        )
+    network.maxFlow(source, sink)
+    cancelSelfPaths()
+
+    # step three, p2x's can now consume from the provider's leftovers
+    for j, cell in enumerate(cellNetwork.p2xCells):
+        addConsumerArc(
+            'p2x', j, cell, problem.p2xDesiredKWHs[j] - problem.p2xKWHs[j], problem.p2xProviderEfficiencies[j]
+        )
+    network.maxFlow(source, sink)
+
+    # energy that flows both ways over an edge cancels out
+    flow = network.flows
+    for forward, backward in edgeArcs:
+        cancelled = min(flow[forward], flow[backward])
+        for arc in (forward, backward):
+            flow[arc] -= cancelled
+            flow[arc ^ 1] += cancelled
+
+    # apply each path of the flow, only the efficiency share of the sent kWh arrives
+    providerKWHs = list(problem.providerKWHs)
+    storageKWHs = list(problem.storageKWHs)
+    consumerKWHs = {'user': list(problem.userKWHs), 'storage': storageKWHs, 'p2x': list(problem.p2xKWHs)}
+    consumerIDs = {'user': problem.userIDs, 'storage': problem.storageIDs, 'p2x': problem.p2xIDs}
+    supplierKWHs = {'provider': providerKWHs, 'storage': storageKWHs}
+    supplierIDs = {'provider': problem.providerIDs, 'storage': problem.storageIDs}
+
+    dependencyMap = {}
+    for kind in ('user', 'storage', 'p2x'):
+        for componentID in consumerIDs[kind]:
+            dependencyMap[componentID] = []
+
+    # the loads only count the paths that are applied
+    loads = {}
+    for amount, path in network.decompose(source, sink, getZoneDistance):
+        if isSelfPath(path):
+            continue
+        for arc in path:
+            loads[arc] = loads.get(arc, 0.0) + amount
+
+        supplierKind, i = supplierOf[path[0]]
+        consumerKind, j = consumerOf[path[-1]]
+
+        cell = supplierCells[supplierKind][i]
+        distance = 0
+        for arc in path:
+            if arc in crossingOf:
+                tail, head = crossingOf[arc]
+                distance += distances[cell][tail] + 1
+                cell = head
+        distance += distances[cell][consumerCells[consumerKind][j]]
+
+        supplierKWHs[supplierKind][i] = max(supplierKWHs[supplierKind][i] - amount, 0)
+        consumerKWHs[consumerKind][j] += amount*problem.energyLossPerCell**distance
+
+        dependencies = dependencyMap[consumerIDs[consumerKind][j]]
+        if supplierIDs[supplierKind][i] not in dependencies:
+            dependencies.append(supplierIDs[supplierKind][i])
+
+    # the charge arcs only leave room for what the storages can take
+    for k, maxKWH in enumerate(problem.storageMaxKWHs):
+        assert storageKWHs[k] <= maxKWH + flowTolerance, (problem.storageIDs[k], storageKWHs[k])
+
+    edgeLoads = {}
+    for (a, b, capacity), (forward, backward) in zip(cellNetwork.edges, edgeArcs):
+        if capacity != inf:
+            edgeLoads[(a, b) if a < b else (b, a)] = abs(loads.get(forward, 0.0) - loads.get(backward, 0.0))
+    cellLoads = {cell: loads.get(arc, 0.0) for cell, arc in cellArcs.items()}
+
+    return GroupResult(
+        problem.label, providerKWHs, consumerKWHs['user'], storageKWHs, consumerKWHs['p2x'], dependencyMap,
+        edgeLoads=edgeLoads, cellLoads=cellLoads
+    )
+
+
+def allocateGroup(problem: GroupProblem) -> GroupResult:
+    """Allocates the energy of a cell group with the strategy of the problem, or with allocateCapacitated() if the
+    group has capacity limits."""
+
+    if problem.cellNetwork is not None:
+        return allocateCapacitated(problem)
+    return dispatchStrategies[problem.strategy](problem)
+
+
+# allocation function of each dispatch strategy, see Grid.strategy
+dispatchStrategies = {
+    'greedy': allocateGreedy,
+    'minCostFlow': allocateMinCostFlow
+}
@@ -0,0 +1,233 @@
+from grid import Grid
+from scenario import ScenarioTimeline
+from store import PROVIDER, USER, P2X
+import concurrent.futures
+import numpy as np
+
+
+class NoiseModel:
+    """Multiplicative gaussian noise that perturbs the kWh series of a scenario. Every value of the timeline is scaled
+    by 1 + sigma * N(0, 1) independently, negative values are clipped to 0.
+
+    Args:
+        providerSigma(float): standard deviation of the noise on the providerKWHs
+        userSigma(float): standard deviation of the noise on the userKWHs
+        p2xSigma(float): standard deviation of the noise on the p2xKWHs
+    """
+
+    def __init__(self, providerSigma: float = 0.1, userSigma: float = 0.1, p2xSigma: float = 0.1):
+        self.sigmas = {PROVIDER: providerSigma, USER: userSigma, P2X: p2xSigma}
+
+
+    def apply(self, timeline: ScenarioTimeline, rng: np.random.Generator) -> ScenarioTimeline:
+        """Returns a perturbed copy of the given timeline.
+
+        Args:
+            timeline(ScenarioTimeline): the timeline to perturb
+            rng(np.random.Generator): random number generator to draw the noise from
+
+        Returns:
+            ScenarioTimeline: the perturbed timeline
+        """
+
+        sigmas = np.array([self.sigmas.get(typeCode, 0) for typeCode in timeline.typeCodes])
+        factors = 1 + sigmas*rng.standard_normal(timeline.values.shape)
+        values = np.maximum(timeline.values*factors, 0)
+        return ScenarioTimeline(timeline.ids, timeline.typeCodes, values, timeline.slotMinutes, timeline.resolution,
+                                timeline.lag, timeline.start)
+
+
+class EnsembleStatistics:
+    """Aggregates the equilibrium trajectories of an ensemble run by run, so that only the statistics are kept in
+    memory and not the trajectories themselves.
+
+    Mean, standard deviation, minimum and maximum are exact. Percentiles are estimated from a histogram of each
+    timestep with bins of 100/binCount percent.
+
+    Args:
+        steps(int): amount of timesteps of each trajectory
+        binCount(int): amount of histogram bins between 0% and 100% equilibrium
+    """
+
+    def __init__(self, steps: int, binCount: int = 100):
+        self.steps = steps
+        self.binCount = binCount
+        self.runs = 0
+        self.mean = np.zeros(steps)
+        self.m2 = np.zeros(steps)
+        self.min = np.full(steps, np.inf)
+        self.max = np.full(steps, -np.inf)
+        self.histogram = np.zeros((steps, binCount), dtype=np.int32)
+
+
+    def add(self, trajectory: np.ndarray) -> None:
+        """Adds the equilibrium trajectory of one run.
+
+        Args:
+            trajectory(np.ndarray): equilibrium of each timestep in percent
+        """
+
+        self.runs += 1
+
+        # welford's online algorithm
+        delta = trajectory - self.mean
+        self.mean += delta/self.runs
+        self.m2 += delta*(trajectory - self.mean)
+
+        np.minimum(self.min, trajectory, out=self.min)
+        np.maximum(self.max, trajectory, out=self.max)
+
+        bins = np.clip((trajectory/100*self.binCount).astype(np.int64), 0, self.binCount-1)
+        self.histogram[np.arange(self.steps), bins] += 1
+
+
+    def getStd(self) -> np.ndarray:
+        """Returns the standard deviation of the equilibrium of each timestep."""
+
+        if self.runs < 2:
+            return np.zeros(self.steps)
+        return np.sqrt(self.m2/(self.runs-1))
+
+
+    def getPercentile(self, q: float) -> np.ndarray:
+        """Returns the estimated q-th percentile of the equilibrium of each timestep.
+
+        Args:
+            q(float): percentile between 0 and 100
+
+        Returns:
+            np.ndarray: the percentile of each timestep
+        """
+
+        cumulative = np.cumsum(self.histogram, axis=1)
+        rank = q/100*self.runs
+
+        # first bin whose cumulative count reaches the rank, then interpolate linearly within that bin
+        bins = np.minimum((cumulative < rank).sum(axis=1), self.binCount-1)
+        steps = np.arange(self.steps)
+        below = np.where(bins > 0, cumulative[steps, bins-1], 0)
+        inBin = self.histogram[steps, bins]
+        fraction = np.where(inBin > 0, (rank - below)/np.maximum(inBin, 1), 0)
+
+        percentiles = (bins + np.clip(fraction, 0, 1))*100/self.binCount
+        return np.clip(percentiles, self.min, self.max)
+
+
+# template grid and base scenario of the current process, see initializeWorker()
+template = None
+baseTimeline = None
+
+
+def initializeWorker(gridData: dict, gridSize: int, arrayBacked: bool, baseScenario) -> None:
+    """Builds the template grid of a process once. The cell groups, the distance index and the supplier orders of the
+    template are shared by all runs of the process.
+
+    Args:
+        gridData(dict): the grid setting
+        gridSize(int): size of the square grid
+        arrayBacked(bool): whether the component state is kept in numpy arrays
+        baseScenario: the scenario that the noise model is applied to, if any
+    """
+
+    global template, baseTimeline
+
+    # without a scenario, the components of the template keep their initial state
+    template = Grid(gridData=gridData, scenario={}, gridSize=gridSize, arrayBacked=arrayBacked)
+
+    # warm the topology indices
+    template._getGroupPlans()
+
+    if baseScenario is not None and not isinstance(baseScenario, ScenarioTimeline):
+        baseScenario = ScenarioTimeline.fromDict(baseScenario)
+    baseTimeline = baseScenario
+
+
+def runMember(scenario, noiseModel: NoiseModel, seed: np.random.SeedSequence, steps: int) -> np.ndarray:
+    """Simulates one member of the ensemble on a copy of the template grid.
+
+    Args:
+        scenario: scenario of the member, None to perturb the base scenario with the noise model
+        noiseModel(NoiseModel): the noise model
+        seed(np.random.SeedSequence): seed of the noise of this member
+        steps(int): amount of timesteps to simulate
+
+    Returns:
+        np.ndarray: equilibrium of each timestep in percent
+    """
+
+    # the topology and the supplier orders are shared with the template instead of being copied
+    grid = template.fork()
+
+    if scenario is None:
+        scenario = noiseModel.apply(baseTimeline, np.random.default_rng(seed))
+    grid.setScenario(scenario)
+    grid.updateScenario()
+
+    trajectory = np.empty(steps)
+    for i in range(steps):
+        grid.step()
+        trajectory[i] = grid.currentEquilibrium
+
+    return trajectory
+
+
+def runEnsemble(gridData: dict, scenarios: list = None, baseScenario: dict = None, noiseModel: NoiseModel = None,
+                runs: int = 100, steps: int = 96, gridSize: int = 20, arrayBacked: bool = False, workers: int = 1,
+                seed: int = 0, binCount: int = 100) -> EnsembleStatistics:
+    """Runs one grid against many scenario variants and aggregates the equilibrium of each timestep. The variants
+    are either given explicitly or drawn by applying a noise model to a base scenario.
+
+    Args:
+        gridData(dict): the grid setting
+        scenarios(list): scenario variants, each a scenario setting or a ScenarioTimeline
+        baseScenario(dict): scenario to perturb if no variants are given
+        noiseModel(NoiseModel): noise model to perturb the base scenario with
+        runs(int): amount of perturbed variants to run if no variants are given
+        steps(int): amount of timesteps to simulate per variant
+        gridSize(int): size of the square grid
+        arrayBacked(bool): whether the component state is kept in numpy arrays
+        workers(int): amount of processes to run the variants on
+        seed(int): seed of the noise model
+        binCount(int): amount of histogram bins used to estimate percentiles
+
+    Returns:
+        EnsembleStatistics: the aggregated equilibrium statistics
+
+    Raises:
+        ValueError: if neither scenario variants nor a base scenario are given
+    """
+
+    if scenarios is None and baseScenario is None:
+        raise ValueError('runEnsemble needs either scenario variants or a base scenario to perturb')
+
+    if scenarios is not None:
+        members = [(scenario, None) for scenario in scenarios]
+    else:
+        if noiseModel is None:
+            noiseModel = NoiseModel()
+        members = [(None, s) for s in np.random.SeedSequence(seed).spawn(runs)]
+
+    statistics = EnsembleStatistics(steps, binCount)
+    initArgs = (gridData, gridSize, arrayBacked, baseScenario)
+
+    if workers <= 1:
+        initializeWorker(*initArgs)
+        for scenario, memberSeed in members:
+            statistics.add(runMember(scenario, noiseModel, memberSeed, steps))
+        return statistics
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=initializeWorker,
+                                                initargs=initArgs) as executor:
+        # keep a bounded amount of runs in flight, so that finished trajectories are aggregated and dropped right away
+        pending = set()
+        for scenario, memberSeed in members:
+            if len(pending) >= 2*workers:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    statistics.add(future.result())
+            pending.add(executor.submit(runMember, scenario, noiseModel, memberSeed, steps))
+
+        for future in concurrent.futures.as_completed(pending):
+            statistics.add(future.result())
+
+    return statistics
@@ -1,9 +1,22 @@
-import datetime, sys
+from store import ComponentStore, StoredAttribute, PROVIDER, USER, STORAGE, P2X
+from scenario import ScenarioTimeline
+from dispatch import CellNetwork, GroupProblem, GroupResult, allocateGroup, dispatchStrategies
+from records import StepRecord
+import concurrent.futures, copy, datetime, math, mmap, pickle, struct, sys
 from math import inf
+import numpy as np
 
 
 class GridComponent:
+    # the energy state is kept in a ComponentStore if the grid is array backed
+    currentKWH = StoredAttribute()
+    desiredKWH = StoredAttribute()
+
     def __init__(self, id_: str, coordX: int, coordY: int):
+        # store that holds the energy state of this component and the row of this component in it
+        self.store: ComponentStore = None
+        self.storeIndex: int = -1
+
         self.id_: str = id_
         self.coordX: int = coordX
         self.coordY: int = coordY
@@ -12,6 +25,9 @@ class GridComponent:
 
 
 class Provider(GridComponent):
+    typeCode = PROVIDER
+    maxKWH = StoredAttribute()
+
     def __init__(self, id_: str, coordX: int, coordY: int, maxKWH: int):
         super().__init__(id_, coordX, coordY)
         self.maxKWH = maxKWH
@@ -33,6 +49,8 @@ class Provider(GridComponent):
 
 
 class User(GridComponent):
+    typeCode = USER
+
     def __init__(self, id_: str, coordX: int, coordY: int):
         super().__init__(id_, coordX, coordY)
 
@@ -53,6 +71,9 @@ class User(GridComponent):
 
 
 class Storage(GridComponent):
+    typeCode = STORAGE
+    maxKWH = StoredAttribute()
+
     def __init__(self, id_: str, coordX: int, coordY: int, maxKWH: int):
         super().__init__(id_, coordX, coordY)
         self.maxKWH = maxKWH
@@ -74,6 +95,8 @@ class Storage(GridComponent):
 
 
 class P2x(GridComponent):
+    typeCode = P2X
+
     def __init__(self, id_: str, coordX: int, coordY: int):
         super().__init__(id_, coordX, coordY)
 
@@ -93,58 +116,268 @@ class P2x(GridComponent):
         return percent
         
 
+# magic number and buffer alignment of the checkpoint format, see Grid.saveCheckpoint()
+checkpointMagic = b'EMSCHKP1'
+bufferAlignment = 64
+
+# scenario values are kWh per referenceMinutes, timesteps of other lengths scale them
+referenceMinutes = 15
+
+# lengths (in minutes) of the timesteps that the adaptive mode chooses from, the divisors of an hour
+adaptiveTimesteps = (60, 30, 20, 15, 12, 10, 6, 5, 4, 3, 2, 1)
+
+
+class ShortestPathTree:
+    """The shortest paths from one cell to every active cell of its group. Every edge between two neighbouring active
+    cells has a weight of 1, so the tree is built by a single breadth first search.
+
+    Args:
+        root(tuple): position of the root cell
+        parents(dict): maps each cell of the group to the previous cell on its path from the root, None for the root
+        distances(dict): maps each cell of the group to the amount of cells between it and the root
+    """
+
+    def __init__(self, root: tuple, parents: dict, distances: dict):
+        self.root = root
+        self.parents = parents
+        self.distances = distances
+
+
+    def getRoute(self, x: int, y: int) -> list:
+        """Returns the cells of the path from the root to the given cell, both included, an empty list if the cell is
+        not reachable."""
+
+        if (x, y) not in self.parents:
+            return []
+
+        route = [(x, y)]
+        while self.parents[route[-1]] is not None:
+            route.append(self.parents[route[-1]])
+        route.reverse()
+        return route
+
+
+class GroupPlan:
+    """The components of one cell group and, for each consumer, the indices of the suppliers of the group sorted by
+    the share of their energy that arrives at the consumer, together with that share. Suppliers with the same
+    efficiency keep their list order.
+
+    Args:
+        label(int): label of the cell group
+        providers(list): providers of the group
+        users(list): users of the group
+        storages(list): storages of the group
+        p2xs(list): p2xs of the group
+        userProviderOrders(list): order of the providers for each user
+        userStorageOrders(list): order of the storages for each user
+        storageProviderOrders(list): order of the providers for each storage
+        p2xProviderOrders(list): order of the providers for each p2x
+        userProviderEfficiencies(list): efficiency of each ordered provider for each user
+        userStorageEfficiencies(list): efficiency of each ordered storage for each user
+        storageProviderEfficiencies(list): efficiency of each ordered provider for each storage
+        p2xProviderEfficiencies(list): efficiency of each ordered provider for each p2x
+        userProviderDistances(list): distance of each ordered provider for each user
+        userStorageDistances(list): distance of each ordered storage for each user
+        storageProviderDistances(list): distance of each ordered provider for each storage
+        p2xProviderDistances(list): distance of each ordered provider for each p2x
+    """
+
+    def __init__(self, label: int, providers: list, users: list, storages: list, p2xs: list, userProviderOrders: list, 
+                 userStorageOrders: list, storageProviderOrders: list, p2xProviderOrders: list,
+                 userProviderEfficiencies: list, userStorageEfficiencies: list, storageProviderEfficiencies: list,
+                 p2xProviderEfficiencies: list, userProviderDistances: list, userStorageDistances: list,
+                 storageProviderDistances: list, p2xProviderDistances: list):
+        self.label = label
+        self.providers = providers
+        self.users = users
+        self.storages = storages
+        self.p2xs = p2xs
+        self.userProviderOrders = userProviderOrders
+        self.userStorageOrders = userStorageOrders
+        self.storageProviderOrders = storageProviderOrders
+        self.p2xProviderOrders = p2xProviderOrders
+        self.userProviderEfficiencies = userProviderEfficiencies
+        self.userStorageEfficiencies = userStorageEfficiencies
+        self.storageProviderEfficiencies = storageProviderEfficiencies
+        self.p2xProviderEfficiencies = p2xProviderEfficiencies
+        self.userProviderDistances = userProviderDistances
+        self.userStorageDistances = userStorageDistances
+        self.storageProviderDistances = storageProviderDistances
+        self.p2xProviderDistances = p2xProviderDistances
+
+        # store rows of the providers, users, storages and p2xs if the grid is array backed
+        self.rows = None
+
+        # state of the dispatch strategy after the last allocation of the group, see GroupResult
+        self.warmStart = None
+
+        # cell graph of the group if any of its cells or edges has a capacity limit, see dispatch.CellNetwork
+        self.cellNetwork = None
+
+        # inputs and result of the last allocation of the group in the fast forward mode, see Grid._getGroupInputs()
+        self.lastInputs = None
+        self.lastResult = None
+
+
 class Grid:
-    def __init__(self, gridData: dict, scenario: dict, gridSize: int = 20, timestepSize: float = 1):
-        # mock simulation data of each component in the grid
+    def __init__(self, gridData: dict, scenario: dict, gridSize: int = 20, timestepSize: float = 1,
+                 arrayBacked: bool = False, workers: int = 1, strategy: str = 'greedy', timestepMinutes: int = 15,
+                 adaptiveTimestep: bool = False, fastForward: bool = False):
+        # simulation minutes that elapse with each timestep, from 1 to 60. in the adaptive mode, each step picks its
+        # own length out of adaptiveTimesteps, see _chooseTimestep(), and timestepMinutes holds the length of the most
+        # recent step
+        if timestepMinutes != int(timestepMinutes) or not 1 <= timestepMinutes <= 60:
+            print('the timestep has to be a whole amount of minutes from 1 to 60')
+            sys.exit(1)
+        self.timestepMinutes = int(timestepMinutes)
+        self.adaptiveTimestep = adaptiveTimestep
+
+        # the adaptive mode takes the longest step over which the scenario values change by at most this share
+        self.adaptiveTolerance = 0.05
+
+        # in the fast forward mode, groups whose inputs did not change since the previous step reuse the result of
+        # its allocation instead of being allocated again, e.g. overnight when providers are idle and storages full.
+        # the allocation only depends on its inputs, so the results are identical to allocating every step
+        self.fastForward = fastForward
+
+        # amount of groups that reused their previous result in the most recent step
+        self.reusedGroupCount = 0
+
+        # mock simulation data of each component in the grid. the scenario is compiled into a timeline of hourly
+        # values once, so that each timestep only needs a single vectorized interpolation
         self.scenario = scenario
+        if isinstance(scenario, ScenarioTimeline):
+            self.timeline = scenario
+        else:
+            self.timeline = ScenarioTimeline.fromDict(scenario, self._getSlotMinutes())
 
         # size (in px) of each cell in the grid
         self.cellSize = 100
         # size of the square grid
         self.gridSize = gridSize
 
-        # TODO the farther two cells are apart from each other, the less energy will arive on consumption since energy
-        # is lost on the way in the form of heat
-        self.energyLossPerCell = 0.98
+        # the farther two cells are apart from each other, the less energy will arive on consumption since energy is
+        # lost on the way in the form of heat. only this share of the energy is left after passing a cell, see
+        # energyLossPerCell
+        self._energyLossPerCell = 0.98
+
+        # largest amount of kWh that may pass a cell or an edge between two neighbouring cells per 15 minutes. cells
+        # and edges without a limit conduct any amount. edges are keyed by their two cell positions in sorted order
+        self.cellCapacities = {}
+        self.edgeCapacities = {}
+
+        # kWh that passed each cell and edge with a capacity limit in the most recent step
+        self.cellLoads = {}
+        self.edgeLoads = {}
+
+        # if more than one worker is given, the allocation of the cell groups is distributed across a process pool
+        # that is created on the first step
+        self.workers = workers
+        self._executor = None
+
+        # name of the function that allocates the energy of each cell group, see dispatch.dispatchStrategies
+        if strategy not in dispatchStrategies:
+            print('unknown dispatch strategy ' + strategy)
+            sys.exit(1)
+        self.strategy = strategy
 
-        # timestepSize in seconds corresponds to 15 elapsed simulation minutes
+        # timestepSize in seconds corresponds to one timestep of elapsed simulation time
         self.timestepSize = timestepSize 
 
-        # keep track of simulation day time
+        # keep track of simulation day time, scenarios with a calendar start the simulation at their first day
         self.simulationDayTime = datetime.datetime(year=1, month=1, day=2, hour=0)
+        if self.timeline.start is not None:
+            self.simulationDayTime = self.timeline.start
         
         # if the equilibrium (in percent) is 100, it means that every component in the grid is perfectly satisfied.
         # we keep accumulate the equilibrium with each step and average it over the number of steps in order to get
         # a metric that tells us how good the energy distribution works at all times
         self.accumulatedEquilibrium = 0
 
-        # keep track of how many steps have been made. use this counter to compute a running average equilibrium
+        # equilibrium (in percent) of the most recent step
+        self.currentEquilibrium = 0
+
+        # keep track of how many steps have been made. the running average equilibrium weighs each step by its
+        # length relative to referenceMinutes, so runs with different timesteps are comparable
         self.stepCounter = 1
+        self.accumulatedWeight = 1
 
         # cells that are set to true exist, the other ones don't
         self.cells = []
         for i in range(self.gridSize):
             self.cells.append([False for j in range(self.gridSize)])
 
-        # keep track of which cells are occupied by a component in order to prevent overlaps
-        self.occupiedCells = []
-        for i in range(self.gridSize):
-            self.occupiedCells.append([False for j in range(self.gridSize)])
-
         # grid components
         self.providers = []
         self.users = []
         self.storages = []
         self.p2xs = []
 
+        # spatial hash of the grid components. also keeps track of which cells are occupied by a component in order
+        # to prevent overlaps
+        self.componentsByPosition = {}
+        self.componentsById = {}
+
+        # if the grid is array backed, the energy state of all components is kept in one ComponentStore and the
+        # component objects are views on it. this allows satisfaction, equilibrium and scenario updates to be
+        # computed for all components at once
+        self.store = None
+
+        # maps the components to their columns in the scenario timeline, see _bindScenario()
+        self._scenarioBinding = {}
+
         # distribution keeps track of which component ID consumes which other component ID
         self.dependencyMap = {}
 
+        # the cell topology is derived from self.cells and cached. whenever self.cells changes, the topology version
+        # has to be bumped through invalidateTopology() so that the cached indices get rebuilt on the next lookup
+        self.topologyVersion = 0
+        self._indexedTopologyVersion = -1
+
+        # group label of each cell (-1 for inactive cells) and the member cells of each group label
+        self._cellLabels = []
+        self._cellGroups = {}
+        self._nextGroupLabel = 0
+
+        # maps the position of each component cell to the distances from that cell to every other component cell
+        self._distanceIndex = {}
+
+        # maps the position of each supplier cell to the ShortestPathTree rooted in it, see getShortestPathTree()
+        self._routeIndex = {}
+
+        # maps the label of each cell group to its GroupPlan, see _getGroupPlans()
+        self._groupPlans = {}
+
+        # whether the cells and their indices are shared with forks of the grid, see fork()
+        self._topologyShared = False
+
+        # records the wall time of each phase of a step while set, see profiling.Profiler
+        self.profiler = None
+
         # verify and load gridData
         for key in gridData:
             if key == 'cellSize':
                 self.cellSize = gridData[key]
 
+            if key == 'energyLossPerCell':
+                self.energyLossPerCell = gridData[key]
+
+            if key == 'cellCapacities':
+                for capacity in gridData[key]:
+                    for x in range(round(capacity['from'][0]), round(capacity['to'][0])+1):
+                        for y in range(round(capacity['from'][1]), round(capacity['to'][1])+1):
+                            self.cellCapacities[(x, y)] = capacity['maxKWH']
+
+            if key == 'edgeCapacities':
+                for capacity in gridData[key]:
+                    (ax, ay), (bx, by) = capacity['cells']
+                    if abs(ax - bx) + abs(ay - by) != 1:
+                        print('could not add edge capacity as cells (%d, %d) and (%d, %d) are no neighbours' % (
+                            ax, ay, bx, by))
+                        continue
+
+                    self.edgeCapacities[tuple(sorted(((ax, ay), (bx, by))))] = capacity['maxKWH']
+
             if key == 'gridCells':
                 gcs = gridData[key]
                 for gc in gcs:
@@ -163,11 +396,11 @@ class Grid:
                         print('could not add provider "%s" as cell coordinates overflow the grid' % p['displayName'])
                         continue
 
-                    if self.occupiedCells[p['coordX']][p['coordY']]:
+                    if self.getComponentAt(p['coordX'], p['coordY']) is not None:
                         print('could not add provider "%s" as cell was already occupied' % p['displayName'])
                         continue
 
-                    self.providers.append(
+                    self._insertComponent(
                         Provider(
                             id_=p['id'],
                             coordX=p['coordX'],
@@ -175,7 +408,6 @@ class Grid:
                             maxKWH=p['maxKWH']
                         )
                     )
-                    self.occupiedCells[p['coordX']][p['coordY']] = True
 
             if key == 'users':
                 us = gridData[key]
@@ -184,18 +416,17 @@ class Grid:
                         print('could not add user "%s" as cell coordinates overflow the grid' % u['displayName'])
                         continue
 
-                    if self.occupiedCells[u['coordX']][u['coordY']]:
+                    if self.getComponentAt(u['coordX'], u['coordY']) is not None:
                         print('could not add user %s as cell was already occupied' % u['displayName'])
                         continue
 
-                    self.users.append(
+                    self._insertComponent(
                         User(
                             id_=u['id'],
                             coordX=u['coordX'],
                             coordY=u['coordY']
                         )
                     )
-                    self.occupiedCells[u['coordX']][u['coordY']] = True
 
             if key == 'storages':
                 ss = gridData[key]
@@ -204,11 +435,11 @@ class Grid:
                         print('could not add storage "%s" as cell coordinates overflow the grid' % s['displayName'])
                         continue
 
-                    if self.occupiedCells[s['coordX']][s['coordY']]:    
+                    if self.getComponentAt(s['coordX'], s['coordY']) is not None:
                         print('could not add storage %s as cell was already occupied' % s['displayName'])
                         continue
 
-                    self.storages.append(
+                    self._insertComponent(
                         Storage(
                             id_=s['id'],
                             coordX=s['coordX'],
@@ -216,7 +447,6 @@ class Grid:
                             maxKWH=s['maxKWH']
                         )
                     )
-                    self.occupiedCells[s['coordX']][s['coordY']] = True
                         
             if key == 'p2xs':
                 ps = gridData[key]
@@ -225,24 +455,45 @@ class Grid:
                         print('could not add p2x "%s" as cell coordinates overflow the grid' % p['displayName'])
                         continue
 
-                    if self.occupiedCells[p['coordX']][p['coordY']]:    
+                    if self.getComponentAt(p['coordX'], p['coordY']) is not None:
                         print('could not add p2x %s as cell was already occupied' % p['displayName'])
                         continue
 
-                    self.p2xs.append(
+                    self._insertComponent(
                         P2x(
                             id_=p['id'],
                             coordX=p['coordX'],
                             coordY=p['coordY']
                         )
                     )
-                    self.occupiedCells[p['coordX']][p['coordY']] = True
+
+        if arrayBacked:
+            self._rebuildStore()
 
         # load scenario data
+        self._bindScenario()
         self.updateScenario()
 
         self.resetDepencencyMap()
 
+    @property
+    def energyLossPerCell(self) -> float:
+        """Share of the energy that is left after passing a cell, greater than 0 and at most 1."""
+
+        return self._energyLossPerCell
+
+
+    @energyLossPerCell.setter
+    def energyLossPerCell(self, value: float) -> None:
+        if not 0 < value <= 1:
+            print('the energy loss per cell has to be greater than 0 and at most 1')
+            sys.exit(1)
+        self._energyLossPerCell = value
+
+        # the supplier efficiencies of the plans are computed from it
+        self._groupPlans = {}
+
+
     def resetDepencencyMap(self) -> None:
         """Resets the dependency map (purple lines in the simulation) of each component."""
 
@@ -257,153 +508,630 @@ class Grid:
             self.dependencyMap[p.id_] = []
 
 
+    def _rebuildStore(self) -> None:
+        """Moves the energy state of all components into a new ComponentStore."""
+
+        if self.store is not None:
+            self.store.detach()
+
+        self.store = ComponentStore(self.providers + self.users + self.storages + self.p2xs)
+        self.store.updateActive(self.cells)
+
+
+    def addComponent(self, component: GridComponent) -> bool:
+        """Adds a component to the grid and to the spatial hash.
+
+        Args:
+            component(GridComponent): the provider, user, storage or p2x to add
+
+        Returns:
+            bool: True if the component was added, False if its cell or ID was already taken
+        """
+
+        if not self._insertComponent(component):
+            return False
+
+        if self.store is not None:
+            self._rebuildStore()
+        self._bindScenario()
+
+        return True
+
+
+    def _insertComponent(self, component: GridComponent) -> bool:
+        """Same as addComponent(), but without updating the store and the scenario binding."""
+
+        if component.coordX >= self.gridSize or component.coordY >= self.gridSize:
+            print('could not add component "%s" as cell coordinates overflow the grid' % component.id_)
+            return False
+
+        if (component.coordX, component.coordY) in self.componentsByPosition:
+            print('could not add component "%s" as cell was already occupied' % component.id_)
+            return False
+
+        if component.id_ in self.componentsById:
+            print('could not add component "%s" as the ID is already taken' % component.id_)
+            return False
+
+        if isinstance(component, Provider):
+            self.providers.append(component)
+        elif isinstance(component, User):
+            self.users.append(component)
+        elif isinstance(component, Storage):
+            self.storages.append(component)
+        elif isinstance(component, P2x):
+            self.p2xs.append(component)
+
+        self.componentsByPosition[(component.coordX, component.coordY)] = component
+        self.componentsById[component.id_] = component
+        self.dependencyMap[component.id_] = []
+
+        # the distance index only covers component cells, so it has to be rebuilt
+        self._distanceIndex = {}
+        self._groupPlans = {}
+
+        return True
+
+
+    def removeComponent(self, componentID: str) -> None:
+        """Removes the component with the given ID from the grid and from the spatial hash."""
+
+        component = self.componentsById.pop(componentID)
+        del self.componentsByPosition[(component.coordX, component.coordY)]
+
+        for components in (self.providers, self.users, self.storages, self.p2xs):
+            if component in components:
+                components.remove(component)
+
+        self.dependencyMap.pop(componentID, None)
+        for dependencies in self.dependencyMap.values():
+            if componentID in dependencies:
+                dependencies.remove(componentID)
+
+        self._distanceIndex = {}
+        self._groupPlans = {}
+
+        if self.store is not None:
+            self._rebuildStore()
+        self._bindScenario()
+
+
+    def getComponentAt(self, x: int, y: int) -> GridComponent:
+        """Returns the component that resides on the given cell, None if the cell is not occupied."""
+        return self.componentsByPosition.get((x, y))
+
+
+    def getComponent(self, componentID: str) -> GridComponent:
+        """Returns the component with the given ID, None if there is no such component."""
+        return self.componentsById.get(componentID)
+
+
     def updateScenario(self) -> None:
         """Updates currentKWH/desiredKWHs for each component in the grid."""
 
-        # interpolate between two scenario timestamps for each timestepsize that fits between those two timestamps 
-        currentMinute = self.simulationDayTime.strftime("%M")
-        currentHour = self.simulationDayTime.strftime("%H:00")
-        previousHour = (self.simulationDayTime - datetime.timedelta(hours=1)).strftime("%H:00")
-
-        factorB = (int(currentMinute)/60)
-        factorA = (1-factorB)
-
-        if currentHour in self.scenario:
-            for key in self.scenario[currentHour]:
-                if key == 'providerKWHs':
-                    for componentID in self.scenario[currentHour][key]:
-                        for p in self.providers:
-                            if p.id_ == componentID:
-                                # the scenario dictates how much kWh the provider generates at which timestep.
-                                # there is, however, a maximum that a provider can generate, so if the current kWh
-                                # is not consumed, then the provider won't be able to generate more even if the
-                                # scenario would have dictated that to be the case. in the real world, such a 
-                                # generator would be put to stop
-                                energyState = factorA*self.scenario[previousHour][key][componentID] + \
-                                              factorB*self.scenario[currentHour][key][componentID]
-                                
-                                if p.currentKWH + energyState < p.maxKWH:
-                                    p.currentKWH += energyState
-                                else:
-                                    p.currentKWH = p.maxKWH
-
-                if key == 'userKWHs':
-                    for componentID in self.scenario[currentHour][key]:
-                        for u in self.users:
-                            if u.id_ == componentID:
-                                # the users energy needs are strictly timespecific
-                                energyState = factorA*self.scenario[previousHour][key][componentID] + \
-                                              factorB*self.scenario[currentHour][key][componentID]
-
-                                u.desiredKWH = energyState
-                                u.currentKWH = 0
-
-                if key == 'p2xKWHs':
-                    for componentID in self.scenario[currentHour][key]:
-                        for p in self.p2xs:
-                            if p.id_ == componentID:
-                                # the p2x energy needs are strictly timespecific
-                                energyState = factorA*self.scenario[previousHour][key][componentID] + \
-                                              factorB*self.scenario[currentHour][key][componentID]
-
-                                p.desiredKWH = energyState
-                                p.currentKWH = 0
+        # interpolate between two scenario timestamps for each timestepsize that fits between those two timestamps.
+        # the interpolation weights of each timestep are precomputed by the timeline
+        minute = self.timeline.getMinute(self.simulationDayTime)
+        if self.adaptiveTimestep:
+            # the mean of the values over the step, so that long steps generate and need as much energy as the short
+            # steps they replace
+            energyStates = self._getMeanValues(minute, self.timestepMinutes)
+        else:
+            energyStates = self.timeline.getValues(minute)
+
+        # the scenario values are kWh per referenceMinutes, so longer timesteps generate and need more energy
+        if self.timestepMinutes != referenceMinutes:
+            energyStates *= self.timestepMinutes/referenceMinutes
+
+        if self.store is not None:
+            rows, columns = self._scenarioBinding[PROVIDER]
+            providerKWHs = energyStates[columns]
+            hasValue = ~np.isnan(providerKWHs)
+            rows = rows[hasValue]
+
+            # see below
+            self.store.currentKWH[rows] = np.minimum(
+                self.store.currentKWH[rows] + providerKWHs[hasValue], 
+                self.store.maxKWH[rows]
+            )
+
+            for typeCode in (USER, P2X):
+                rows, columns = self._scenarioBinding[typeCode]
+                kwhs = energyStates[columns]
+                hasValue = ~np.isnan(kwhs)
+                self.store.desiredKWH[rows[hasValue]] = kwhs[hasValue]
+                self.store.currentKWH[rows[hasValue]] = 0
+
+            return
+
+        components, columns = self._scenarioBinding[PROVIDER]
+        for p, energyState in zip(components, energyStates[columns].tolist()):
+            if energyState != energyState:
+                # the scenario has no value for this provider at this time (NaN)
+                continue
+
+            # the scenario dictates how much kWh the provider generates at which timestep.
+            # there is, however, a maximum that a provider can generate, so if the current kWh
+            # is not consumed, then the provider won't be able to generate more even if the
+            # scenario would have dictated that to be the case. in the real world, such a 
+            # generator would be put to stop
+            if p.currentKWH + energyState < p.maxKWH:
+                p.currentKWH += energyState
+            else:
+                p.currentKWH = p.maxKWH
+
+        # the users and p2x energy needs are strictly timespecific
+        for typeCode in (USER, P2X):
+            components, columns = self._scenarioBinding[typeCode]
+            for c, energyState in zip(components, energyStates[columns].tolist()):
+                if energyState != energyState:
+                    continue
+
+                c.desiredKWH = energyState
+                c.currentKWH = 0
+
+
+    def setScenario(self, scenario) -> None:
+        """Replaces the scenario of the grid. Takes effect on the next call of updateScenario(). If the new scenario has
+        a calendar, the simulation time moves to its first day.
+
+        Args:
+            scenario: the scenario setting or an already compiled ScenarioTimeline
+        """
+
+        self.scenario = scenario
+        if isinstance(scenario, ScenarioTimeline):
+            self.timeline = scenario
+        else:
+            self.timeline = ScenarioTimeline.fromDict(scenario, self._getSlotMinutes())
+        if self.timeline.start is not None:
+            self.simulationDayTime = self.timeline.start
+        self._bindScenario()
+
+
+    def _getSlotMinutes(self) -> int:
+        """Returns the slot size that the interpolation weights of the timeline are precomputed for, so that every
+        timestep starts at a slot."""
+
+        if self.adaptiveTimestep:
+            return 1
+        return math.gcd(self.timestepMinutes, 60)
+
+
+    def _getBreakpoints(self, minute: int, minutes: int) -> list:
+        """Returns the minutes of the profile between which the values change linearly over the given step: its start,
+        each row of the timeline within it and its end."""
+
+        resolution = self.timeline.resolution
+        firstRow = minute + resolution - (minute - self.timeline.lag) % resolution
+        return [minute] + list(range(firstRow, minute + minutes, resolution)) + [minute + minutes]
+
+
+    def _getMeanValues(self, minute: int, minutes: int) -> np.ndarray:
+        """Returns the mean of each scenario value over the given step, integrated exactly between the breakpoints."""
+
+        points = self._getBreakpoints(minute, minutes)
+        values = [self.timeline.getValues(point) for point in points]
+
+        total = np.zeros_like(values[0])
+        for a, b, valuesA, valuesB in zip(points, points[1:], values, values[1:]):
+            total += (b - a)*(valuesA + valuesB)/2
+        return total/minutes
+
+
+    def _chooseTimestep(self) -> int:
+        """Returns the length of the next timestep in the adaptive mode: the longest of adaptiveTimesteps over which
+        every scenario value deviates from its value at the start by at most adaptiveTolerance of its magnitude. The
+        values are piecewise linear, so they only have to be checked at the rows of the timeline within the step and
+        at its end, and a step never skips a peak. Each step starts at a multiple of its length.
+
+        Returns:
+            int: length of the timestep in minutes
+        """
+
+        minute = self.timeline.getMinute(self.simulationDayTime)
+        values = self.timeline.getValues(minute)
+        magnitudes = np.abs(values)
+
+        for minutes in adaptiveTimesteps[:-1]:
+            # steps start at multiples of their length, so that the steps grow back once the values are flat again
+            if minute % minutes != 0:
+                continue
+
+            # each value is checked on its own, so a single changing component among many flat ones refines the step.
+            # comparisons with NaN are false, so values missing from the scenario are ignored
+            for point in self._getBreakpoints(minute, minutes)[1:]:
+                pointValues = self.timeline.getValues(point)
+                limits = self.adaptiveTolerance*np.maximum(magnitudes, np.abs(pointValues))
+                if np.any(np.abs(pointValues - values) > limits):
+                    break
+            else:
+                return minutes
+
+        return adaptiveTimesteps[-1]
+
+
+    def _bindScenario(self) -> None:
+        """Maps each component to its column in the scenario timeline. For every type code, the binding holds the
+        components (or their store rows if the grid is array backed) and the timeline columns of their values."""
+
+        self._scenarioBinding = {}
+        for typeCode, components in ((PROVIDER, self.providers), (USER, self.users), (P2X, self.p2xs)):
+            boundComponents = []
+            columns = []
+            for c in components:
+                column = self.timeline.columnOf.get((typeCode, c.id_))
+                if column is None:
+                    continue
+                boundComponents.append(c)
+                columns.append(column)
+
+            if self.store is not None:
+                boundComponents = np.array([self.store.indexOf[c.id_] for c in boundComponents], dtype=np.int64)
+            self._scenarioBinding[typeCode] = (boundComponents, np.array(columns, dtype=np.int64))
 
 
     def updateEquilibrium(self) -> None:
         """Updates the running average equilibrium of the grid"""
         compontentCount = 0
         currentAccumulatedEquilibrium = 0
-        for p in self.providers:
-            if self.cells[p.coordX][p.coordY]:
-                currentAccumulatedEquilibrium += p.getSatisfaction()
-                compontentCount += 1
-        
-        for u in self.users:
-            if self.cells[u.coordX][u.coordY]:
-                currentAccumulatedEquilibrium += u.getSatisfaction()
-                compontentCount += 1
-        
-        for s in self.storages:
-            if self.cells[s.coordX][s.coordY]:
-                currentAccumulatedEquilibrium += s.getSatisfaction()
-                compontentCount += 1
 
-        for p in self.p2xs:
-            if self.cells[p.coordX][p.coordY]:
-                currentAccumulatedEquilibrium += p.getSatisfaction()
-                compontentCount += 1
+        if self.store is not None:
+            self._validateTopologyIndex()
+            satisfactions = self.store.getSatisfactions()[self.store.isActive]
+            currentAccumulatedEquilibrium = float(satisfactions.sum())
+            compontentCount = len(satisfactions)
+        else:
+            for p in self.providers:
+                if self.cells[p.coordX][p.coordY]:
+                    currentAccumulatedEquilibrium += p.getSatisfaction()
+                    compontentCount += 1
+
+            for u in self.users:
+                if self.cells[u.coordX][u.coordY]:
+                    currentAccumulatedEquilibrium += u.getSatisfaction()
+                    compontentCount += 1
+
+            for s in self.storages:
+                if self.cells[s.coordX][s.coordY]:
+                    currentAccumulatedEquilibrium += s.getSatisfaction()
+                    compontentCount += 1
+
+            for p in self.p2xs:
+                if self.cells[p.coordX][p.coordY]:
+                    currentAccumulatedEquilibrium += p.getSatisfaction()
+                    compontentCount += 1
 
         currentAverageEquilibrium = currentAccumulatedEquilibrium/compontentCount
-        self.accumulatedEquilibrium += currentAverageEquilibrium
+        self.currentEquilibrium = currentAverageEquilibrium
+        self.accumulatedEquilibrium += currentAverageEquilibrium*(self.timestepMinutes/referenceMinutes)
 
 
     def resetEquilibrium(self) -> None:
         self.accumulatedEquilibrium = 0
         self.stepCounter = 1
+        self.accumulatedWeight = 1
         
 
     def getRunningEquilibrium(self) -> float:
         """Returns the running equilibrium. It is a metric that can explain whether the grid distributes its energy optimally among all of its components."""
-        return self.accumulatedEquilibrium/self.stepCounter
+        return self.accumulatedEquilibrium/self.accumulatedWeight
 
 
-    def getCellSubgroup(self, x: int, y: int, visited=[]) -> list:
-        """Given an active cells position, get all the other surrounding active cells that belong to the same group."""
-        
-        group = []
+    def getEdgeUtilisation(self) -> dict:
+        """Returns the utilisation of each edge with a capacity limit in the most recent step.
 
-        if (x,y) in visited:
-            return group
+        Returns:
+            dict: maps the sorted cell positions of each edge to the share of its capacity that was used, from 0 to 1
+        """
 
-        if self.cells[x][y]:
-            group.append((x, y))
-            # check above
-            if y > 0:
-                for pos in self.getCellSubgroup(x, y-1, visited+group):
-                    group.append(pos)
-
-            # check below
-            if y < len(self.cells[x]):
-                for pos in self.getCellSubgroup(x, y+1, visited+group):
-                    group.append(pos)
-
-            # check left
-            if x > 0:
-                for pos in self.getCellSubgroup(x-1, y, visited+group):
-                    group.append(pos)
-            
-            # check right
-            if x < len(self.cells):
-                for pos in self.getCellSubgroup(x+1, y, visited+group):
-                    group.append(pos)
-
-        return group
+        # the capacities are given per referenceMinutes
+        scale = self.timestepMinutes/referenceMinutes
+        return {
+            edge: (load/(self.edgeCapacities[edge]*scale) if self.edgeCapacities[edge] > 0 else 0.0)
+            for edge, load in self.edgeLoads.items()
+        }
 
 
-    def getCellGroups(self) -> list:
-        """Get all cell groups on the grid."""
-        
-        groups = []
+    def getCellUtilisation(self) -> dict:
+        """Returns the utilisation of each cell with a capacity limit in the most recent step.
+
+        Returns:
+            dict: maps the position of each cell to the share of its capacity that was used, from 0 to 1
+        """
+
+        scale = self.timestepMinutes/referenceMinutes
+        return {
+            cell: (load/(self.cellCapacities[cell]*scale) if self.cellCapacities[cell] > 0 else 0.0)
+            for cell, load in self.cellLoads.items()
+        }
+
+
+    def getRecord(self, step: int) -> StepRecord:
+        """Returns a record of the current state of the grid.
+
+        Args:
+            step(int): number of the timestep to record the state as
+
+        Returns:
+            StepRecord: the recorded state
+        """
+
+        if self.store is not None:
+            ids = self.store.ids
+            currentKWH = self.store.currentKWH.copy()
+            desiredKWH = self.store.desiredKWH.copy()
+            satisfaction = self.store.getSatisfactions()
+        else:
+            components = self.providers + self.users + self.storages + self.p2xs
+            ids = [c.id_ for c in components]
+            currentKWH = np.array([c.currentKWH for c in components], dtype=np.float64)
+            desiredKWH = np.array([c.desiredKWH for c in components], dtype=np.float64)
+            satisfaction = np.array([c.getSatisfaction() for c in components], dtype=np.float64)
+
+        dependencies = []
+        for componentID, supplierIDs in self.dependencyMap.items():
+            for supplierID in supplierIDs:
+                dependencies.append((componentID, supplierID))
+
+        return StepRecord(
+            step, self.simulationDayTime, self.currentEquilibrium, self.getRunningEquilibrium(), ids, currentKWH, 
+            desiredKWH, satisfaction, dependencies, self.getEdgeUtilisation(), self.getCellUtilisation()
+        )
+
+
+    def iterRecords(self, steps: int):
+        """Steps the grid and yields a record of its state after each timestep. Only the current record is kept, so
+        the records can be streamed to a sink of records.py for runs of any length.
+
+        Args:
+            steps(int): amount of timesteps to simulate
+
+        Yields:
+            StepRecord: the state after each timestep
+        """
+
+        for i in range(steps):
+            self.step()
+            yield self.getRecord(i+1)
+
+
+    def invalidateTopology(self) -> None:
+        """Marks the cell topology as changed. Has to be called whenever self.cells is modified. The cells of a forked
+        grid are shared, so forks must only be modified through setCell()."""
+        self.topologyVersion += 1
+
+
+    def _validateTopologyIndex(self) -> None:
+        """Drops the cached topology indices if they were built for an outdated topology version."""
+
+        if self._indexedTopologyVersion == self.topologyVersion:
+            return
+
+        self._labelCellGroups()
+        self._distanceIndex = {}
+        self._routeIndex = {}
+        self._groupPlans = {}
+        self._indexedTopologyVersion = self.topologyVersion
+
+        if self.store is not None:
+            self.store.updateActive(self.cells)
+
+
+    def _breadthFirstSearch(self, x: int, y: int) -> dict:
+        """Returns the distances from the given active cell to every active cell of the same group.
+
+        Every edge between two neighbouring active cells has a weight of 1, so a breadth first search yields the same
+        distances as dijkstra in O(cells).
+        """
+
+        if not self.cells[x][y]:
+            return {}
+
+        distances = {(x, y): 0}
+        frontier = [(x, y)]
+        while frontier:
+            nextFrontier = []
+            for cx, cy in frontier:
+                d = distances[(cx, cy)] + 1
+                for nx, ny in ((cx, cy-1), (cx, cy+1), (cx-1, cy), (cx+1, cy)):
+                    if nx < 0 or ny < 0 or nx >= len(self.cells) or ny >= len(self.cells[nx]):
+                        continue
+                    if self.cells[nx][ny] and (nx, ny) not in distances:
+                        distances[(nx, ny)] = d
+                        nextFrontier.append((nx, ny))
+            frontier = nextFrontier
+
+        return distances
+
+
+    def _labelCellGroups(self) -> None:
+        """Labels every active cell with the label of the group it belongs to in a single iterative flood fill pass.
+        Inactive cells are labelled with -1."""
+
+        self._cellLabels = [[-1 for y in range(len(self.cells[x]))] for x in range(len(self.cells))]
+        self._cellGroups = {}
+        self._nextGroupLabel = 0
+
         for y in range(len(self.cells)):
             for x in range(len(self.cells[y])):
-                subGroup = self.getCellSubgroup(x, y)
-                if subGroup != []:
-                    discardSubGroup = False
-                    for pos in subGroup:
-                        for group in groups:
-                            for visitedPos in group:
-                                if pos == visitedPos:
-                                    discardSubGroup = True
-                                    break
-                            if discardSubGroup:
-                                break
-                        if discardSubGroup:
-                            break
-                    if not discardSubGroup:
-                        groups.append(subGroup)
+                if self.cells[x][y] and self._cellLabels[x][y] == -1:
+                    self._floodFill(x, y, self._nextGroupLabel)
+                    self._nextGroupLabel += 1
 
-        return groups
+
+    def _floodFill(self, x: int, y: int, label: int) -> list:
+        """Assigns the given label to every unlabelled active cell that is connected to the given cell.
+
+        Returns:
+            list: positions of the labelled cells, which form the group of the label
+        """
+
+        members = [(x, y)]
+        self._cellLabels[x][y] = label
+
+        # members doubles as the flood fill queue
+        i = 0
+        while i < len(members):
+            cx, cy = members[i]
+            i += 1
+            for nx, ny in ((cx, cy-1), (cx, cy+1), (cx-1, cy), (cx+1, cy)):
+                if nx < 0 or ny < 0 or nx >= len(self.cells) or ny >= len(self.cells[nx]):
+                    continue
+                if self.cells[nx][ny] and self._cellLabels[nx][ny] == -1:
+                    self._cellLabels[nx][ny] = label
+                    members.append((nx, ny))
+
+        self._cellGroups[label] = members
+        return members
+
+
+    def setCell(self, x: int, y: int, active: bool) -> None:
+        """Adds or removes a cell and updates the cell groups and the distance index incrementally instead of
+        rebuilding them on the next lookup.
+
+        Adding a cell can merge its neighbouring groups, removing a cell can split its group. Either way only the
+        affected groups are relabelled and only their cached distances are dropped.
+
+        Args:
+            x(int): x position in grid space
+            y(int): y position in grid space
+            active(bool): True to add the cell, False to remove it
+        """
+
+        if x < 0 or y < 0 or x >= self.gridSize or y >= self.gridSize:
+            print('could not set cell (%d, %d) as cell overflows the grid' % (x, y))
+            return
+
+        if self.cells[x][y] == active:
+            return
+
+        self._unshareTopology()
+
+        # a stale index gets rebuilt from scratch on the next lookup anyway
+        indexIsValid = self._indexedTopologyVersion == self.topologyVersion
+        self.cells[x][y] = active
+        self.topologyVersion += 1
+        if not indexIsValid:
+            return
+
+        neighbourLabels = set()
+        for nx, ny in ((x, y-1), (x, y+1), (x-1, y), (x+1, y)):
+            if nx < 0 or ny < 0 or nx >= self.gridSize or ny >= self.gridSize:
+                continue
+            if self._cellLabels[nx][ny] != -1:
+                neighbourLabels.add(self._cellLabels[nx][ny])
+
+        if active:
+            if not neighbourLabels:
+                label = self._nextGroupLabel
+                self._nextGroupLabel += 1
+                self._cellGroups[label] = []
+            else:
+                # merge the smaller groups into the largest one
+                label = max(neighbourLabels, key=lambda l: len(self._cellGroups[l]))
+                for mergedLabel in neighbourLabels:
+                    if mergedLabel == label:
+                        continue
+                    for mx, my in self._cellGroups[mergedLabel]:
+                        self._cellLabels[mx][my] = label
+                    self._cellGroups[label].extend(self._cellGroups.pop(mergedLabel))
+
+            self._cellLabels[x][y] = label
+            self._cellGroups[label].append((x, y))
+            affectedLabels = neighbourLabels | {label}
+        else:
+            # relabel the remaining cells of the group, which might have been split into several groups
+            label = self._cellLabels[x][y]
+            members = self._cellGroups.pop(label)
+            for mx, my in members:
+                self._cellLabels[mx][my] = -1
+
+            affectedLabels = {label}
+            for mx, my in members:
+                if not self.cells[mx][my] or self._cellLabels[mx][my] != -1:
+                    continue
+                if label in self._cellGroups:
+                    label = self._nextGroupLabel
+                    self._nextGroupLabel += 1
+                self._floodFill(mx, my, label)
+                affectedLabels.add(label)
+
+        # paths only change within the affected groups, so only their distances have to be recomputed
+        for srcX, srcY in list(self._distanceIndex):
+            if self._cellLabels[srcX][srcY] in affectedLabels or self._cellLabels[srcX][srcY] == -1:
+                del self._distanceIndex[(srcX, srcY)]
+        for srcX, srcY in list(self._routeIndex):
+            if self._cellLabels[srcX][srcY] in affectedLabels or self._cellLabels[srcX][srcY] == -1:
+                del self._routeIndex[(srcX, srcY)]
+
+        for affectedLabel in affectedLabels:
+            self._groupPlans.pop(affectedLabel, None)
+
+        component = self.getComponentAt(x, y)
+        if self.store is not None and component is not None:
+            self.store.isActive[component.storeIndex] = active
+
+        self._indexedTopologyVersion = self.topologyVersion
+
+
+    def _unshareTopology(self) -> None:
+        """Copies the cells and the topology indices that are shared with forks before they get modified in place."""
+
+        if not self._topologyShared:
+            return
+
+        self.cells = [list(column) for column in self.cells]
+        self._cellLabels = [list(column) for column in self._cellLabels]
+        self._cellGroups = {label: list(members) for label, members in self._cellGroups.items()}
+        self._distanceIndex = dict(self._distanceIndex)
+        self._routeIndex = dict(self._routeIndex)
+        self._topologyShared = False
+
+
+    def groupOf(self, x: int, y: int) -> int:
+        """Returns the label of the group that the given cell belongs to.
+
+        Args:
+            x(int): x position in grid space
+            y(int): y position in grid space
+
+        Returns:
+            int: label of the cell group, None if the cell is inactive or out of bounds
+        """
+
+        self._validateTopologyIndex()
+
+        if x < 0 or y < 0 or x >= len(self._cellLabels) or y >= len(self._cellLabels[x]):
+            return None
+
+        label = self._cellLabels[x][y]
+        if label == -1:
+            return None
+        return label
+
+
+    def getGroupMembers(self, label: int) -> list:
+        """Returns the positions of all cells that belong to the group with the given label."""
+
+        self._validateTopologyIndex()
+        return self._cellGroups[label]
+
+
+    def getCellSubgroup(self, x: int, y: int) -> list:
+        """Given an active cells position, get all the other surrounding active cells that belong to the same group."""
+
+        label = self.groupOf(x, y)
+        if label is None:
+            return []
+        return list(self.getGroupMembers(label))
+
+
+    def getCellGroups(self) -> list:
+        """Get all cell groups on the grid."""
+
+        self._validateTopologyIndex()
+        return [list(members) for members in self._cellGroups.values()]
 
 
     def getDirectNeighbours(self, x: int, y: int) -> list:
@@ -420,7 +1148,7 @@ class Grid:
                 neighbours.append((x, y-1))
         
         # check below
-        if y < self.gridSize:
+        if y+1 < self.gridSize:
             if self.cells[x][y+1]:
                 neighbours.append((x, y+1))
 
@@ -430,7 +1158,7 @@ class Grid:
                 neighbours.append((x-1, y))
         
         # check right
-        if x < self.gridSize:
+        if x+1 < self.gridSize:
             if self.cells[x+1][y]:
                 neighbours.append((x+1, y))
 
@@ -450,41 +1178,28 @@ class Grid:
             int: grid distance (not euclidean) between source and target cell
         """
         
-        # dijkstra algortihm
-        # https://en.wikipedia.org/wiki/Dijkstra's_algorithm#Algorithm
-        
-        # step 1
-        unvisited = self.getCellSubgroup(srcX, srcY)
-        
-        # step 2
-        d = {pos: inf for pos in unvisited}
-        d[(srcX, srcY)] = 0
-        currentNode = (srcX, srcY)
-
-        # step 3
-        while True:
-            neighbours = self.getDirectNeighbours(currentNode[0], currentNode[1])
-            for n in neighbours:
-                if n in unvisited:
-                    if d[currentNode] + 1 < d[n]:
-                        d[n] = d[currentNode] + 1
-
-            # step 4
-            unvisited.remove(currentNode)
-
-            # step 5
-            minTentativeDistance = inf
-            minPos = None
-            for pos in unvisited:
-                if d[pos] < minTentativeDistance:
-                    minTentativeDistance = d[pos]
-                    minPos = pos
-
-            if (trgX, trgY) not in unvisited or minTentativeDistance == inf:
-                return d[(trgX, trgY)]
-
-            # step 6
-            currentNode = minPos
+        # distances between component cells are served from an index that is built once per topology version with
+        # one breadth first search per source component cell. all edges between neighbouring cells have a weight of
+        # 1, so breadth first search yields the same distances as dijkstra
+        label = self.groupOf(srcX, srcY)
+        if label is None or label != self.groupOf(trgX, trgY):
+            return inf
+
+        distances = self._distanceIndex.get((srcX, srcY))
+        if distances is None:
+            # only keep the distances to component cells, otherwise the index would grow quadratically with the
+            # amount of active cells
+            distances = {}
+            for pos, d in self._breadthFirstSearch(srcX, srcY).items():
+                if pos in self.componentsByPosition:
+                    distances[pos] = d
+            self._distanceIndex[(srcX, srcY)] = distances
+
+        if (trgX, trgY) in self.componentsByPosition:
+            return distances.get((trgX, trgY), inf)
+
+        # the target is not a component cell, so it is not covered by the index
+        return self._breadthFirstSearch(srcX, srcY).get((trgX, trgY), inf)
         
 
     def sortComponentsByDistanceTo(self, components: list, src: GridComponent) -> list:
@@ -499,9 +1214,12 @@ class Grid:
         """
         
         componentCopy = []
-        subGroup = self.getCellSubgroup(src.coordX, src.coordY)
+        label = self.groupOf(src.coordX, src.coordY)
+        if label is None:
+            return componentCopy
+
         for c in components:
-            if (c.coordX, c.coordY) not in subGroup:
+            if self.groupOf(c.coordX, c.coordY) != label:
                 continue
             componentCopy.append(c)
 
@@ -522,149 +1240,577 @@ class Grid:
             tuple: position tuple (x, y) in grid space
         """
         
-        for p in self.providers:
-            if p.id_ == componentID:
-                return (p.coordX, p.coordY)
+        c = self.componentsById.get(componentID)
+        if c is not None:
+            return (c.coordX, c.coordY)
 
-        for u in self.users:
-            if u.id_ == componentID:
-                return (u.coordX, u.coordY)
+        print('could not find component with id (%s)' % componentID)
+        sys.exit(1)
 
-        for s in self.storages:
-            if s.id_ == componentID:
-                return (s.coordX, s.coordY)
 
-        for p in self.p2xs:
-            if p.id_ == componentID:
-                return (p.coordX, p.coordY)
+    def _partitionComponents(self, labels: set) -> dict:
+        """Partitions the components on active cells by the label of their cell group.
 
-        print('could not find component with id (%s)' % componentID)
-        sys.exit(1)
+        Args:
+            labels(set): labels of the groups to partition
 
+        Returns:
+            dict: maps the given labels to the providers, users, storages and p2xs of their group
+        """
 
-    def step(self) -> None:
-        """Computes the energy flow for the next timestep."""
-        
-        # map each component to the component it is going to consume in the next timestep
-        # prioritize: providers -> users -> storages -> p2x
+        groups = {label: ([], [], [], []) for label in labels}
+        for components, i in ((self.providers, 0), (self.users, 1), (self.storages, 2), (self.p2xs, 3)):
+            for c in components:
+                label = self._cellLabels[c.coordX][c.coordY]
+                if label in groups:
+                    groups[label][i].append(c)
 
-        self.resetDepencencyMap()
-        self.updateScenario()
+        return groups
 
-        # components can only consume components from the same subgroup
-        subGroups = self.getCellGroups()
-        for group in subGroups:
 
-            # step 1, users get to consume from providers, then storages
-            for u in self.users:
-                if (u.coordX, u.coordY) not in group:
-                    continue
+    def _getGroupPlans(self) -> dict:
+        """Returns the plan of each cell group. Plans only depend on the topology and on the positions of the
+        components, so they are cached until either of them changes.
 
-                if not self.cells[u.coordX][u.coordY]:
-                    continue
+        Returns:
+            dict: maps the label of each group to its GroupPlan, None for groups without consumers
+        """
 
-                for p in self.sortComponentsByDistanceTo(self.providers, u):
-                    if (p.coordX, p.coordY) not in group:
-                        continue
+        self._validateTopologyIndex()
 
-                    if not self.cells[p.coordX][p.coordY]:
-                        continue
+        missingLabels = set()
+        for label in self._cellGroups:
+            if label not in self._groupPlans:
+                missingLabels.add(label)
 
-                    # compute energy consumption
-                    if p.currentKWH > 0 and u.currentKWH < u.desiredKWH:
-                        neededKWH = u.desiredKWH - u.currentKWH
-                        p.currentKWH -= neededKWH
-                        if p.currentKWH < 0:
-                            u.currentKWH -= p.currentKWH
-                            p.currentKWH = 0
-                        else:
-                            u.currentKWH += neededKWH
-
-                        # keep track of component dependency
-                        if p.id_ not in self.dependencyMap[u.id_]:
-                            self.dependencyMap[u.id_].append(p.id_)
-
-                for s in self.sortComponentsByDistanceTo(self.storages, u):
-                    if (s.coordX, s.coordY) not in group:
-                        continue
+        if missingLabels:
+            groups = self._partitionComponents(missingLabels)
+            for label in missingLabels:
+                providers, users, storages, p2xs = groups[label]
 
-                    if not self.cells[s.coordX][s.coordY]:
-                        continue
-                
-                    # compute energy consumption
-                    if s.currentKWH > 0 and u.currentKWH < u.desiredKWH:
-                        neededKWH = u.desiredKWH - u.currentKWH
-                        s.currentKWH -= neededKWH
-                        if s.currentKWH < 0:
-                            u.currentKWH -= s.currentKWH
-                            s.currentKWH = 0
-                        else:
-                            u.currentKWH += neededKWH
-
-                        # keep track of component dependency
-                        if s.id_ not in self.dependencyMap[u.id_]:
-                            self.dependencyMap[u.id_].append(s.id_)
-                    
-            # step 2, storages can now consume from providers
-            for s in self.storages:
-                if (s.coordX, s.coordY) not in group:
+                # groups without consumers have nothing to allocate
+                if not users and not storages and not p2xs:
+                    self._groupPlans[label] = None
                     continue
 
-                if not self.cells[s.coordX][s.coordY]:
-                    continue
-            
-                for p in self.sortComponentsByDistanceTo(self.providers, s):
-                    if (p.coordX, p.coordY) not in group:
-                        continue
+                userProviderOrders, userProviderEfficiencies, userProviderDistances = self._getSupplierOrders(
+                    providers, users
+                )
+                userStorageOrders, userStorageEfficiencies, userStorageDistances = self._getSupplierOrders(
+                    storages, users
+                )
+                storageProviderOrders, storageProviderEfficiencies, storageProviderDistances = self._getSupplierOrders(
+                    providers, storages
+                )
+                p2xProviderOrders, p2xProviderEfficiencies, p2xProviderDistances = self._getSupplierOrders(
+                    providers, p2xs
+                )
+
+                self._groupPlans[label] = GroupPlan(
+                    label, providers, users, storages, p2xs,
+                    userProviderOrders=userProviderOrders,
+                    userStorageOrders=userStorageOrders,
+                    storageProviderOrders=storageProviderOrders,
+                    p2xProviderOrders=p2xProviderOrders,
+                    userProviderEfficiencies=userProviderEfficiencies,
+                    userStorageEfficiencies=userStorageEfficiencies,
+                    storageProviderEfficiencies=storageProviderEfficiencies,
+                    p2xProviderEfficiencies=p2xProviderEfficiencies,
+                    userProviderDistances=userProviderDistances,
+                    userStorageDistances=userStorageDistances,
+                    storageProviderDistances=storageProviderDistances,
+                    p2xProviderDistances=p2xProviderDistances
+                )
+
+                if self.cellCapacities or self.edgeCapacities:
+                    self._groupPlans[label].cellNetwork = self._buildCellNetwork(
+                        label, providers, users, storages, p2xs
+                    )
 
-                    if not self.cells[p.coordX][p.coordY]:
-                        continue
+                if self.store is not None:
+                    self._groupPlans[label].rows = tuple(
+                        np.array([c.storeIndex for c in components], dtype=np.int64)
+                        for components in (providers, users, storages, p2xs)
+                    )
 
-                    # compute energy consumption
-                    if p.currentKWH > 0 and s.currentKWH < s.maxKWH:
-                        neededKWH = s.maxKWH - s.currentKWH
-                        p.currentKWH -= neededKWH
-                        if p.currentKWH < 0:
-                            s.currentKWH -= p.currentKWH
-                            p.currentKWH = 0
-                        else:
-                            s.currentKWH += neededKWH
-
-                        # keep track of component dependency
-                        if p.id_ not in self.dependencyMap[s.id_]:
-                            self.dependencyMap[s.id_].append(p.id_)
-
-            # step three, p2x's can now consume from the provider's leftovers
-            for p2x in self.p2xs:
-                if (p2x.coordX, p2x.coordY) not in group:
-                    continue
+        return {label: self._groupPlans[label] for label in self._cellGroups}
 
-                if not self.cells[p2x.coordX][p2x.coordY]:
-                    continue
-                
-                for p in self.sortComponentsByDistanceTo(self.providers, p2x):
-                    if (p.coordX, p.coordY) not in group:
-                        continue
 
-                    if not self.cells[p.coordX][p.coordY]:
+    def _buildCellNetwork(self, label: int, providers: list, users: list, storages: list, p2xs: list) -> CellNetwork:
+        """Returns the cell graph of the given cell group contracted into zones, see dispatch.CellNetwork. The max flow
+        only runs on the zones and the edges between them, so it stays fast on large groups with few limits.
+
+        Returns:
+            CellNetwork: the contracted cell graph, None if the group has no capacity limits
+        """
+
+        members = self._cellGroups[label]
+        cellCapacities = {position: self.cellCapacities[position] for position in members
+                          if position in self.cellCapacities}
+        if not cellCapacities and not any(self._cellLabels[a[0]][a[1]] == label for a, b in self.edgeCapacities):
+            return None
+
+        def neighboursOf(x: int, y: int):
+            for n in ((x, y-1), (x, y+1), (x-1, y), (x+1, y)):
+                if 0 <= n[0] < self.gridSize and 0 <= n[1] < self.gridSize and self._cellLabels[n[0]][n[1]] == label:
+                    yield n
+
+        def isLimited(a: tuple, b: tuple) -> bool:
+            return a in cellCapacities or b in cellCapacities or ((a, b) if a < b else (b, a)) in self.edgeCapacities
+
+        # flood fill the zones through unlimited edges, cells with a capacity limit stay zones of their own
+        zoneOf = {}
+        zones = []
+        edges = []
+        for position in members:
+            if position in zoneOf:
+                continue
+            zoneOf[position] = len(zones)
+            zones.append([position])
+            if position in cellCapacities:
+                continue
+            for cell in zones[-1]:
+                for n in neighboursOf(*cell):
+                    if n not in zoneOf and not isLimited(cell, n):
+                        zoneOf[n] = zoneOf[position]
+                        zones[-1].append(n)
+
+        # each edge between two zones is found from its left or upper cell
+        ports = set()
+        for x, y in members:
+            for n in ((x+1, y), (x, y+1)):
+                if n in zoneOf and zoneOf[n] != zoneOf[(x, y)]:
+                    edges.append(((x, y), n, self.edgeCapacities.get(((x, y), n), inf)))
+                    ports.update(((x, y), n))
+
+        # distances within the zones from where energy enters them to where it leaves them
+        supplierCells = {(c.coordX, c.coordY) for components in (providers, storages) for c in components}
+        consumerCells = {(c.coordX, c.coordY) for components in (users, storages, p2xs) for c in components}
+        targets = ports | consumerCells
+        distances = {}
+        for start in ports | supplierCells:
+            zone = zoneOf[start]
+            found = distances[start] = {start: 0} if start in targets else {}
+            seen = {start}
+            frontier = [start]
+            d = 0
+            while frontier:
+                d += 1
+                nextFrontier = []
+                for cell in frontier:
+                    for n in neighboursOf(*cell):
+                        if n not in seen and zoneOf[n] == zone:
+                            seen.add(n)
+                            nextFrontier.append(n)
+                            if n in targets:
+                                found[n] = d
+                frontier = nextFrontier
+
+        zoneOf = {position: zoneOf[position] for position in targets | supplierCells}
+        return CellNetwork(
+            len(zones), zoneOf, cellCapacities, edges, distances,
+            providerCells=[(p.coordX, p.coordY) for p in providers],
+            userCells=[(u.coordX, u.coordY) for u in users],
+            storageCells=[(s.coordX, s.coordY) for s in storages],
+            p2xCells=[(p2x.coordX, p2x.coordY) for p2x in p2xs]
+        )
+
+
+    def _getSupplierOrders(self, suppliers: list, consumers: list) -> (list, list, list):
+        """Ranks the given suppliers for each of the given consumers by the share of their energy that arrives at the
+        consumer. Suppliers with the same efficiency are ranked by their distance, so that without loss the nearest
+        suppliers come first as in sortComponentsByDistanceTo(). Suppliers at the same distance keep their order.
+
+        The distances are read from the shortest path tree of each supplier, so each supplier is searched once for
+        all consumers.
+
+        Returns:
+            (list, list, list): the indices of the ranked suppliers, their efficiencies and their distances for each
+                consumer
+        """
+
+        trees = [self.getShortestPathTree(s.coordX, s.coordY) for s in suppliers]
+
+        orders = []
+        efficiencies = []
+        distances = []
+        for c in consumers:
+            supplierDistances = [tree.distances.get((c.coordX, c.coordY), inf) for tree in trees]
+            supplierEfficiencies = [self._getEfficiency(d) for d in supplierDistances]
+            order = sorted(range(len(suppliers)), key=lambda i: (-supplierEfficiencies[i], supplierDistances[i]))
+            orders.append(order)
+            efficiencies.append([supplierEfficiencies[i] for i in order])
+            distances.append([supplierDistances[i] for i in order])
+
+        return orders, efficiencies, distances
+
+
+    def _getEfficiency(self, distance: float) -> float:
+        """Returns the share of energy that is left after passing the given amount of cells."""
+
+        if distance == inf:
+            return 0.0
+        return self.energyLossPerCell**distance
+
+
+    def getShortestPathTree(self, x: int, y: int) -> ShortestPathTree:
+        """Returns the shortest paths from the given active cell to every active cell of its group. The trees are
+        cached per cell until the topology of the group changes.
+
+        Args:
+            x(int): x position of the root cell
+            y(int): y position of the root cell
+
+        Returns:
+            ShortestPathTree: the shortest path tree rooted in the given cell
+        """
+
+        self._validateTopologyIndex()
+
+        tree = self._routeIndex.get((x, y))
+        if tree is not None:
+            return tree
+
+        parents = {}
+        distances = {}
+        if self.cells[x][y]:
+            parents[(x, y)] = None
+            distances[(x, y)] = 0
+
+        frontier = list(parents)
+        while frontier:
+            nextFrontier = []
+            for cx, cy in frontier:
+                d = distances[(cx, cy)] + 1
+                for nx, ny in ((cx, cy-1), (cx, cy+1), (cx-1, cy), (cx+1, cy)):
+                    if nx < 0 or ny < 0 or nx >= len(self.cells) or ny >= len(self.cells[nx]):
                         continue
+                    if self.cells[nx][ny] and (nx, ny) not in distances:
+                        parents[(nx, ny)] = (cx, cy)
+                        distances[(nx, ny)] = d
+                        nextFrontier.append((nx, ny))
+            frontier = nextFrontier
+
+        tree = self._routeIndex[(x, y)] = ShortestPathTree((x, y), parents, distances)
+        return tree
+
+
+    def getRoute(self, srcX: int, srcY: int, trgX: int, trgY: int) -> list:
+        """Returns the cells that energy passes from the given source to the given target cell.
+
+        Args:
+            srcX(int): x position of source cell
+            srcY(int): y position of source cell
+            trgX(int): x position of target cell
+            trgY(int): y position of target cell
+
+        Returns:
+            list: the cells of a shortest path from source to target, both included, empty if they are not connected
+        """
+
+        return self.getShortestPathTree(srcX, srcY).getRoute(trgX, trgY)
+
+
+    def getTransmissionEfficiency(self, srcX: int, srcY: int, trgX: int, trgY: int) -> float:
+        """Returns the share of the energy sent from the given source cell that arrives at the given target cell.
+
+        Args:
+            srcX(int): x position of source cell
+            srcY(int): y position of source cell
+            trgX(int): x position of target cell
+            trgY(int): y position of target cell
+
+        Returns:
+            float: energyLossPerCell to the power of the distance, 0 if the cells are not connected
+        """
+
+        return self._getEfficiency(self.getShortestPathTree(srcX, srcY).distances.get((trgX, trgY), inf))
+
+
+    def _buildGroupProblem(self, plan: GroupPlan) -> GroupProblem:
+        """Takes a plain data snapshot of the energy state of a cell group."""
+
+        problem = GroupProblem(plan.label)
+
+        problem.providerIDs = [p.id_ for p in plan.providers]
+        problem.userIDs = [u.id_ for u in plan.users]
+        problem.storageIDs = [s.id_ for s in plan.storages]
+        problem.p2xIDs = [p2x.id_ for p2x in plan.p2xs]
+
+        problem.userProviderOrders = plan.userProviderOrders
+        problem.userStorageOrders = plan.userStorageOrders
+        problem.storageProviderOrders = plan.storageProviderOrders
+        problem.p2xProviderOrders = plan.p2xProviderOrders
+        problem.userProviderEfficiencies = plan.userProviderEfficiencies
+        problem.userStorageEfficiencies = plan.userStorageEfficiencies
+        problem.storageProviderEfficiencies = plan.storageProviderEfficiencies
+        problem.p2xProviderEfficiencies = plan.p2xProviderEfficiencies
+        problem.userProviderDistances = plan.userProviderDistances
+        problem.userStorageDistances = plan.userStorageDistances
+        problem.storageProviderDistances = plan.storageProviderDistances
+        problem.p2xProviderDistances = plan.p2xProviderDistances
+        problem.warmStart = plan.warmStart
+        problem.strategy = self.strategy
+        problem.cellNetwork = plan.cellNetwork
+        problem.energyLossPerCell = self.energyLossPerCell
+        problem.timestepScale = self.timestepMinutes/referenceMinutes
+
+        if plan.rows is not None:
+            # gather the energy state straight from the store arrays
+            providerRows, userRows, storageRows, p2xRows = plan.rows
+            problem.providerKWHs = self.store.currentKWH[providerRows].tolist()
+            problem.userKWHs = self.store.currentKWH[userRows].tolist()
+            problem.userDesiredKWHs = self.store.desiredKWH[userRows].tolist()
+            problem.storageKWHs = self.store.currentKWH[storageRows].tolist()
+            problem.storageMaxKWHs = self.store.maxKWH[storageRows].tolist()
+            problem.p2xKWHs = self.store.currentKWH[p2xRows].tolist()
+            problem.p2xDesiredKWHs = self.store.desiredKWH[p2xRows].tolist()
+            return problem
+
+        problem.providerKWHs = [p.currentKWH for p in plan.providers]
+        problem.userKWHs = [u.currentKWH for u in plan.users]
+        problem.userDesiredKWHs = [u.desiredKWH for u in plan.users]
+        problem.storageKWHs = [s.currentKWH for s in plan.storages]
+        problem.storageMaxKWHs = [s.maxKWH for s in plan.storages]
+        problem.p2xKWHs = [p2x.currentKWH for p2x in plan.p2xs]
+        problem.p2xDesiredKWHs = [p2x.desiredKWH for p2x in plan.p2xs]
+
+        return problem
+
+
+    def _getGroupInputs(self, problem: GroupProblem) -> tuple:
+        """Returns everything the allocation of a group depends on apart from its plan, which is replaced whenever the
+        topology or the components of the group change."""
+
+        return (
+            problem.providerKWHs, problem.userKWHs, problem.userDesiredKWHs, problem.storageKWHs,
+            problem.storageMaxKWHs, problem.p2xKWHs, problem.p2xDesiredKWHs, problem.strategy,
+            problem.energyLossPerCell, problem.timestepScale
+        )
+
+
+    def _applyGroupResult(self, result: GroupResult, plan: GroupPlan) -> None:
+        """Writes the energy state of a cell group after the allocation back into its components."""
+
+        plan.warmStart = result.warmStart
+        if result.edgeLoads is not None:
+            self.edgeLoads.update(result.edgeLoads)
+            self.cellLoads.update(result.cellLoads)
+
+        if plan.rows is not None:
+            kwhs = (result.providerKWHs, result.userKWHs, result.storageKWHs, result.p2xKWHs)
+            for rows, kwhs in zip(plan.rows, kwhs):
+                self.store.currentKWH[rows] = kwhs
+            self.dependencyMap.update(result.dependencyMap)
+            return
+
+        for components, kwhs in ((plan.providers, result.providerKWHs), (plan.users, result.userKWHs), 
+                                 (plan.storages, result.storageKWHs), (plan.p2xs, result.p2xKWHs)):
+            for c, kwh in zip(components, kwhs):
+                c.currentKWH = kwh
+
+        self.dependencyMap.update(result.dependencyMap)
+
+
+    def close(self) -> None:
+        """Shuts down the process pool of the parallel step mode."""
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
 
-                    # compute energy consumption
-                    if p.currentKWH > 0 and p2x.currentKWH < p2x.desiredKWH:
-                        neededKWH = p2x.desiredKWH - p2x.currentKWH
-                        p.currentKWH -= neededKWH
-                        if p.currentKWH < 0:
-                            p2x.currentKWH -= p.currentKWH
-                            p.currentKWH = 0
-                        else:
-                            p2x.currentKWH += neededKWH
-
-                        # keep track of component dependency
-                        if p.id_ not in self.dependencyMap[p2x.id_]:
-                            self.dependencyMap[p2x.id_].append(p.id_)
-                
-
-        self.simulationDayTime += datetime.timedelta(minutes=15)
+
+    def __getstate__(self) -> dict:
+        # the process pool can't be pickled or copied
+        state = self.__dict__.copy()
+        state['_executor'] = None
+        return state
+
+
+    def fork(self):
+        """Returns a copy of the grid that is stepped independently from it, e.g. to try another strategy or scenario
+        from the same warm state.
+
+        The energy state of the components is copied. The cells, the cell groups, the distance and route indices, the
+        supplier orders and the scenario are shared copy on write: they are only read while stepping, and setCell()
+        copies them before it changes a shared topology.
+
+        Returns:
+            Grid: the forked grid
+        """
+
+        memo = {}
+        for attribute in ('cells', '_cellLabels', '_cellGroups', '_distanceIndex', '_routeIndex', 'timeline',
+                          'scenario', 'cellCapacities', 'edgeCapacities'):
+            memo[id(self.__dict__[attribute])] = self.__dict__[attribute]
+
+        # the plans reference the components of this grid, only their supplier orders are shared
+        for plan in self._groupPlans.values():
+            if plan is None:
+                continue
+            for attribute in ('userProviderOrders', 'userStorageOrders', 'storageProviderOrders', 'p2xProviderOrders', 
+                              'userProviderEfficiencies', 'userStorageEfficiencies', 'storageProviderEfficiencies',
+                              'p2xProviderEfficiencies', 'userProviderDistances', 'userStorageDistances',
+                              'storageProviderDistances', 'p2xProviderDistances', 'rows', 'cellNetwork'):
+                memo[id(plan.__dict__[attribute])] = plan.__dict__[attribute]
+
+        self._topologyShared = True
+        return copy.deepcopy(self, memo)
+
+
+    def saveCheckpoint(self, path: str) -> None:
+        """Writes the complete state of the grid to a binary checkpoint file, including the cached topology indices,
+        so that a restored grid continues exactly where this one stopped without warming up again.
+
+        The grid is pickled with protocol 5 and its numpy arrays are written out of band, aligned behind the pickle, so
+        that they can be restored without copying them, see loadCheckpoint().
+
+        Layout of the file:
+            magic number, 8 bytes
+            length of the pickle and amount of buffers, unsigned 64 bit little endian each
+            offset and length of each buffer, unsigned 64 bit little endian each
+            pickle
+            buffers, each starting at a multiple of bufferAlignment bytes
+
+        Args:
+            path(str): path of the checkpoint file to write
+        """
+
+        buffers = []
+        data = pickle.dumps(self, protocol=5, buffer_callback=buffers.append)
+        rawBuffers = [buffer.raw() for buffer in buffers]
+
+        offset = len(checkpointMagic) + 16 + 16*len(rawBuffers) + len(data)
+        table = []
+        for raw in rawBuffers:
+            offset = -(-offset // bufferAlignment)*bufferAlignment
+            table.append((offset, raw.nbytes))
+            offset += raw.nbytes
+
+        with open(path, 'wb') as file:
+            file.write(checkpointMagic)
+            file.write(struct.pack('<QQ', len(data), len(rawBuffers)))
+            for bufferOffset, length in table:
+                file.write(struct.pack('<QQ', bufferOffset, length))
+            file.write(data)
+            for (bufferOffset, length), raw in zip(table, rawBuffers):
+                file.write(bytes(bufferOffset - file.tell()))
+                file.write(raw)
+
+
+    @classmethod
+    def loadCheckpoint(cls, path: str, zeroCopy: bool = True):
+        """Restores a grid from a checkpoint file, see saveCheckpoint().
+
+        With zeroCopy, the file is mapped copy on write and the numpy arrays of the grid, e.g. the ComponentStore of an
+        array backed grid, are views into the mapping. Their pages are only read when they are used, and stepping the
+        restored grid never writes to the file.
+
+        Args:
+            path(str): path of the checkpoint file
+            zeroCopy(bool): whether to map the arrays instead of reading them
+
+        Returns:
+            Grid: the restored grid
+        """
+
+        with open(path, 'rb') as file:
+            if zeroCopy:
+                content = memoryview(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY))
+            else:
+                content = memoryview(bytearray(file.read()))
+
+        if content[:len(checkpointMagic)] != checkpointMagic:
+            print(path + ' is not a checkpoint file')
+            sys.exit(1)
+
+        offset = len(checkpointMagic)
+        dataLength, bufferCount = struct.unpack_from('<QQ', content, offset)
+        offset += 16
+
+        buffers = []
+        for i in range(bufferCount):
+            bufferOffset, length = struct.unpack_from('<QQ', content, offset)
+            offset += 16
+            buffers.append(content[bufferOffset:bufferOffset+length])
+
+        return pickle.loads(content[offset:offset+dataLength], buffers=buffers)
+
+
+    def step(self) -> None:
+        """Computes the energy flow for the next timestep."""
+        
+        # map each component to the component it is going to consume in the next timestep
+        # prioritize: providers -> users -> storages -> p2x
+
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.begin()
+
+        self.resetDepencencyMap()
+        self.cellLoads = {}
+        self.edgeLoads = {}
+        if self.adaptiveTimestep:
+            self.timestepMinutes = self._chooseTimestep()
+        self.updateScenario()
+        if profiler is not None:
+            profiler.lap('updateScenario')
+
+        # components can only consume components from the same subgroup. groups share no state, so the allocation of
+        # each group can be computed on its own and, if enabled, in parallel
+        plans = self._getGroupPlans()
+        if profiler is not None:
+            profiler.lap('groupPlans')
+
+        # in the fast forward mode, groups with the same inputs as in the previous step reuse their previous result
+        allocatedPlans = [plan for plan in plans.values() if plan is not None]
+        problems = []
+        inputs = {}
+        reusedLabels = set()
+        for plan in allocatedPlans:
+            problem = self._buildGroupProblem(plan)
+            if self.fastForward:
+                inputs[plan.label] = self._getGroupInputs(problem)
+                if plan.lastResult is not None and inputs[plan.label] == plan.lastInputs:
+                    reusedLabels.add(plan.label)
+                    continue
+            problems.append(problem)
+        self.reusedGroupCount = len(reusedLabels)
+        if profiler is not None:
+            profiler.lap('buildProblems')
+
+        # groups with capacity limits are allocated as max flow through their cells, see dispatch.allocateGroup()
+        if self.workers > 1 and len(problems) > 1:
+            if self._executor is None:
+                self._executor = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+            chunkSize = max(1, len(problems) // (4*self.workers))
+            results = self._executor.map(allocateGroup, problems, chunksize=chunkSize)
+        else:
+            results = map(allocateGroup, problems)
+
+        # the results are computed lazily, so the allocation of each group is timed when its result arrives. they are
+        # applied in the order of the groups, so that the dependency map doesn't depend on which groups were reused
+        for plan in allocatedPlans:
+            if plan.label in reusedLabels:
+                result = plan.lastResult
+            else:
+                result = next(results)
+                if profiler is not None:
+                    profiler.lap('allocate')
+                if self.fastForward:
+                    plan.lastInputs = inputs[plan.label]
+                    plan.lastResult = result
+
+            self._applyGroupResult(result, plan)
+            if profiler is not None:
+                profiler.lap('applyResults')
+
+        self.simulationDayTime += datetime.timedelta(minutes=self.timestepMinutes)
         self.stepCounter += 1
+        self.accumulatedWeight += self.timestepMinutes/referenceMinutes
         self.updateEquilibrium()
+
+        if profiler is not None:
+            profiler.lap('updateEquilibrium')
+            profiler.end('step')
     
\ No newline at end of file
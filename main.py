@@ -1,5 +1,6 @@
 from grid import Grid
 from render import render
+from scenario import loadScenario
 import json
 
 
@@ -14,12 +15,7 @@ def main():
         os.exit(1)
 
     filePath = 'assets/settings/scenario.json'
-    try:
-        file = open(filePath, 'r')
-        scenario = json.load(file)
-    except:
-        print('could not open ' + filePath)
-        os.exit(1)
+    scenario = loadScenario(filePath)
 
     # init and render grid
     g = Grid(gridData=gridData, gridSize=20, scenario=scenario)
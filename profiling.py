@@ -0,0 +1,171 @@
+import bisect, json, time
+from math import inf
+
+
+# upper bounds of the histogram buckets in seconds, two per decade from 1 microsecond to 10 seconds
+defaultBuckets = tuple(round(10**(e/2), 12) for e in range(-12, 3))
+
+
+class PhaseStatistics:
+    """Wall time and call count of one phase.
+
+    Args:
+        bucketCount(int): amount of histogram buckets, None to keep no histogram
+    """
+
+    def __init__(self, bucketCount: int = None):
+        self.count = 0
+        self.total = 0.0
+        self.min = inf
+        self.max = 0.0
+        self.last = 0.0
+
+        # amount of calls per bucket, the last bucket holds the calls above the largest bound
+        self.bucketCounts = [0]*(bucketCount + 1) if bucketCount is not None else None
+
+
+class Profiler:
+    """Records the wall time and call count of each phase of a grid step in plain counters, optionally with a
+    histogram per phase. A grid only profiles its steps while its profiler is set, see Grid.profiler, so profiling
+    costs a single None check per phase when it is off.
+
+    Phases are timed as laps: begin() marks the start of a step, each lap() records the time since the previous mark
+    under the given phase and end() records the time of the whole step.
+
+    Args:
+        histograms(bool): whether to keep a histogram of the wall time of each phase
+        buckets(tuple): upper bounds of the histogram buckets in seconds
+    """
+
+    def __init__(self, histograms: bool = False, buckets: tuple = defaultBuckets):
+        self.buckets = list(buckets) if histograms else None
+        self.phases = {}
+        self.mark = 0.0
+        self.start = 0.0
+
+
+    def begin(self) -> None:
+        """Marks the start of a step."""
+
+        self.start = self.mark = time.perf_counter()
+
+
+    def lap(self, phase: str) -> None:
+        """Records the time since the previous mark under the given phase and sets a new mark.
+
+        Args:
+            phase(str): name of the phase
+        """
+
+        now = time.perf_counter()
+        self.record(phase, now - self.mark)
+        self.mark = now
+
+
+    def end(self, phase: str = 'step') -> None:
+        """Records the time since begin() under the given phase.
+
+        Args:
+            phase(str): name of the phase
+        """
+
+        self.record(phase, time.perf_counter() - self.start)
+
+
+    def record(self, phase: str, seconds: float) -> None:
+        """Records one call of the given phase.
+
+        Args:
+            phase(str): name of the phase
+            seconds(float): wall time of the call
+        """
+
+        statistics = self.phases.get(phase)
+        if statistics is None:
+            statistics = self.phases[phase] = PhaseStatistics(len(self.buckets) if self.buckets is not None else None)
+
+        statistics.count += 1
+        statistics.total += seconds
+        statistics.last = seconds
+        if seconds < statistics.min:
+            statistics.min = seconds
+        if seconds > statistics.max:
+            statistics.max = seconds
+        if statistics.bucketCounts is not None:
+            statistics.bucketCounts[bisect.bisect_left(self.buckets, seconds)] += 1
+
+
+    def reset(self) -> None:
+        """Drops all recorded phases."""
+
+        self.phases = {}
+
+
+    def getStatistics(self) -> dict:
+        """Returns the statistics of each phase.
+
+        Returns:
+            dict: maps each phase to its count, total, mean, min, max and last wall time in seconds, and to its
+                histogram as (upper bound, amount of calls) pairs if histograms are kept
+        """
+
+        phases = {}
+        for phase, statistics in self.phases.items():
+            phases[phase] = {
+                'count': statistics.count,
+                'total': statistics.total,
+                'mean': statistics.total/statistics.count,
+                'min': statistics.min,
+                'max': statistics.max,
+                'last': statistics.last
+            }
+            if statistics.bucketCounts is not None:
+                phases[phase]['histogram'] = list(zip(self.buckets + [inf], statistics.bucketCounts))
+        return phases
+
+
+    def toJSON(self) -> str:
+        """Returns the statistics of each phase as JSON, see getStatistics()."""
+
+        phases = self.getStatistics()
+        for statistics in phases.values():
+            if 'histogram' in statistics:
+                statistics['histogram'] = [
+                    [bound if bound != inf else '+Inf', count] for bound, count in statistics['histogram']
+                ]
+        return json.dumps(phases, indent=4)
+
+
+    def toPrometheus(self, prefix: str = 'ems') -> str:
+        """Returns the statistics of each phase in the Prometheus text exposition format. The wall time is exported as
+        histogram if histograms are kept, as summary otherwise.
+
+        Args:
+            prefix(str): prefix of the metric names
+
+        Returns:
+            str: the metrics
+        """
+
+        name = prefix + '_step_phase_seconds'
+        lines = [
+            '# HELP %s Wall time spent in each phase of a grid step.' % name,
+            '# TYPE %s %s' % (name, 'histogram' if self.buckets is not None else 'summary')
+        ]
+
+        for phase, statistics in self.phases.items():
+            if statistics.bucketCounts is not None:
+                cumulative = 0
+                for bound, count in zip(self.buckets + [inf], statistics.bucketCounts):
+                    cumulative += count
+                    bound = '+Inf' if bound == inf else repr(bound)
+                    lines.append('%s_bucket{phase="%s",le="%s"} %d' % (name, phase, bound, cumulative))
+            lines.append('%s_sum{phase="%s"} %r' % (name, phase, statistics.total))
+            lines.append('%s_count{phase="%s"} %d' % (name, phase, statistics.count))
+
+        lines.append('# HELP %s_max_seconds Longest wall time of each phase of a grid step.' % prefix)
+        lines.append('# TYPE %s_max_seconds gauge' % prefix)
+        for phase, statistics in self.phases.items():
+            lines.append('%s_max_seconds{phase="%s"} %r' % (prefix, phase, statistics.max))
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,313 @@
+import abc, csv, datetime, json, os, sys
+import numpy as np
+
+
+# origin of the simulation times stored by the ColumnarSink
+timeOrigin = datetime.datetime(year=1, month=1, day=1)
+
+# component columns of the ColumnarSink, one value per component and step
+componentColumns = ('currentKWH', 'desiredKWH', 'satisfaction')
+
+# step columns of the ColumnarSink and their types, one value per step
+stepColumns = {
+    'step': np.int64,
+    'simulationDayTime': np.int64,
+    'equilibrium': np.float64,
+    'runningEquilibrium': np.float64
+}
+
+
+class StepRecord:
+    """The state of a grid after one timestep, see Grid.iterRecords(). The arrays are copies, so a record stays valid
+    while the grid keeps stepping.
+
+    Args:
+        step(int): number of the timestep, starting at 1
+        simulationDayTime(datetime.datetime): simulation time after the timestep
+        equilibrium(float): equilibrium of the timestep in percent
+        runningEquilibrium(float): running average equilibrium in percent
+        ids(list): ID of each component
+        currentKWH(np.ndarray): currentKWH of each component
+        desiredKWH(np.ndarray): desiredKWH of each component
+        satisfaction(np.ndarray): satisfaction of each component in percent
+        dependencies(list): (consumer ID, supplier ID) of each energy transfer of the timestep
+        edgeUtilisation(dict): share of the capacity used by each edge with a capacity limit, keyed by its cell
+            positions, see Grid.getEdgeUtilisation()
+        cellUtilisation(dict): share of the capacity used by each cell with a capacity limit, keyed by its position
+    """
+
+    def __init__(self, step: int, simulationDayTime: datetime.datetime, equilibrium: float, runningEquilibrium: float,
+                 ids: list, currentKWH: np.ndarray, desiredKWH: np.ndarray, satisfaction: np.ndarray,
+                 dependencies: list, edgeUtilisation: dict = None, cellUtilisation: dict = None):
+        self.step = step
+        self.simulationDayTime = simulationDayTime
+        self.equilibrium = equilibrium
+        self.runningEquilibrium = runningEquilibrium
+        self.ids = ids
+        self.currentKWH = currentKWH
+        self.desiredKWH = desiredKWH
+        self.satisfaction = satisfaction
+        self.dependencies = dependencies
+        self.edgeUtilisation = edgeUtilisation if edgeUtilisation is not None else {}
+        self.cellUtilisation = cellUtilisation if cellUtilisation is not None else {}
+
+
+class RecordSink(abc.ABC):
+    """Base class of the sinks that step records are streamed to. Sinks only append to their output and keep at most
+    one buffer in memory, so that long runs do not grow in memory. Sinks are context managers that close themselves.
+    """
+
+    @abc.abstractmethod
+    def write(self, record: StepRecord) -> None:
+        """Appends the given record to the output."""
+
+
+    @abc.abstractmethod
+    def close(self) -> None:
+        """Flushes the buffered records and closes the output."""
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def checkIDs(self, record: StepRecord) -> None:
+        # the columns of an output are fixed by its first record
+        if record.ids is not self.ids and record.ids != self.ids:
+            print('the components of the grid changed, they can not be appended to ' + self.path)
+            sys.exit(1)
+
+
+class CSVSink(RecordSink):
+    """Writes one row per step with the time, the equilibrium and the currentKWH of each component.
+
+    Args:
+        path(str): path of the CSV file to write
+        bufferSize(int): size of the write buffer in bytes
+    """
+
+    def __init__(self, path: str, bufferSize: int = 1 << 20):
+        self.path = path
+        self.ids = None
+        self.file = open(path, 'w', newline='', buffering=bufferSize)
+        self.writer = csv.writer(self.file)
+
+
+    def write(self, record: StepRecord) -> None:
+        if self.ids is None:
+            self.ids = record.ids
+            self.writer.writerow(['step', 'simulationDayTime', 'equilibrium', 'runningEquilibrium'] + list(self.ids))
+        self.checkIDs(record)
+
+        self.writer.writerow(
+            [
+                record.step,
+                record.simulationDayTime.isoformat(),
+                record.equilibrium,
+                record.runningEquilibrium
+            ] + record.currentKWH.tolist()
+        )
+
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class JSONLSink(RecordSink):
+    """Writes one JSON object per line and step with the time, the equilibrium, the kWh and satisfaction of each
+    component and the dependencies of the step. Grids with capacity limits also get the utilisation of each limited
+    edge and cell as [x, y, x, y, utilisation] and [x, y, utilisation] lists.
+
+    Args:
+        path(str): path of the JSON lines file to write
+        bufferSize(int): size of the write buffer in bytes
+    """
+
+    def __init__(self, path: str, bufferSize: int = 1 << 20):
+        self.path = path
+        self.file = open(path, 'w', buffering=bufferSize)
+
+
+    def write(self, record: StepRecord) -> None:
+        components = {}
+        for componentID, currentKWH, desiredKWH, satisfaction in zip(
+                record.ids, record.currentKWH.tolist(), record.desiredKWH.tolist(), record.satisfaction.tolist()):
+            components[componentID] = {
+                'currentKWH': currentKWH,
+                'desiredKWH': desiredKWH,
+                'satisfaction': satisfaction
+            }
+
+        line = {
+            'step': record.step,
+            'simulationDayTime': record.simulationDayTime.isoformat(),
+            'equilibrium': record.equilibrium,
+            'runningEquilibrium': record.runningEquilibrium,
+            'components': components,
+            'dependencies': record.dependencies
+        }
+        if record.edgeUtilisation:
+            line['edgeUtilisation'] = [[*a, *b, share] for (a, b), share in record.edgeUtilisation.items()]
+        if record.cellUtilisation:
+            line['cellUtilisation'] = [[*cell, share] for cell, share in record.cellUtilisation.items()]
+
+        self.file.write(json.dumps(line))
+        self.file.write('\n')
+
+
+    def close(self) -> None:
+        self.file.close()
+
+
+class ColumnarSink(RecordSink):
+    """Writes each column into its own raw binary file of a directory, see loadColumnar(). The records are buffered
+    in numpy arrays and appended in blocks of bufferSteps steps.
+
+    Layout of the directory:
+        header.json: the component IDs and the type of each column
+        <column>.bin: one value per step for the step columns, one row of values per step for the component columns
+        dependencies.bin: (consumer index, supplier index) of each dependency as int32 pairs
+        dependencyOffsets.bin: amount of dependencies up to and including each step as int64
+
+    Args:
+        path(str): path of the directory to write
+        bufferSteps(int): amount of steps to buffer before writing
+    """
+
+    def __init__(self, path: str, bufferSteps: int = 256):
+        self.path = path
+        self.bufferSteps = bufferSteps
+        self.ids = None
+        self.indexOf = None
+        self.buffered = 0
+        self.dependencyCount = 0
+        os.makedirs(path, exist_ok=True)
+
+        self.files = {}
+        for column in list(stepColumns) + list(componentColumns) + ['dependencies', 'dependencyOffsets']:
+            self.files[column] = open(os.path.join(path, column + '.bin'), 'wb')
+
+        self.stepBuffers = {column: np.empty(bufferSteps, dtype=dtype) for column, dtype in stepColumns.items()}
+        self.componentBuffers = None
+        self.dependencyBuffer = []
+        self.offsetBuffer = np.empty(bufferSteps, dtype=np.int64)
+
+
+    def write(self, record: StepRecord) -> None:
+        if self.ids is None:
+            self.ids = record.ids
+            self.indexOf = {componentID: i for i, componentID in enumerate(self.ids)}
+            self.componentBuffers = {
+                column: np.empty((self.bufferSteps, len(self.ids)), dtype=np.float64) for column in componentColumns
+            }
+            with open(os.path.join(self.path, 'header.json'), 'w') as file:
+                json.dump({
+                    'ids': list(self.ids),
+                    'columns': {column: np.dtype(dtype).name for column, dtype in stepColumns.items()},
+                    'componentColumns': {column: 'float64' for column in componentColumns}
+                }, file)
+        self.checkIDs(record)
+
+        i = self.buffered
+        self.stepBuffers['step'][i] = record.step
+        self.stepBuffers['simulationDayTime'][i] = (record.simulationDayTime - timeOrigin) // datetime.timedelta(seconds=1)
+        self.stepBuffers['equilibrium'][i] = record.equilibrium
+        self.stepBuffers['runningEquilibrium'][i] = record.runningEquilibrium
+        for column in componentColumns:
+            self.componentBuffers[column][i] = getattr(record, column)
+
+        for consumerID, supplierID in record.dependencies:
+            self.dependencyBuffer.append((self.indexOf[consumerID], self.indexOf[supplierID]))
+        self.dependencyCount += len(record.dependencies)
+        self.offsetBuffer[i] = self.dependencyCount
+
+        self.buffered += 1
+        if self.buffered == self.bufferSteps:
+            self.flush()
+
+
+    def flush(self) -> None:
+        """Appends the buffered records to the files."""
+
+        n = self.buffered
+        if n == 0:
+            return
+
+        for column, buffer in self.stepBuffers.items():
+            buffer[:n].tofile(self.files[column])
+        for column, buffer in self.componentBuffers.items():
+            buffer[:n].tofile(self.files[column])
+        np.array(self.dependencyBuffer, dtype=np.int32).reshape(-1, 2).tofile(self.files['dependencies'])
+        self.offsetBuffer[:n].tofile(self.files['dependencyOffsets'])
+
+        self.dependencyBuffer = []
+        self.buffered = 0
+
+
+    def close(self) -> None:
+        self.flush()
+        for file in self.files.values():
+            file.close()
+
+
+def loadColumnar(path: str) -> dict:
+    """Maps the columns written by a ColumnarSink into memory without reading them.
+
+    Args:
+        path(str): path of the directory
+
+    Returns:
+        dict: the component IDs as 'ids' and each column as numpy array, the component columns with the shape
+            (steps, components)
+    """
+
+    with open(os.path.join(path, 'header.json'), 'r') as file:
+        header = json.load(file)
+
+    def mapColumn(name: str, dtype, rowShape: tuple = ()):
+        filePath = os.path.join(path, name + '.bin')
+        rowSize = int(np.prod(rowShape))*np.dtype(dtype).itemsize
+        rows = os.path.getsize(filePath) // rowSize if rowSize > 0 else 0
+        if rows == 0:
+            return np.empty((0,) + rowShape, dtype=dtype)
+        return np.memmap(filePath, dtype=dtype, mode='r', shape=(rows,) + rowShape)
+
+    columns = {'ids': header['ids']}
+    for column, dtype in header['columns'].items():
+        columns[column] = mapColumn(column, dtype)
+    for column, dtype in header['componentColumns'].items():
+        columns[column] = mapColumn(column, dtype, (len(header['ids']),))
+    columns['dependencies'] = mapColumn('dependencies', np.int32, (2,))
+    columns['dependencyOffsets'] = mapColumn('dependencyOffsets', np.int64)
+
+    return columns
+
+
+# record sink of each output format
+sinkClasses = {
+    'csv': CSVSink,
+    'jsonl': JSONLSink,
+    'columnar': ColumnarSink
+}
+
+
+def openSink(path: str, outputFormat: str = 'csv') -> RecordSink:
+    """Opens the sink of the given output format.
+
+    Args:
+        path(str): path of the file or directory to write
+        outputFormat(str): one of the keys of sinkClasses
+
+    Returns:
+        RecordSink: the opened sink
+    """
+
+    if outputFormat not in sinkClasses:
+        print('unknown output format ' + outputFormat)
+        sys.exit(1)
+
+    return sinkClasses[outputFormat](path)
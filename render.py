@@ -1,5 +1,8 @@
 from grid import Grid
-import sys, pygame, time
+from store import PROVIDER, USER, STORAGE, P2X
+from worker import GridSnapshot, SimulationWorker
+import functools, math, sys, pygame
+import numpy as np
 
 
 # window context
@@ -12,6 +15,32 @@ fontSize = 64
 font = pygame.font.SysFont(None, fontSize)
 screen = pygame.display.set_mode(windowSize, pygame.FULLSCREEN)
 
+# frame rate cap of the render loop
+maxFPS = 60
+
+# state of the last rendered frame, None to redraw the whole screen
+lastFrame = None
+
+# most regions a frame is redrawn in one by one, see mergeDirtyRects()
+maxDirtyRects = 8
+
+# smallest zoomed cell size in pixels at which sprites, labels and dependencies are drawn, below it the satisfaction
+# of the components is aggregated into heatmap tiles of at least heatmapTileSize pixels
+detailCellSize = 40
+heatmapTileSize = 8
+
+# components in the window and the snapshot and zoom factor they were culled for, see getVisibleComponents()
+visibleComponents = None
+visibleKey = None
+
+# whether the frame and step time overlay is shown, toggled with F3
+showOverlay = False
+
+# outlines of the visible active cells and the topology version and zoom factor they were drawn for, see
+# getBackground()
+background = None
+backgroundKey = None
+
 # colors
 black = (0, 0, 0)
 white = (255, 255, 255)
@@ -26,54 +55,210 @@ providerSprite = pygame.image.load("assets/images/provider.png")
 userSprite = pygame.image.load("assets/images/user.png")
 storageSprite = pygame.image.load("assets/images/storage.png")
 p2xSprite = pygame.image.load("assets/images/p2x.png")
+sprites = {
+    'provider': providerSprite,
+    'user': userSprite,
+    'storage': storageSprite,
+    'p2x': p2xSprite
+}
+
+# sprite of each component type code
+spriteNames = {
+    PROVIDER: 'provider',
+    USER: 'user',
+    STORAGE: 'storage',
+    P2X: 'p2x'
+}
+
+# bounds of the caches of zoomed fonts, sprites and label texts, the least recently used entries are dropped first
+fontCacheSize = 16
+spriteCacheSize = 64
+labelCacheSize = 4096
+
+
+@functools.lru_cache(maxsize=fontCacheSize)
+def getFont(size: int):
+    """Returns the font of the given size, fonts are only created once per size.
 
+    Args:
+        size(int): font size in pixels
+    """
 
-def getRenderRects(grid: Grid):
-    providerRects = []
-    for p in grid.providers:
-        renderX, renderY = getRenderPosition(grid.cellSize, p.coordX, p.coordY)
-        providerRects.append(
-            (
-                providerSprite.get_rect().move(
-                    (zoomFactor*renderX, zoomFactor*renderY)
-                )
-            )
-        )
+    return pygame.font.SysFont(None, size)
 
-    userRects = []
-    for u in grid.users:
-        renderX, renderY = getRenderPosition(grid.cellSize, u.coordX, u.coordY)
-        userRects.append(
-            (
-                userSprite.get_rect().move(
-                    (zoomFactor*renderX, zoomFactor*renderY)
-                )
-            )
-        )
 
-    storageRects = []
-    for s in grid.storages:
-        renderX, renderY = getRenderPosition(grid.cellSize, s.coordX, s.coordY)
-        storageRects.append(
-            (
-                storageSprite.get_rect().move(
-                    (zoomFactor*renderX, zoomFactor*renderY)
-                )
-            )
-        )
+def getZoomedFont():
+    """Returns the font scaled by the current zoom factor."""
+
+    return getFont(round(zoomFactor*fontSize))
+
+
+@functools.lru_cache(maxsize=spriteCacheSize)
+def getScaledSprite(name: str, width: int, height: int):
+    """Returns the sprite of the given name scaled to the given size, sprites are only scaled once per size.
+
+    Args:
+        name(str): key of the sprite in sprites
+        width(int): width in pixels
+        height(int): height in pixels
+    """
+
+    return pygame.transform.scale(sprites[name], (width, height)).convert_alpha()
+
+
+def getZoomedSprite(name: str):
+    """Returns the sprite of the given name scaled by the current zoom factor.
+
+    Args:
+        name(str): key of the sprite in sprites
+    """
+
+    width, height = getZoomedSpriteSize(sprites[name])
+    return getScaledSprite(name, int(width), int(height))
+
+
+@functools.lru_cache(maxsize=labelCacheSize)
+def getLabel(text: str, color: tuple, size: int):
+    """Returns the rendered text, so that the few distinct satisfaction labels like '42%' are only rendered once per
+    color and font size.
+
+    Args:
+        text(str): the text
+        color(tuple): RGB color of the text
+        size(int): font size in pixels
+    """
+
+    return getFont(size).render(text, True, color)
+
+
+class FrameState:
+    """What a rendered frame shows. Comparing the state of the last frame with the current one tells which regions of
+    the screen have to be redrawn, see getDirtyRects().
+
+    The labels only change with the snapshot, so they are taken over from the previous frame otherwise.
+
+    Args:
+        snapshot(GridSnapshot): the rendered grid state
+        previous(FrameState): state of the last rendered frame, if any
+    """
+
+    def __init__(self, snapshot: GridSnapshot, previous=None):
+        self.snapshot = snapshot
+        self.zoomFactor = zoomFactor
 
-    p2xRects = []
-    for p in grid.p2xs:
-        renderX, renderY = getRenderPosition(grid.cellSize, p.coordX, p.coordY)
-        p2xRects.append(
-            (
-                p2xSprite.get_rect().move(
-                    (zoomFactor*renderX, zoomFactor*renderY)
+        pos = pygame.mouse.get_pos()
+        self.mousePosition = getGridPosition(snapshot.cellSize, pos[0], pos[1])
+
+        if previous is not None and previous.snapshot is snapshot:
+            self.labels = previous.labels
+            return
+
+        # satisfaction text and color of each component on an active cell by position
+        self.labels = {}
+        for typeCode, x, y in getVisibleComponents(snapshot):
+            if snapshot.cells[x][y]:
+                self.labels[(x, y)] = ('%d%%' % snapshot.getSatisfactionAt(x, y), getGridColor(snapshot, x, y))
+
+
+def getDirtyRects(previous: FrameState, current: FrameState):
+    """Returns the regions of the screen that changed between two frames.
+
+    Args:
+        previous(FrameState): state of the last rendered frame
+        current(FrameState): state of the frame to render
+
+    Returns:
+        list: the changed regions as pygame.Rect, None if the whole screen has to be redrawn
+    """
+
+    if previous is None:
+        return None
+
+    # zoom, topology and dependency lines span the whole screen
+    previousSnapshot, snapshot = previous.snapshot, current.snapshot
+    if previous.zoomFactor != current.zoomFactor or previousSnapshot.topologyVersion != snapshot.topologyVersion:
+        return None
+    if previousSnapshot.dependencies != snapshot.dependencies:
+        return None
+
+    # heatmap tiles are redrawn as a whole
+    if previousSnapshot is not snapshot and not isDetailed(snapshot):
+        return None
+
+    dirtyRects = []
+
+    if previous.labels is not current.labels:
+        font = getZoomedFont()
+        for position, label in current.labels.items():
+            previousLabel = previous.labels.get(position)
+            if previousLabel == label:
+                continue
+
+            # the cell border, the sprite and the old and new satisfaction text of the component
+            x, y = position
+            renderX, renderY = getRenderPosition(snapshot.cellSize, x, y)
+            spriteWidth, spriteHeight = getZoomedSpriteSize(providerSprite)
+            rect = pygame.Rect(
+                zoomFactor*renderX, 
+                zoomFactor*renderY, 
+                max(zoomFactor*snapshot.cellSize, spriteWidth), 
+                max(zoomFactor*snapshot.cellSize, spriteHeight)
+            )
+            for text in (label[0], previousLabel[0] if previousLabel is not None else ''):
+                textRect = pygame.Rect(
+                    (zoomFactor*(renderX + snapshot.cellSize/5.7), zoomFactor*(renderY + snapshot.cellSize/1.5)), 
+                    font.size(text)
                 )
+                rect.union_ip(textRect)
+            dirtyRects.append(rect)
+
+    # display time, pause, mouse position and equilibrium text
+    if (previousSnapshot.simulationDayTime != snapshot.simulationDayTime 
+            or previousSnapshot.equilibrium != snapshot.equilibrium or previousSnapshot.paused != snapshot.paused
+            or previous.mousePosition != current.mousePosition):
+        left = min(zoomFactor, 1)*(windowWidth-200)
+        dirtyRects.append(pygame.Rect(left, 0, windowWidth - left, windowHeight))
+
+    return dirtyRects
+
+
+def mergeDirtyRects(rects: list) -> list:
+    """Merges overlapping changed regions, so that no pixel is redrawn twice. Each merged region is redrawn on its
+    own, if there are more than maxDirtyRects of them, they are redrawn as one bounding region instead.
+
+    Args:
+        rects(list): the changed regions as pygame.Rect
+
+    Returns:
+        list: the regions to redraw as pygame.Rect
+    """
+
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        # a merged region may now overlap regions it did not overlap before
+        overlapping = rect.collidelist(merged)
+        while overlapping != -1:
+            rect.union_ip(merged.pop(overlapping))
+            overlapping = rect.collidelist(merged)
+        merged.append(rect)
+
+    if len(merged) > maxDirtyRects:
+        return [merged[0].unionall(merged[1:])]
+    return merged
+
+
+def getRenderRects(snapshot: GridSnapshot):
+    rects = {PROVIDER: [], USER: [], STORAGE: [], P2X: []}
+    for typeCode, x, y in getVisibleComponents(snapshot):
+        renderX, renderY = getRenderPosition(snapshot.cellSize, x, y)
+        rects[typeCode].append(
+            sprites[spriteNames[typeCode]].get_rect().move(
+                (zoomFactor*renderX, zoomFactor*renderY)
             )
         )
     
-    return providerRects, userRects, storageRects, p2xRects
+    return rects[PROVIDER], rects[USER], rects[STORAGE], rects[P2X]
 
 
 def handleWindowClose(event):
@@ -81,6 +266,14 @@ def handleWindowClose(event):
         sys.exit()
 
 
+def handleWindowExpose(event):
+    global lastFrame
+
+    # window content got lost -> redraw the whole screen
+    if event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+        lastFrame = None
+
+
 def handleMouseWheel(event):
     global zoomFactor
 
@@ -94,26 +287,24 @@ def handleMouseWheel(event):
             zoomFactor *= 1.05                
 
 
-def handleMouseClick(grid: Grid, event):
+def handleMouseClick(worker: SimulationWorker, event):
     # mouse click -> add or remove grid cell (not persistent)
     if event.type == pygame.MOUSEBUTTONDOWN:
         # left click -> add cell
         if event.button == 1:
             pos = pygame.mouse.get_pos()
-            x, y = getGridPosition(grid.cellSize, pos[0], pos[1])
-            grid.cells[x][y] = True
-            grid.resetEquilibrium()
+            x, y = getGridPosition(worker.snapshot.cellSize, pos[0], pos[1])
+            worker.send('setCell', x, y, True)
 
         # right click -> remove cell
         if event.button == 3:
             pos = pygame.mouse.get_pos()
-            x, y = getGridPosition(grid.cellSize, pos[0], pos[1])
-            grid.cells[x][y] = False
-            grid.resetEquilibrium()
+            x, y = getGridPosition(worker.snapshot.cellSize, pos[0], pos[1])
+            worker.send('setCell', x, y, False)
 
 
-def handleKeyPress(font, grid: Grid, event):
-    font = pygame.font.SysFont(None, round(zoomFactor*fontSize))
+def handleKeyPress(font, worker: SimulationWorker, event):
+    global showOverlay, lastFrame
 
     if event.type == pygame.KEYDOWN: 
         # key press esc -> quit
@@ -122,41 +313,32 @@ def handleKeyPress(font, grid: Grid, event):
 
         # key press up -> increase tickrate
         if event.key == pygame.K_UP:
-            if grid.timestepSize * 0.9 >= 1**(-8):
-                grid.timestepSize = 1**(-8)
-            else:
-                grid.timestepSize *= 0.9
+            worker.send('increaseTickrate')
 
         # key press down -> decrease tickrate
         if event.key == pygame.K_DOWN:
-            if grid.timestepSize * 1.1 <= 2:
-                grid.timestepSize *= 1.1
-            else:
-                grid.timestepSize = 2
+            worker.send('decreaseTickrate')
 
-        # key press space -> pause
+        # key press space -> pause or resume
         if event.key == pygame.K_SPACE:
-            # render pause text                
-            pauseText = font.render('Paused', True, white)
-            screen.blit(pauseText, (windowWidth-200, 150))
-            pygame.display.flip()
-            
-            paused = True
-            while paused:
-                for event in pygame.event.get():
-                    handleWindowClose(event)
-    
-                    if event.type == pygame.KEYDOWN: 
-                        if event.key == pygame.K_SPACE:
-                            paused = False
+            worker.send('togglePause')
+
+        # key press f3 -> show or hide the frame and step time overlay
+        if event.key == pygame.K_F3:
+            showOverlay = not showOverlay
+
+            # the hidden overlay has to be drawn over
+            if not showOverlay:
+                lastFrame = None
 
 
-def handleEvents(font, grid: Grid):
+def handleEvents(font, worker: SimulationWorker):
     for event in pygame.event.get():
         handleWindowClose(event)
-        handleMouseClick(grid, event)
+        handleWindowExpose(event)
+        handleMouseClick(worker, event)
         handleMouseWheel(event)
-        handleKeyPress(font, grid, event)
+        handleKeyPress(font, worker, event)
 
 
 def getRenderPosition(cellSize: int, x: int, y: int) -> (int, int):
@@ -187,10 +369,11 @@ def getGridPosition(cellSize: int, x: float, y: float) -> (int, int):
     return round((x/(zoomFactor*cellSize) - 0.5)), round((y/(zoomFactor*cellSize) - 0.5))
 
 
-def getGridColor(grid: Grid, x: int, y: int) -> tuple:
+def getGridColor(snapshot: GridSnapshot, x: int, y: int) -> tuple:
     """ Get grid color based on satisfaction of component that resides on the given coordiantes.
 
     Args:
+        snapshot(GridSnapshot): the rendered grid state
         x(float): x position in grid space
         y(float): y position in grid space
     
@@ -198,182 +381,206 @@ def getGridColor(grid: Grid, x: int, y: int) -> tuple:
         tuple: RGB color: green if satisfaction > 2/3, yellow if > 1/3 and red else 
     """
 
-    for p in grid.providers:
-        if p.coordX == x and p.coordY == y:
-            if p.getSatisfaction()/100 > 2/3:    
-                return green
-            if 2/3 > p.getSatisfaction()/100 > 1/3:    
-                return yellow
-            if 1/3 > p.getSatisfaction()/100:    
-                return red
-
-    for u in grid.users:
-        if u.coordX == x and u.coordY == y:
-            if u.getSatisfaction()/100 > 2/3:    
-                return green
-            if 2/3 > u.getSatisfaction()/100 > 1/3:    
-                return yellow
-            if 1/3 > u.getSatisfaction()/100:    
-                return red
-
-    for s in grid.storages:
-        if s.coordX == x and s.coordY == y:
-            if s.getSatisfaction()/100 > 2/3:    
-                return green
-            if 2/3 > s.getSatisfaction()/100 > 1/3:    
-                return yellow
-            if 1/3 > s.getSatisfaction()/100:    
-                return red
-
-    for p in grid.p2xs:
-        if p.coordX == x and p.coordY == y:
-            if p.getSatisfaction()/100 > 2/3:    
-                return green
-            if 2/3 > p.getSatisfaction()/100 > 1/3:    
-                return yellow
-            if 1/3 > p.getSatisfaction()/100:    
-                return red
+    return getSatisfactionColor(snapshot.getSatisfactionAt(x, y))
+
+
+def getSatisfactionColor(satisfaction) -> tuple:
+    """ Get color of the given satisfaction.
+
+    Args:
+        satisfaction(float): satisfaction in percent, None if there is no component
+    
+    Returns:
+        tuple: RGB color: green if satisfaction > 2/3, yellow if > 1/3 and red else 
+    """
+
+    if satisfaction is not None:
+        if satisfaction/100 > 2/3:    
+            return green
+        if 2/3 > satisfaction/100 > 1/3:    
+            return yellow
+        if 1/3 > satisfaction/100:    
+            return red
 
     return gray
 
 
+def getVisibleCells(snapshot: GridSnapshot) -> (int, int):
+    """ Get the amount of columns and rows of cells that fit into the window.
+
+    Args:
+        snapshot(GridSnapshot): the rendered grid state
+
+    Returns:
+        tuple: amount of visible (columns, rows)
+    """
+
+    zoomedCellSize = zoomFactor*snapshot.cellSize
+    columns = min(len(snapshot.cells), int(windowWidth/zoomedCellSize) + 1)
+    rows = min(len(snapshot.cells), int(windowHeight/zoomedCellSize) + 1)
+    return columns, rows
+
+
+def getVisibleComponents(snapshot: GridSnapshot) -> list:
+    """ Get the components that reside on cells within the window, looked up in the spatial index of the snapshot.
+
+    Args:
+        snapshot(GridSnapshot): the rendered grid state
+
+    Returns:
+        list: type code and position (typeCode, x, y) of each visible component
+    """
+
+    global visibleComponents, visibleKey
+
+    if visibleKey is None or visibleKey[0] is not snapshot or visibleKey[1] != zoomFactor:
+        columns, rows = getVisibleCells(snapshot)
+        visibleComponents = snapshot.getComponentsIn(0, 0, columns, rows)
+        visibleKey = (snapshot, zoomFactor)
+
+    return visibleComponents
+
+
+def isDetailed(snapshot: GridSnapshot) -> bool:
+    """ Whether the cells are large enough to draw sprites, labels and dependencies, see detailCellSize."""
+
+    return zoomFactor*snapshot.cellSize >= detailCellSize
+
+
 def getZoomedSpriteSize(sprite):
     width, height = sprite.get_size()
 
     return (zoomFactor*width, zoomFactor*height)
 
 
-def renderGridCells(grid: Grid):
-    for y in range(len(grid.cells)):
-        for x in range(len(grid.cells[y])):
-            if grid.cells[x][y]:
-                renderX, renderY = getRenderPosition(grid.cellSize, x, y)
+def getBackground(snapshot: GridSnapshot):
+    """Returns the black canvas with the gray outline of every visible active cell. The layout only changes with the
+    topology or the zoom, so the background is drawn once and then reused by every frame.
+
+    Args:
+        snapshot(GridSnapshot): the rendered grid state
+
+    Returns:
+        pygame.Surface: the background of the size of the window
+    """
+
+    global background, backgroundKey
+
+    key = (snapshot.topologyVersion, snapshot.cellSize, zoomFactor)
+    if background is not None and backgroundKey == key:
+        return background
+
+    background = pygame.Surface(windowSize).convert()
+    background.fill(black)
+
+    # only the cells that fit into the window
+    zoomedCellSize = zoomFactor*snapshot.cellSize
+    columns, rows = getVisibleCells(snapshot)
+
+    # outlines are not visible on small cells, so the active cells are filled by scaling up a mask of one pixel per cell
+    if not isDetailed(snapshot):
+        mask = np.array([column[:rows] for column in snapshot.cells[:columns]], dtype=bool).reshape(columns, rows)
+        pixels = np.zeros((columns, rows, 3), dtype=np.uint8)
+        pixels[mask] = gray
+        cellSurface = pygame.surfarray.make_surface(pixels)
+        background.blit(
+            pygame.transform.scale(cellSurface, (round(columns*zoomedCellSize), round(rows*zoomedCellSize))), 
+            (0, 0)
+        )
+
+        backgroundKey = key
+        return background
+
+    for y in range(rows):
+        for x in range(columns):
+            if snapshot.cells[x][y]:
+                renderX, renderY = getRenderPosition(snapshot.cellSize, x, y)
                 pygame.draw.rect(
-                    screen, 
-                    getGridColor(grid, x, y), 
+                    background, 
+                    gray, 
                     pygame.Rect(
                         zoomFactor*renderX, 
                         zoomFactor*renderY,
-                        zoomFactor*grid.cellSize, 
-                        zoomFactor*grid.cellSize
+                        zoomedCellSize, 
+                        zoomedCellSize
                     ),
                     round(zoomFactor*borderWidth)
                 )
 
-
-def renderGridComponents(grid: Grid, providerRects, userRects, storageRects, p2xRects, font):
-    font = pygame.font.SysFont(None, round(zoomFactor*fontSize))
-    
-    # render icons
-    for rect in providerRects:
-        screen.blit(
-            pygame.transform.scale(
-                providerSprite, 
-                getZoomedSpriteSize(providerSprite)
-            ), 
-            rect
-        )
-    
-    for rect in userRects:
-        screen.blit(
-            pygame.transform.scale(
-                userSprite, 
-                getZoomedSpriteSize(userSprite)
-            ), 
-            rect
-        )
-    
-    for rect in storageRects:
-        screen.blit(
-            pygame.transform.scale(
-                storageSprite, 
-                getZoomedSpriteSize(storageSprite)
-            ), 
-            rect
-        )
-    
-    for rect in p2xRects:
-        screen.blit(
-            pygame.transform.scale(
-                p2xSprite, 
-                getZoomedSpriteSize(p2xSprite)
-            ), 
-            rect
-        )
-
-    # render satisfaction percent text
-    for p in grid.providers:
-        if grid.cells[p.coordX][p.coordY]:
-            percentText = font.render(
-                '%d%%' % p.getSatisfaction(), 
-                True, 
-                getGridColor(
-                    grid, 
-                    p.coordX, 
-                    p.coordY
-                )
-            )
-            
-            renderX, renderY = getRenderPosition(grid.cellSize, p.coordX, p.coordY)
-            screen.blit(
-                percentText, 
-                (zoomFactor*(renderX + grid.cellSize/5.7), zoomFactor*(renderY + grid.cellSize/1.5))
+    backgroundKey = key
+    return background
+
+
+def renderHeatmap(snapshot: GridSnapshot):
+    # square tiles of at least heatmapTileSize pixels, colored by the mean satisfaction of their components
+    zoomedCellSize = zoomFactor*snapshot.cellSize
+    tileCells = max(1, math.ceil(heatmapTileSize/zoomedCellSize))
+
+    tiles = {}
+    for typeCode, x, y in getVisibleComponents(snapshot):
+        if snapshot.cells[x][y]:
+            tile = tiles.setdefault((x // tileCells, y // tileCells), [0, 0])
+            tile[0] += snapshot.getSatisfactionAt(x, y)
+            tile[1] += 1
+
+    for (tileX, tileY), (satisfactionSum, count) in tiles.items():
+        screen.fill(
+            getSatisfactionColor(satisfactionSum/count),
+            pygame.Rect(
+                tileX*tileCells*zoomedCellSize, 
+                tileY*tileCells*zoomedCellSize, 
+                math.ceil(tileCells*zoomedCellSize), 
+                math.ceil(tileCells*zoomedCellSize)
             )
+        )
 
-    for u in grid.users:
-        if grid.cells[u.coordX][u.coordY]:
-            percentText = font.render(
-                '%d%%' % u.getSatisfaction(), 
-                True, 
-                getGridColor(
-                    grid, 
-                    u.coordX, 
-                    u.coordY)
-                )
 
-            renderX, renderY = getRenderPosition(grid.cellSize, u.coordX, u.coordY)
-            screen.blit(
-                percentText, 
-                (zoomFactor*(renderX + grid.cellSize/5.7), zoomFactor*(renderY + grid.cellSize/1.5))
+def renderGridCells(snapshot: GridSnapshot):
+    # cells without a component are part of the background, only the cells of components are colored by satisfaction
+    for typeCode, x, y in getVisibleComponents(snapshot):
+        if snapshot.cells[x][y]:
+            renderX, renderY = getRenderPosition(snapshot.cellSize, x, y)
+            pygame.draw.rect(
+                screen, 
+                getGridColor(snapshot, x, y), 
+                pygame.Rect(
+                    zoomFactor*renderX, 
+                    zoomFactor*renderY,
+                    zoomFactor*snapshot.cellSize, 
+                    zoomFactor*snapshot.cellSize
+                ),
+                round(zoomFactor*borderWidth)
             )
 
-    for s in grid.storages:
-        if grid.cells[s.coordX][s.coordY]:
-            percentText = font.render(
-                '%d%%' % s.getSatisfaction(), 
-                True, 
-                getGridColor(grid, s.coordX, s.coordY)
-            )
 
-            renderX, renderY = getRenderPosition(grid.cellSize, s.coordX, s.coordY)
-            screen.blit(
-                percentText, 
-                (zoomFactor*(renderX + grid.cellSize/5.7), zoomFactor*(renderY + grid.cellSize/1.5))
-            )
+def renderGridComponents(snapshot: GridSnapshot, providerRects, userRects, storageRects, p2xRects, font):
+    size = round(zoomFactor*fontSize)
+    
+    # render icons
+    for name, rects in (('provider', providerRects), ('user', userRects), ('storage', storageRects), ('p2x', p2xRects)):
+        sprite = getZoomedSprite(name)
+        for rect in rects:
+            screen.blit(sprite, rect)
 
-    for p in grid.p2xs:
-        if grid.cells[p.coordX][p.coordY]:
-            percentText = font.render(
-                '%d%%' % p.getSatisfaction(), 
-                True, 
-                getGridColor(grid, p.coordX, p.coordY)
-            )
+    # render satisfaction percent text
+    for typeCode, x, y in getVisibleComponents(snapshot):
+        if snapshot.cells[x][y]:
+            percentText = getLabel('%d%%' % snapshot.getSatisfactionAt(x, y), getGridColor(snapshot, x, y), size)
 
-            renderX, renderY = getRenderPosition(grid.cellSize, p.coordX, p.coordY)
+            renderX, renderY = getRenderPosition(snapshot.cellSize, x, y)
             screen.blit(
                 percentText, 
-                (zoomFactor*(renderX + grid.cellSize/5.7), zoomFactor*(renderY + grid.cellSize/1.5))
+                (zoomFactor*(renderX + snapshot.cellSize/5.7), zoomFactor*(renderY + snapshot.cellSize/1.5))
             )
 
 
 def renderDisplayTime(font, displayTime):
-    font = pygame.font.SysFont(None, round(zoomFactor*fontSize))
-    timeText = font.render(displayTime.strftime("%H:%M"), True, white)
+    timeText = getLabel(displayTime.strftime("%H:%M"), white, round(zoomFactor*fontSize))
     screen.blit(timeText, (zoomFactor*(windowWidth-200), zoomFactor*(70)))
 
 
 def renderMousePosition(font, cellSize: int):
-    font = pygame.font.SysFont(None, round(zoomFactor*fontSize))
+    font = getZoomedFont()
 
     pos = pygame.mouse.get_pos()
     x, y = getGridPosition(cellSize, pos[0], pos[1])
@@ -382,9 +589,13 @@ def renderMousePosition(font, cellSize: int):
     screen.blit(timeText, (zoomFactor*(windowWidth-200), zoomFactor*(230)))
 
 
-def renderEquilibrium(font, equilibrium: int):
-    font = pygame.font.SysFont(None, round(zoomFactor*fontSize))
+def renderPause(font, paused: bool):
+    if paused:
+        pauseText = getLabel('Paused', white, round(zoomFactor*fontSize))
+        screen.blit(pauseText, (windowWidth-200, 150))
 
+
+def renderEquilibrium(font, equilibrium: int):
     if 2/3 < equilibrium/100:
         color = green
     elif 1/3 < equilibrium/100 < 2/3:
@@ -392,67 +603,129 @@ def renderEquilibrium(font, equilibrium: int):
     else:
         color = red
 
-    timeText = font.render('%d%%' % equilibrium, True, color)
+    timeText = getLabel('%d%%' % equilibrium, color, round(zoomFactor*fontSize))
     screen.blit(timeText, (zoomFactor*(windowWidth-200), zoomFactor*(360)))
 
 
-def renderComponentDependencies(grid):
-    for componentID in grid.dependencyMap:
-        for adjacentComponentID in grid.dependencyMap[componentID]:
-            srcX, srcY = grid.getPositionOf(componentID)
-            trgX, trgY = grid.getPositionOf(adjacentComponentID)
-            srcRenderX, srcRenderY = getRenderPosition(grid.cellSize, srcX+0.5, srcY+0.5) 
-            trgRenderX, trgRenderY = getRenderPosition(grid.cellSize, trgX+0.5, trgY+0.5)
+def renderOverlay(clock, snapshot: GridSnapshot):
+    """Draws the time the last frame took to render and the last step took to simulate in the bottom left corner.
 
-            pygame.draw.line(
-                screen, 
-                purple, 
-                (zoomFactor*srcRenderX, zoomFactor*srcRenderY),
-                (zoomFactor*trgRenderX, zoomFactor*trgRenderY),
-                round(zoomFactor*borderWidth)
-            )
+    Args:
+        clock(pygame.time.Clock): clock of the render loop
+        snapshot(GridSnapshot): the rendered snapshot
+
+    Returns:
+        pygame.Rect: the area the overlay was drawn on
+    """
 
+    overlayFont = getFont(round(fontSize/2))
+    frameText = overlayFont.render('frame %.1f ms' % clock.get_rawtime(), True, white)
+    stepText = overlayFont.render('step %.1f ms' % (snapshot.stepTime*1000), True, white)
 
-def render(grid: Grid):
-    startTime = time.time()
-    
-    # render loop
-    while True:
-        # get grid component rectangles
-        providerRects, userRects, storageRects, p2xRects = getRenderRects(grid)
+    # opaque and of a fixed width, so that the overlay can be redrawn without the frame below it
+    width = max(overlayFont.size('frame 0000.0 ms')[0], frameText.get_width(), stepText.get_width()) + 2*borderWidth
+    height = frameText.get_height() + stepText.get_height() + 2*borderWidth
+    rect = pygame.Rect(0, windowHeight - height, width, height)
+    screen.fill(black, rect)
+    screen.blit(frameText, (borderWidth, rect.top + borderWidth))
+    screen.blit(stepText, (borderWidth, rect.top + borderWidth + frameText.get_height()))
 
-        # handle window events
-        handleEvents(font, grid=grid)
+    return rect
+
+
+def renderComponentDependencies(snapshot: GridSnapshot):
+    columns, rows = getVisibleCells(snapshot)
+
+    for (srcX, srcY), (trgX, trgY) in snapshot.dependencies:
+        # skip lines outside of the window
+        if (srcX >= columns and trgX >= columns) or (srcY >= rows and trgY >= rows):
+            continue
+
+        srcRenderX, srcRenderY = getRenderPosition(snapshot.cellSize, srcX+0.5, srcY+0.5) 
+        trgRenderX, trgRenderY = getRenderPosition(snapshot.cellSize, trgX+0.5, trgY+0.5)
+
+        pygame.draw.line(
+            screen, 
+            purple, 
+            (zoomFactor*srcRenderX, zoomFactor*srcRenderY),
+            (zoomFactor*trgRenderX, zoomFactor*trgRenderY),
+            round(zoomFactor*borderWidth)
+        )
+
+
+def renderFrame(snapshot: GridSnapshot, renderRects):
+    providerRects, userRects, storageRects, p2xRects = renderRects
 
-        # clear canvas with black
-        screen.fill(black)
+    # clear canvas with the cell outlines
+    screen.blit(getBackground(snapshot), (0, 0))
 
+    if isDetailed(snapshot):
         # buffer grid
-        renderGridCells(grid)
+        renderGridCells(snapshot)
 
         # buffer component dependencies
-        renderComponentDependencies(grid)
+        renderComponentDependencies(snapshot)
 
         # buffer grid components
-        renderGridComponents(grid, providerRects, userRects, storageRects, p2xRects, font)
+        renderGridComponents(snapshot, providerRects, userRects, storageRects, p2xRects, font)
+    else:
+        # buffer satisfaction heatmap
+        renderHeatmap(snapshot)
+
+    # buffer display time
+    renderDisplayTime(font, snapshot.simulationDayTime)
 
-        # buffer display time
-        renderDisplayTime(font, grid.simulationDayTime)
+    # buffer pause text
+    renderPause(font, snapshot.paused)
 
-        # buffer mouse grid position
-        renderMousePosition(font, cellSize=grid.cellSize)
+    # buffer mouse grid position
+    renderMousePosition(font, cellSize=snapshot.cellSize)
 
-        # buffer equilibrium text
-        renderEquilibrium(font, grid.getRunningEquilibrium())
+    # buffer equilibrium text
+    renderEquilibrium(font, snapshot.equilibrium)
 
-        # dump buffer (render)
-        pygame.display.flip()
 
-        # execute next grid decision if timestep is over
-        endTime = time.time()
-        if endTime - startTime > grid.timestepSize:
-            grid.step()
-            startTime = time.time()
+def render(grid: Grid):
+    global lastFrame
 
-        # TODO cap render to 30 or 60 fps
+    # the grid is stepped on the simulation thread from now on
+    worker = SimulationWorker(grid)
+    worker.start()
 
+    clock = pygame.time.Clock()
+    lastFrame = None
+    renderRects = None
+    
+    # render loop
+    while True:
+        # handle window events
+        handleEvents(font, worker=worker)
+
+        # only redraw what changed since the last frame
+        snapshot = worker.snapshot
+        frame = FrameState(snapshot, lastFrame)
+        dirtyRects = getDirtyRects(lastFrame, frame)
+        if dirtyRects is None:
+            # get grid component rectangles
+            renderRects = getRenderRects(snapshot)
+
+            renderFrame(snapshot, renderRects)
+            if showOverlay:
+                renderOverlay(clock, snapshot)
+            pygame.display.flip()
+        else:
+            dirtyRects = mergeDirtyRects(dirtyRects)
+            for rect in dirtyRects:
+                screen.set_clip(rect)
+                renderFrame(snapshot, renderRects)
+            screen.set_clip(None)
+
+            # the frame time changes every frame, so the overlay is always redrawn
+            if showOverlay:
+                dirtyRects.append(renderOverlay(clock, snapshot))
+            if dirtyRects:
+                pygame.display.update(dirtyRects)
+        lastFrame = frame
+
+        # cap frame rate, sleeps for the rest of the frame
+        clock.tick(maxFPS)
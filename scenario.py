@@ -0,0 +1,328 @@
+from store import PROVIDER, USER, P2X
+import argparse, datetime, json, struct, sys
+import numpy as np
+
+
+# scenario keys and the type code of the components they apply to
+scenarioKeys = {
+    'providerKWHs': PROVIDER,
+    'userKWHs': USER,
+    'p2xKWHs': P2X
+}
+
+# magic number and header alignment of the binary scenario format, see ScenarioTimeline.create()
+scenarioMagic = b'EMSSCEN1'
+headerAlignment = 64
+
+
+class ScenarioTimeline:
+    """A scenario compiled into a dense matrix of kWh values with one row per time slot of the profile and one column
+    per scenario entry. Slots or entries that are missing in the scenario are NaN.
+
+    The kWh value at a time t is interpolated linearly between the two rows around t - lag. Profiles without a start
+    repeat every period of rows*resolution minutes counted from midnight, like the daily profiles of scenario.json.
+    Profiles with a start are calendars that begin at the given date and repeat after their last row, so a profile of
+    a year of 15 minute slots can drive a year long simulation.
+
+    The values may be a numpy.memmap of a binary scenario file, see load(), in which case a timestep only reads the two
+    rows it interpolates. For profiles of up to a day, the weights of each slot are precomputed, so that looking up
+    the values of a timestep costs a single vectorized interpolation.
+
+    Args:
+        ids(list): component ID of each column
+        typeCodes(list): type code of the components each column applies to
+        values(np.ndarray): kWh values with shape (rows, columns)
+        slotMinutes(int): size of the slots the interpolation weights are precomputed for
+        resolution(int): minutes between two rows
+        lag(int): minutes that the values lag behind the time of their row
+        start(datetime.datetime): time of the first row, None for a profile that repeats from midnight
+    """
+
+    def __init__(self, ids: list, typeCodes: list, values: np.ndarray, slotMinutes: int = 15, resolution: int = 60,
+                 lag: int = 60, start: datetime.datetime = None):
+        # the profile repeats after its last row, so it needs at least one
+        if len(values) == 0:
+            print('could not compile scenario as it has no rows')
+            sys.exit(1)
+
+        self.ids = list(ids)
+        self.typeCodes = np.array(typeCodes, dtype=np.int8)
+        self.values = values
+        self.slotMinutes = slotMinutes
+        self.resolution = resolution
+        self.lag = lag
+        self.start = start
+        self.period = len(values)*resolution
+
+        # path of the binary scenario file if the values are mapped from one
+        self.path = None
+
+        # maps (type code, component ID) to the column of the entry
+        self.columnOf = {(typeCode, componentID): i for i, (typeCode, componentID) in enumerate(zip(typeCodes, ids))}
+
+        # previous row, current row and their interpolation weights of each slot of the period
+        self.slotWeights = None
+        if 0 < self.period <= 24*60 and self.period % slotMinutes == 0:
+            self.slotWeights = [self.getWeights(slot*slotMinutes) for slot in range(self.period // slotMinutes)]
+
+
+    @classmethod
+    def fromDict(cls, scenario: dict, slotMinutes: int = 15):
+        """Compiles a scenario that maps "HH:00" timestamps to the kWh values of each scenario key and component.
+
+        Args:
+            scenario(dict): the scenario setting
+            slotMinutes(int): size of the slots the interpolation weights are precomputed for
+
+        Returns:
+            ScenarioTimeline: the compiled scenario
+        """
+
+        hours = {}
+        for timestamp in scenario:
+            # only full hours are taken into account
+            if len(timestamp) != 5 or not timestamp.endswith(':00') or not timestamp[:2].isdigit():
+                continue
+            if int(timestamp[:2]) < 24:
+                hours[int(timestamp[:2])] = scenario[timestamp]
+
+        columnOf = {}
+        ids = []
+        typeCodes = []
+        for hour in sorted(hours):
+            for key in hours[hour]:
+                if key not in scenarioKeys:
+                    continue
+                for componentID in hours[hour][key]:
+                    if (scenarioKeys[key], componentID) not in columnOf:
+                        columnOf[(scenarioKeys[key], componentID)] = len(ids)
+                        ids.append(componentID)
+                        typeCodes.append(scenarioKeys[key])
+
+        values = np.full((24, len(ids)), np.nan)
+        for hour in hours:
+            for key in hours[hour]:
+                if key not in scenarioKeys:
+                    continue
+                for componentID, kwh in hours[hour][key].items():
+                    values[hour, columnOf[(scenarioKeys[key], componentID)]] = kwh
+
+        return cls(ids, typeCodes, values, slotMinutes)
+
+
+    @classmethod
+    def create(cls, path: str, ids: list, typeCodes: list, rows: int, resolution: int = 15, lag: int = 0,
+               start: datetime.datetime = None, dtype=np.float32, slotMinutes: int = 15):
+        """Creates a binary scenario file filled with NaN and returns its timeline with writable values, so that
+        profiles larger than the memory can be written row by row.
+
+        Layout of the file:
+            magic number, 8 bytes
+            length of the header, unsigned 64 bit little endian
+            header, JSON with the ids, typeCodes, rows, resolution, lag, start and dtype
+            padding to the next multiple of headerAlignment bytes
+            values, rows*columns little endian values of the given dtype, one row after another
+
+        Args:
+            path(str): path of the file to create
+            ids(list): component ID of each column
+            typeCodes(list): type code of the components each column applies to
+            rows(int): amount of rows
+            resolution(int): minutes between two rows
+            lag(int): minutes that the values lag behind the time of their row
+            start(datetime.datetime): time of the first row, None for a profile that repeats from midnight
+            dtype: type of the values, float32 or float64
+            slotMinutes(int): size of the slots the interpolation weights are precomputed for
+
+        Returns:
+            ScenarioTimeline: the timeline of the file
+        """
+
+        if rows < 1:
+            print('could not create scenario file %s as it has no rows' % path)
+            sys.exit(1)
+
+        header = json.dumps({
+            'ids': list(ids),
+            'typeCodes': [int(typeCode) for typeCode in typeCodes],
+            'rows': rows,
+            'resolution': resolution,
+            'lag': lag,
+            'start': start.isoformat() if start is not None else None,
+            'dtype': np.dtype(dtype).newbyteorder('<').str
+        }).encode('utf-8')
+
+        offset = -(-(len(scenarioMagic) + 8 + len(header)) // headerAlignment)*headerAlignment
+        with open(path, 'wb') as file:
+            file.write(scenarioMagic)
+            file.write(struct.pack('<Q', len(header)))
+            file.write(header)
+            file.write(bytes(offset - file.tell()))
+
+        values = np.memmap(path, dtype=np.dtype(dtype).newbyteorder('<'), mode='r+', offset=offset, 
+                           shape=(rows, len(ids)))
+        values[:] = np.nan
+
+        timeline = cls(ids, typeCodes, values, slotMinutes, resolution, lag, start)
+        timeline.path = path
+        return timeline
+
+
+    @classmethod
+    def load(cls, path: str, slotMinutes: int = 15):
+        """Maps a binary scenario file into memory, see create(). The values are only read from the file when a
+        timestep needs them.
+
+        Args:
+            path(str): path of the binary scenario file
+            slotMinutes(int): size of the slots the interpolation weights are precomputed for
+
+        Returns:
+            ScenarioTimeline: the timeline of the file
+        """
+
+        with open(path, 'rb') as file:
+            if file.read(len(scenarioMagic)) != scenarioMagic:
+                print(path + ' is not a binary scenario file')
+                sys.exit(1)
+            headerLength, = struct.unpack('<Q', file.read(8))
+            header = json.loads(file.read(headerLength).decode('utf-8'))
+
+        offset = -(-(len(scenarioMagic) + 8 + headerLength) // headerAlignment)*headerAlignment
+        shape = (header['rows'], len(header['ids']))
+        if shape[0]*shape[1] > 0:
+            values = np.memmap(path, dtype=np.dtype(header['dtype']), mode='r', offset=offset, shape=shape)
+        else:
+            values = np.empty(shape, dtype=np.dtype(header['dtype']))
+
+        start = header['start']
+        if start is not None:
+            start = datetime.datetime.fromisoformat(start)
+
+        timeline = cls(header['ids'], header['typeCodes'], values, slotMinutes, header['resolution'], header['lag'],
+                       start)
+        timeline.path = path
+        return timeline
+
+
+    def save(self, path: str, dtype=np.float64, chunkRows: int = 4096) -> None:
+        """Writes the timeline to a binary scenario file, see create().
+
+        Args:
+            path(str): path of the file to write
+            dtype: type of the stored values
+            chunkRows(int): amount of rows to copy at once
+        """
+
+        timeline = ScenarioTimeline.create(path, self.ids, self.typeCodes, len(self.values), self.resolution, 
+                                           self.lag, self.start, dtype)
+        for row in range(0, len(self.values), chunkRows):
+            timeline.values[row:row+chunkRows] = self.values[row:row+chunkRows]
+        timeline.values.flush()
+
+
+    def __getstate__(self):
+        # mapped values are mapped again instead of being copied, e.g. into the processes of an ensemble
+        state = self.__dict__.copy()
+        if self.path is not None:
+            state['values'] = None
+        return state
+
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        if self.values is None:
+            self.values = ScenarioTimeline.load(self.path).values
+
+
+    def getMinute(self, simulationTime: datetime.datetime) -> int:
+        """Returns the minute of the profile at the given simulation time, before wrapping around the period.
+
+        Args:
+            simulationTime(datetime.datetime): the simulation time
+
+        Returns:
+            int: minutes since the start of the profile, or since midnight if it has no start
+        """
+
+        if self.start is not None:
+            return (simulationTime - self.start) // datetime.timedelta(minutes=1)
+        return simulationTime.hour*60 + simulationTime.minute
+
+
+    def getWeights(self, minute: int) -> tuple:
+        """Returns the rows and interpolation weights for the given minute of the period.
+
+        Returns:
+            tuple: (previous row, current row, weight of previous row, weight of current row)
+        """
+
+        position = (minute - self.lag) % self.period
+        previousRow = int(position // self.resolution)
+        currentRow = (previousRow + 1) % len(self.values)
+        factorB = (position % self.resolution)/self.resolution
+        factorA = (1-factorB)
+        return previousRow, currentRow, factorA, factorB
+
+
+    def getValues(self, minute: int) -> np.ndarray:
+        """Returns the interpolated kWh value of every column at the given minute of the profile, see getMinute().
+        Columns without a value at that time are NaN.
+
+        Args:
+            minute(int): minutes since the start of the profile, or since midnight if it has no start
+
+        Returns:
+            np.ndarray: kWh value of each column
+        """
+
+        minute = minute % self.period
+        if self.slotWeights is not None and minute % self.slotMinutes == 0:
+            previousRow, currentRow, factorA, factorB = self.slotWeights[minute // self.slotMinutes]
+        else:
+            previousRow, currentRow, factorA, factorB = self.getWeights(minute)
+
+        previousValues = np.asarray(self.values[previousRow], dtype=np.float64)
+        currentValues = np.asarray(self.values[currentRow], dtype=np.float64)
+        return factorA*previousValues + factorB*currentValues
+
+
+def loadScenario(filePath: str):
+    """Loads a scenario setting from a JSON file or maps a binary scenario file, see ScenarioTimeline.create().
+
+    Args:
+        filePath(str): path to the scenario file
+
+    Returns:
+        the scenario setting or the ScenarioTimeline of a binary scenario file
+    """
+
+    try:
+        with open(filePath, 'rb') as file:
+            isBinary = file.read(len(scenarioMagic)) == scenarioMagic
+        if isBinary:
+            return ScenarioTimeline.load(filePath)
+
+        with open(filePath, 'r') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        print('could not open ' + filePath)
+        sys.exit(1)
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Converts a JSON scenario into the binary scenario format.')
+    parser.add_argument('input', help='path to the JSON scenario')
+    parser.add_argument('output', help='path of the binary scenario file to write')
+    parser.add_argument('--dtype', choices=['float32', 'float64'], default='float64', help='type of the stored values')
+    args = parser.parse_args(argv)
+
+    with open(args.input, 'r') as file:
+        timeline = ScenarioTimeline.fromDict(json.load(file))
+    timeline.save(args.output, np.dtype(args.dtype))
+
+    print('converted %d entries of %d rows' % (len(timeline.ids), len(timeline.values)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+from grid import Grid
+from records import openSink, sinkClasses
+from scenario import loadScenario
+from profiling import Profiler
+from dispatch import dispatchStrategies
+import argparse, json, sys, time
+
+
+def loadSettings(filePath: str) -> dict:
+    """Loads a grid or scenario setting from the given JSON file.
+
+    Args:
+        filePath(str): path to the JSON file
+
+    Returns:
+        dict: the parsed setting
+    """
+
+    try:
+        file = open(filePath, 'r')
+        settings = json.load(file)
+    except:
+        print('could not open ' + filePath)
+        sys.exit(1)
+
+    return settings
+
+
+def simulate(grid: Grid, steps: int, outputPath: str, outputFormat: str = 'csv') -> None:
+    """Advances the grid by the given amount of steps as fast as possible and streams the state after every step to
+    the given output, see records.py for the formats.
+
+    Args:
+        grid(Grid): the grid to simulate
+        steps(int): amount of timesteps to simulate
+        outputPath(str): path of the file or directory to write
+        outputFormat(str): csv, jsonl or columnar
+    """
+
+    with openSink(outputPath, outputFormat) as sink:
+        for record in grid.iterRecords(steps):
+            sink.write(record)
+
+
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(description='Runs the EMS simulation headless, without rendering.')
+    parser.add_argument('--grid', default='assets/settings/grid.json', help='path to the grid setting')
+    parser.add_argument('--scenario', default='assets/settings/scenario.json', 
+                        help='path to the scenario setting or binary scenario file')
+    parser.add_argument('--grid-size', type=int, default=20, help='size of the square grid')
+    parser.add_argument('--steps', type=int, default=96, help='amount of timesteps to simulate')
+    parser.add_argument('--timestep', type=int, default=15, help='simulation minutes per timestep, from 1 to 60')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='take long timesteps while the scenario is flat and short ones while it changes fast')
+    parser.add_argument('--fast-forward', action='store_true',
+                        help='reuse the allocation of cell groups whose inputs did not change since the previous step')
+    parser.add_argument('--output', default='simulation.csv', help='path to write the results to')
+    parser.add_argument('--format', choices=sorted(sinkClasses), default='csv', help='format of the results')
+    parser.add_argument('--array-backed', action='store_true', help='keep the component state in numpy arrays')
+    parser.add_argument('--workers', type=int, default=1, help='amount of processes to allocate cell groups with')
+    parser.add_argument('--strategy', choices=list(dispatchStrategies), default='greedy',
+                        help='how the energy of each cell group is allocated')
+    parser.add_argument('--profile', help='path to write the wall time of each step phase to, as JSON if it ends with '
+                                          '.json and in the Prometheus text format otherwise')
+    args = parser.parse_args(argv)
+
+    g = Grid(
+        gridData=loadSettings(args.grid), 
+        gridSize=args.grid_size, 
+        scenario=loadScenario(args.scenario), 
+        arrayBacked=args.array_backed,
+        workers=args.workers,
+        strategy=args.strategy,
+        timestepMinutes=args.timestep,
+        adaptiveTimestep=args.adaptive,
+        fastForward=args.fast_forward
+    )
+
+    if args.profile is not None:
+        g.profiler = Profiler(histograms=True)
+
+    startTime = time.time()
+    try:
+        simulate(g, args.steps, args.output, args.format)
+    finally:
+        g.close()
+    endTime = time.time()
+
+    print('simulated %d steps in %.2fs, running equilibrium: %.2f%%' % (
+        args.steps, endTime - startTime, g.getRunningEquilibrium())
+    )
+
+    if args.profile is not None:
+        with open(args.profile, 'w') as file:
+            if args.profile.endswith('.json'):
+                file.write(g.profiler.toJSON())
+            else:
+                file.write(g.profiler.toPrometheus())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+import numpy as np
+
+
+# type codes of the grid components
+PROVIDER = 0
+USER = 1
+STORAGE = 2
+P2X = 3
+
+
+class StoredAttribute:
+    """Attribute of a grid component that lives in the array of the same name of a ComponentStore once the component
+    is attached to one. Detached components keep the value in their own __dict__."""
+
+    def __set_name__(self, owner, name: str):
+        self.name = name
+
+
+    def __get__(self, component, owner=None):
+        if component is None:
+            return self
+
+        store = component.__dict__.get('store')
+        if store is not None:
+            return getattr(store, self.name)[component.__dict__['storeIndex']]
+        return component.__dict__[self.name]
+
+
+    def __set__(self, component, value):
+        store = component.__dict__.get('store')
+        if store is not None:
+            getattr(store, self.name)[component.__dict__['storeIndex']] = value
+        else:
+            component.__dict__[self.name] = value
+
+
+class ComponentStore:
+    """Struct of arrays that holds the energy state of every grid component in contiguous numpy arrays. The component
+    objects stay thin views over their row in the arrays, so that satisfaction and equilibrium can be computed for all
+    components at once.
+
+    Args:
+        components(list): grid components to store, the index of each component in this list is its row
+    """
+
+    def __init__(self, components: list):
+        self.components = list(components)
+        self.ids = [c.id_ for c in self.components]
+        self.indexOf = {componentID: i for i, componentID in enumerate(self.ids)}
+
+        self.typeCode = np.array([c.typeCode for c in self.components], dtype=np.int8)
+        self.coordX = np.array([c.coordX for c in self.components], dtype=np.int64)
+        self.coordY = np.array([c.coordY for c in self.components], dtype=np.int64)
+        self.currentKWH = np.array([c.currentKWH for c in self.components], dtype=np.float64)
+        self.desiredKWH = np.array([c.desiredKWH for c in self.components], dtype=np.float64)
+        self.maxKWH = np.array([getattr(c, 'maxKWH', 0) for c in self.components], dtype=np.float64)
+
+        # whether the cell of a component is active, see updateActive()
+        self.isActive = np.ones(len(self.components), dtype=bool)
+
+        for i, c in enumerate(self.components):
+            c.__dict__['store'] = self
+            c.__dict__['storeIndex'] = i
+
+
+    def detach(self) -> None:
+        """Copies the state back into the component objects and detaches them from this store."""
+
+        for i, c in enumerate(self.components):
+            c.__dict__['store'] = None
+            c.__dict__['currentKWH'] = self.currentKWH.item(i)
+            c.__dict__['desiredKWH'] = self.desiredKWH.item(i)
+            if c.typeCode in (PROVIDER, STORAGE):
+                c.__dict__['maxKWH'] = self.maxKWH.item(i)
+
+
+    def updateActive(self, cells: list) -> None:
+        """Updates which components reside on an active cell.
+
+        Args:
+            cells(list): the cells of the grid
+        """
+
+        if len(self.components) == 0:
+            return
+        self.isActive = np.array(cells, dtype=bool)[self.coordX, self.coordY]
+
+
+    def getSatisfactions(self) -> np.ndarray:
+        """Returns the satisfaction of every component in percent, see the getSatisfaction() of each component class.
+
+        Returns:
+            np.ndarray: satisfaction of each component in percent
+        """
+
+        satisfactions = np.full(len(self.components), 100.0)
+
+        # providers are satisfied when their generated energy got consumed
+        mask = (self.typeCode == PROVIDER) & (self.maxKWH != 0)
+        satisfactions[mask] = (1 - self.currentKWH[mask]/self.maxKWH[mask]) * 100
+
+        # users and p2xs are satisfied when their needs are met
+        mask = ((self.typeCode == USER) | (self.typeCode == P2X)) & (self.desiredKWH != 0)
+        satisfactions[mask] = self.currentKWH[mask]/self.desiredKWH[mask] * 100
+
+        # storages are satisfied when they are charged
+        mask = (self.typeCode == STORAGE) & (self.maxKWH != 0)
+        satisfactions[mask] = self.currentKWH[mask]/self.maxKWH[mask] * 100
+
+        return satisfactions
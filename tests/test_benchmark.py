@@ -0,0 +1,32 @@
+from benchmark import compareResults, generateGrid, generateScenario, runBenchmarks
+from grid import Grid
+
+
+def test_generateGrid():
+    mix = {'providers': 0.2, 'users': 0.6, 'storages': 0.1, 'p2xs': 0.1}
+    gridData = generateGrid(60, islands=9, density=0.4, componentDensity=0.2, mix=mix, seed=3)
+    assert gridData == generateGrid(60, islands=9, density=0.4, componentDensity=0.2, mix=mix, seed=3)
+    assert gridData != generateGrid(60, islands=9, density=0.4, componentDensity=0.2, mix=mix, seed=4)
+
+    scenario = generateScenario(gridData, seed=3)
+    grid = Grid(gridData=gridData, scenario=scenario, gridSize=60)
+
+    # each island is a cell group of its own and every generated component fits onto the grid
+    assert len(grid.getCellGroups()) == 9
+    for key in ('providers', 'users', 'storages', 'p2xs'):
+        assert len(getattr(grid, key)) == len(gridData[key]) > 0
+    assert len(grid.users) > len(grid.providers)
+
+    for p in grid.providers + grid.users + grid.p2xs:
+        assert p.id_ in grid.timeline.ids
+    grid.step()
+
+
+def test_compareResults():
+    gridData = generateGrid(20, islands=4, seed=0)
+    results = runBenchmarks(gridData, generateScenario(gridData), 20, repeat=1, pairs=10)
+    assert set(results) == {'init', 'getCellGroups', 'getCellDistance', 'step', 'day'}
+
+    baseline = dict(results, step=results['step']/2)
+    assert compareResults(results, baseline) == [('step', baseline['step'], results['step'])]
+    assert compareResults(results, baseline, threshold=1.5) == []
@@ -0,0 +1,167 @@
+from dispatch import FlowNetwork, GroupProblem, allocateCapacitated, allocateGreedy, allocateMinCostFlow
+from benchmark import generateGrid, generateScenario
+from simulate import loadSettings
+from grid import Grid
+import grid as gridModule
+from math import inf, isclose
+import random
+
+
+def test_flowNetwork():
+    # two suppliers of 5 and two consumers that want 4 each. the cheap supplier can reach both, the expensive one
+    # only the first consumer, so the cheap one has to serve the second consumer
+    network = FlowNetwork(6)
+    source, sink = 0, 1
+    network.addArc(sink, source, inf, 0)
+    cheap = network.addArc(source, 2, 5, 0)
+    expensive = network.addArc(source, 3, 5, 0)
+    cheapFirst = network.addArc(2, 4, inf, 1)
+    cheapSecond = network.addArc(2, 5, inf, 3)
+    expensiveFirst = network.addArc(3, 4, inf, 2)
+    network.addArc(4, sink, 4, -100)
+    network.addArc(5, sink, 4, -100)
+
+    potentials = network.solve()
+    flows = network.flows[::2]
+    assert flows[cheapSecond // 2] == 4
+    assert flows[cheapFirst // 2] == 1
+    assert flows[expensiveFirst // 2] == 3
+    assert flows[cheap // 2] == 5 and flows[expensive // 2] == 3
+
+    # a warm start from the solution of a network with other capacities reaches the same optimum
+    network.capacities[cheap] = 2
+    network.solve(potentials, flows)
+    assert network.flows[cheapSecond] == 2
+    assert network.flows[expensiveFirst] == 4
+
+
+def test_allocateMinCostFlow():
+    problem = GroupProblem(0)
+    problem.providerIDs, problem.providerKWHs = ['p0', 'p1'], [6, 4]
+    problem.userIDs, problem.userKWHs, problem.userDesiredKWHs = ['u0', 'u1'], [0, 0], [4, 4]
+    problem.userProviderOrders = [[0, 1], [0, 1]]
+    problem.userProviderDistances = [[1, 2], [1, 5]]
+    problem.userProviderEfficiencies = [[0.9**d for d in distances] for distances in problem.userProviderDistances]
+    problem.userStorageOrders = problem.userStorageEfficiencies = problem.userStorageDistances = [[], []]
+
+    # the greedy allocation serves the first user from the shared provider, so the second one has to draw from the
+    # far provider and loses too much on the way
+    greedy = allocateGreedy(problem)
+    assert greedy.userKWHs[0] == 4 and greedy.userKWHs[1] < 4
+
+    result = allocateMinCostFlow(problem)
+    assert all(isclose(kwh, 4) for kwh in result.userKWHs)
+    assert result.dependencyMap == {'u0': ['p0', 'p1'], 'u1': ['p0']}
+    assert sum(result.providerKWHs) > 0
+
+    # the outcome does not depend on the order of the users
+    for attribute in ('userIDs', 'userKWHs', 'userDesiredKWHs', 'userProviderOrders', 'userProviderDistances',
+                      'userProviderEfficiencies'):
+        setattr(problem, attribute, getattr(problem, attribute)[::-1])
+    reversedResult = allocateMinCostFlow(problem)
+    assert reversedResult.dependencyMap == result.dependencyMap
+    assert reversedResult.providerKWHs == result.providerKWHs
+
+
+def storageProblem(providerKWHs: list) -> GroupProblem:
+    # one user, one storage and one p2x next to each provider, without transmission loss
+    problem = GroupProblem(0)
+    providerCount = len(providerKWHs)
+    problem.providerIDs, problem.providerKWHs = ['p%d' % i for i in range(providerCount)], list(providerKWHs)
+    problem.userIDs, problem.userKWHs, problem.userDesiredKWHs = ['u0'], [0], [10]
+    problem.storageIDs, problem.storageKWHs, problem.storageMaxKWHs = ['s0'], [50], [100]
+    problem.p2xIDs, problem.p2xKWHs, problem.p2xDesiredKWHs = ['x0'], [0], [5]
+    for consumer in ('userProvider', 'storageProvider', 'p2xProvider', 'userStorage'):
+        supplierCount = 1 if consumer == 'userStorage' else providerCount
+        setattr(problem, consumer + 'Orders', [list(range(supplierCount))])
+        setattr(problem, consumer + 'Distances', [[1]*supplierCount])
+        setattr(problem, consumer + 'Efficiencies', [[1.0]*supplierCount])
+    return problem
+
+
+def getTotalKWH(problem: GroupProblem, result=None) -> float:
+    source = result if result is not None else problem
+    return sum(source.providerKWHs) + sum(source.userKWHs) + sum(source.storageKWHs) + sum(source.p2xKWHs)
+
+
+def test_minCostFlowStorages():
+    # a storage serves the user on its own, the stock it keeps stays in it
+    problem = storageProblem([])
+    result = allocateMinCostFlow(problem)
+    assert isclose(result.userKWHs[0], 10)
+    assert isclose(result.storageKWHs[0], 40)
+    assert isclose(getTotalKWH(problem, result), getTotalKWH(problem))
+
+    # the provider can serve the user, so greedy keeps the whole stock and its allocation is optimal
+    problem = storageProblem([10])
+    greedy = allocateGreedy(problem)
+    result = allocateMinCostFlow(problem)
+    for attribute in ('providerKWHs', 'userKWHs', 'storageKWHs', 'p2xKWHs'):
+        assert all(isclose(a, b) for a, b in zip(getattr(result, attribute), getattr(greedy, attribute)))
+    assert result.dependencyMap == greedy.dependencyMap == {'u0': ['p0'], 's0': [], 'x0': []}
+    assert isclose(getTotalKWH(problem, result), getTotalKWH(problem))
+
+    # with supply to spare, the storage charges and the p2x is served
+    problem = storageProblem([30])
+    result = allocateMinCostFlow(problem)
+    assert isclose(result.userKWHs[0], 10) and isclose(result.storageKWHs[0], 70)
+    assert isclose(getTotalKWH(problem, result), getTotalKWH(problem))
+
+
+def test_minCostFlowGrid():
+    gridData = loadSettings('assets/settings/grid.json')
+    scenario = loadSettings('assets/settings/scenario.json')
+    grid = Grid(gridData=gridData, gridSize=20, scenario=scenario, strategy='minCostFlow')
+    coldGrid = Grid(gridData=gridData, gridSize=20, scenario=scenario, strategy='minCostFlow')
+
+    for i in range(20):
+        grid.step()
+        assert all(plan is None or plan.warmStart is not None for plan in grid._getGroupPlans().values())
+
+        for plan in coldGrid._getGroupPlans().values():
+            if plan is not None:
+                plan.warmStart = None
+        coldGrid.step()
+
+        # warm and cold starts reach allocations of the same quality
+        assert isclose(grid.getRunningEquilibrium(), coldGrid.getRunningEquilibrium(), rel_tol=1e-6)
+
+    # without transmission loss, the allocation of each group of the grid conserves its energy
+    gridData['energyLossPerCell'] = 1
+    grid = Grid(gridData=gridData, gridSize=20, scenario=scenario, strategy='minCostFlow')
+    for i in range(10):
+        grid.step()
+        for plan in grid._getGroupPlans().values():
+            if plan is not None:
+                problem = grid._buildGroupProblem(plan)
+                assert isclose(getTotalKWH(problem, allocateMinCostFlow(problem)), getTotalKWH(problem))
+
+
+def test_capacitatedGrid(monkeypatch):
+    gridData = generateGrid(14, density=0.7, componentDensity=0.35, seed=3)
+    scenario = generateScenario(gridData, seed=3)
+    rng = random.Random(3)
+    gridData['edgeCapacities'] = [
+        {'cells': [[x, y], [x + dx, y + dy]], 'maxKWH': rng.uniform(0.5, 10)}
+        for x in range(14) for y in range(14) for dx, dy in ((1, 0), (0, 1)) if rng.random() < 0.15
+    ]
+    gridData['energyLossPerCell'] = 1
+    grid = Grid(gridData=gridData, gridSize=14, scenario=scenario)
+    assert grid.storages and grid.p2xs
+
+    # without transmission loss, the capacitated allocation of each group conserves its energy and fills no storage
+    # beyond its maximum
+    problems = []
+
+    def allocateChecked(problem: GroupProblem):
+        assert problem.cellNetwork is not None
+        result = allocateCapacitated(problem)
+        assert isclose(getTotalKWH(problem, result), getTotalKWH(problem))
+        assert all(kwh <= maxKWH + 1e-9 for kwh, maxKWH in zip(result.storageKWHs, problem.storageMaxKWHs))
+        problems.append(problem)
+        return result
+
+    monkeypatch.setattr(gridModule, 'allocateGroup', allocateChecked)
+    for i in range(10):
+        grid.step()
+    assert any(problem.storageIDs and problem.p2xIDs for problem in problems)
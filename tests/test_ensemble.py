@@ -0,0 +1,36 @@
+from ensemble import NoiseModel, runEnsemble
+from grid import Grid
+import json
+import numpy as np
+import pytest
+
+
+def test_runEnsemble():
+    gridData = json.load(open('assets/settings/grid.json', 'r'))
+    scenario = json.load(open('assets/settings/scenario.json', 'r'))
+
+    grid = Grid(gridData=gridData, gridSize=20, scenario=scenario)
+    trajectory = []
+    for i in range(16):
+        grid.step()
+        trajectory.append(grid.currentEquilibrium)
+
+    # identical variants have no spread
+    statistics = runEnsemble(gridData, scenarios=[scenario, scenario, scenario], steps=16)
+    assert statistics.runs == 3
+    assert np.allclose(statistics.mean, trajectory)
+    assert np.allclose(statistics.getStd(), 0)
+    assert np.all(statistics.getPercentile(5) <= statistics.getPercentile(95))
+
+    # perturbed variants are reproducible regardless of the amount of workers
+    serial = runEnsemble(gridData, baseScenario=scenario, noiseModel=NoiseModel(0.2, 0.2, 0.2), runs=6, steps=16)
+    parallel = runEnsemble(
+        gridData, baseScenario=scenario, noiseModel=NoiseModel(0.2, 0.2, 0.2), runs=6, steps=16, workers=2
+    )
+    assert np.allclose(serial.mean, parallel.mean)
+    assert np.all(serial.min <= serial.getPercentile(50))
+    assert np.all(serial.getPercentile(50) <= serial.max)
+
+    # without variants or a base scenario there is nothing to run
+    with pytest.raises(ValueError):
+        runEnsemble(gridData, steps=16)
@@ -1,5 +1,9 @@
 from grid import Grid
-import sys, json
+from benchmark import generateGrid, generateScenario
+from simulate import loadSettings
+import datetime, sys, json
+from math import inf, isclose
+import pytest
 
 
 def mockGrid() -> Grid:
@@ -91,4 +95,421 @@ def test_sortComponentsByDistanceTo():
 
     actualSortedProviders = [grid.providers[1], grid.providers[0]]
 
-    assert sortedProviders == actualSortedProviders
\ No newline at end of file
+    assert sortedProviders == actualSortedProviders
+
+def test_getCellDistanceAfterTopologyChange():
+    grid = mockGrid()
+
+    assert grid.getCellDistance(0, 0, 2, 1) == 3
+
+    # connect (2, 1) with (4, 0) through (3, 1) and (3, 0)
+    grid.cells[3][1] = True
+    grid.cells[3][0] = True
+    grid.invalidateTopology()
+    assert grid.getCellDistance(0, 0, 4, 0) == 4
+
+    # cut (0, 0) off from the rest of its group
+    grid.cells[1][0] = False
+    grid.cells[0][1] = False
+    grid.invalidateTopology()
+    assert grid.getCellDistance(0, 0, 2, 1) == inf
+
+
+def test_groupOf():
+    grid = mockGrid()
+
+    assert grid.groupOf(0, 0) == grid.groupOf(2, 1)
+    assert grid.groupOf(0, 0) != grid.groupOf(5, 1)
+    assert grid.groupOf(3, 3) is None
+
+    assert sorted(grid.getGroupMembers(grid.groupOf(5, 1))) == [(4, 0), (5, 0), (5, 1)]
+
+    # a group spanning the whole grid must not hit the recursion limit
+    grid = Grid(gridData={'gridCells': [[[0, 0], [199, 199]]]}, gridSize=200, scenario={})
+    assert len(grid.getCellGroups()) == 1
+    assert grid.getCellDistance(0, 0, 199, 199) == 398
+
+
+def test_componentIndex():
+    grid = mockGrid()
+
+    assert grid.getComponentAt(0, 0) is grid.providers[0]
+    assert grid.getComponent('user_1') is grid.users[0]
+    assert grid.getPositionOf('user_1') == (2, 1)
+
+    # provider_5 shares its cell with provider_4 and is rejected
+    assert grid.getComponent('provider_5') is None
+
+    grid.removeComponent('provider_1')
+    assert grid.getComponentAt(0, 0) is None
+    assert grid.providers[0].id_ == 'provider_2'
+    assert grid.sortComponentsByDistanceTo(grid.providers, grid.users[0]) == [grid.providers[0]]
+
+
+def test_arrayBackedStep():
+    grid = mockGrid()
+
+    filePath = 'assets/settings/test_grid.json'
+    arrayBackedGrid = Grid(gridData=json.load(open(filePath, 'r')), gridSize=15, scenario=grid.scenario, arrayBacked=True)
+
+    for i in range(100):
+        grid.step()
+        arrayBackedGrid.step()
+
+    assert abs(grid.getRunningEquilibrium() - arrayBackedGrid.getRunningEquilibrium()) < 1e-9
+    for c, arrayBackedC in zip(grid.storages, arrayBackedGrid.storages):
+        assert c.currentKWH == arrayBackedC.currentKWH
+        assert c.getSatisfaction() == arrayBackedC.getSatisfaction()
+    
+    # the component objects are views on the store
+    arrayBackedGrid.users[0].desiredKWH = 42
+    assert arrayBackedGrid.store.desiredKWH[arrayBackedGrid.store.indexOf['user_1']] == 42
+
+
+def test_parallelStep():
+    # the groups of separate islands are what the process pool gets to work on
+    gridData = generateGrid(30, islands=4, seed=1)
+    scenario = generateScenario(gridData, seed=1)
+    serialGrid = Grid(gridData=gridData, gridSize=30, scenario=scenario)
+    parallelGrid = Grid(gridData=gridData, gridSize=30, scenario=scenario, workers=2)
+
+    try:
+        for i in range(20):
+            serialGrid.step()
+            parallelGrid.step()
+        assert parallelGrid._executor is not None
+    finally:
+        parallelGrid.close()
+
+    assert serialGrid.getRunningEquilibrium() == parallelGrid.getRunningEquilibrium()
+    assert serialGrid.dependencyMap == parallelGrid.dependencyMap
+
+
+def test_setCell():
+    grid = mockGrid()
+
+    # merge the groups of (2, 1) and (4, 0)
+    grid.setCell(3, 0, True)
+    assert grid.groupOf(0, 0) == grid.groupOf(5, 1)
+    assert len(grid.getCellGroups()) == 2
+    assert grid.getCellDistance(0, 0, 5, 1) == 6
+
+    # split them again
+    grid.setCell(3, 0, False)
+    assert grid.groupOf(0, 0) != grid.groupOf(5, 1)
+    assert len(grid.getCellGroups()) == 3
+    assert grid.getCellDistance(0, 0, 5, 1) == inf
+
+    # a removed cell on a shortest path forces a detour
+    grid.setCell(1, 0, False)
+    assert grid.getCellDistance(0, 0, 2, 1) == 3
+    grid.setCell(0, 1, False)
+    assert grid.getCellDistance(0, 0, 2, 1) == inf
+    assert grid.groupOf(0, 0) != grid.groupOf(2, 1)
+
+
+def test_stepAfterSetCell():
+    incrementalGrid = mockGrid()
+    rebuiltGrid = mockGrid()
+
+    for x, y, active in ((3, 0, True), (3, 1, True), (1, 0, False), (3, 0, False)):
+        incrementalGrid.step()
+        rebuiltGrid.step()
+
+        incrementalGrid.setCell(x, y, active)
+        rebuiltGrid.cells[x][y] = active
+        rebuiltGrid.invalidateTopology()
+
+        incrementalGrid.step()
+        rebuiltGrid.step()
+        assert incrementalGrid.dependencyMap == rebuiltGrid.dependencyMap
+        assert incrementalGrid.getRunningEquilibrium() == rebuiltGrid.getRunningEquilibrium()
+
+
+def test_checkpoint(tmp_path):
+    filePath = 'assets/settings/test_grid.json'
+    for arrayBacked in (False, True):
+        grid = Grid(gridData=json.load(open(filePath, 'r')), gridSize=15, scenario=mockGrid().scenario, 
+                    arrayBacked=arrayBacked)
+        for i in range(10):
+            grid.step()
+
+        checkpointPath = tmp_path / 'grid.checkpoint'
+        grid.saveCheckpoint(checkpointPath)
+        restoredGrids = [Grid.loadCheckpoint(checkpointPath), Grid.loadCheckpoint(checkpointPath, zeroCopy=False)]
+
+        for i in range(50):
+            grid.step()
+            for restoredGrid in restoredGrids:
+                restoredGrid.step()
+                assert restoredGrid.dependencyMap == grid.dependencyMap
+                assert restoredGrid.getRunningEquilibrium() == grid.getRunningEquilibrium()
+                assert restoredGrid.simulationDayTime == grid.simulationDayTime
+
+    # stepping a restored grid does not change the checkpoint
+    assert Grid.loadCheckpoint(checkpointPath).store.currentKWH.tolist() != grid.store.currentKWH.tolist()
+
+
+def test_fork():
+    grid = mockGrid()
+    for i in range(10):
+        grid.step()
+
+    fork = grid.fork()
+    for i in range(20):
+        grid.step()
+        fork.step()
+        assert fork.getRunningEquilibrium() == grid.getRunningEquilibrium()
+    assert fork._distanceIndex is grid._distanceIndex
+
+    # the topology is copied before the fork changes it
+    fork.setCell(1, 0, False)
+    assert grid.cells[1][0] and not fork.cells[1][0]
+    assert grid.getCellDistance(0, 0, 2, 0) == 2
+    assert fork.getCellDistance(0, 0, 2, 0) == 4
+
+
+def test_transmissionLoss():
+    gridData = {
+        'providers': [
+            {'id': 'near', 'displayName': 'Near', 'coordX': 0, 'coordY': 2, 'maxKWH': 100},
+            {'id': 'far', 'displayName': 'Far', 'coordX': 4, 'coordY': 0, 'maxKWH': 100}
+        ],
+        'users': [{'id': 'user', 'displayName': 'User', 'coordX': 0, 'coordY': 0}],
+        'gridCells': [[[0, 0], [4, 0]], [[0, 0], [0, 2]]],
+        'energyLossPerCell': 0.9
+    }
+    scenario = {'%02d:00' % h: {'providerKWHs': {'near': 3, 'far': 20}, 'userKWHs': {'user': 10}} for h in range(24)}
+    grid = Grid(gridData=gridData, gridSize=5, scenario=scenario)
+
+    assert grid.getRoute(4, 0, 0, 0) == [(4, 0), (3, 0), (2, 0), (1, 0), (0, 0)]
+    assert grid.getTransmissionEfficiency(0, 2, 0, 0) == 0.9**2
+    assert grid.getShortestPathTree(4, 0) is grid.getShortestPathTree(4, 0)
+
+    # the providers generate their scenario kWh on construction and on each step. the user drains the more efficient
+    # provider first and gets the rest from the far one, both lose energy on the way
+    grid.step()
+    near, far = grid.providers
+    user = grid.users[0]
+    assert near.currentKWH == 0
+    assert isclose(far.currentKWH, 40 - (10 - 6*0.9**2)/0.9**4)
+    assert isclose(user.currentKWH, 10)
+    assert grid.dependencyMap['user'] == ['near', 'far']
+
+
+
+def test_losslessSupplierOrder():
+    gridData = {
+        'providers': [
+            {'id': 'far', 'displayName': 'Far', 'coordX': 4, 'coordY': 0, 'maxKWH': 100},
+            {'id': 'near', 'displayName': 'Near', 'coordX': 1, 'coordY': 0, 'maxKWH': 100}
+        ],
+        'users': [{'id': 'u', 'displayName': 'U', 'coordX': 0, 'coordY': 0}],
+        'gridCells': [[[0, 0], [4, 0]]],
+        'energyLossPerCell': 1
+    }
+    scenario = {
+        '%02d:00' % h: {'providerKWHs': {'far': 10, 'near': 10}, 'userKWHs': {'u': 5}} for h in range(24)
+    }
+
+    # without loss every supplier is equally efficient, the nearest one is still consumed first
+    grid = Grid(gridData=gridData, gridSize=5, scenario=scenario)
+    user = grid.users[0]
+    assert [p.id_ for p in grid.sortComponentsByDistanceTo(grid.providers, user)] == ['near', 'far']
+    grid.step()
+    assert grid.dependencyMap['u'] == ['near']
+
+
+def test_energyLossPerCell():
+    gridData = {
+        'providers': [
+            {'id': 'far', 'displayName': 'Far', 'coordX': 4, 'coordY': 0, 'maxKWH': 100},
+            {'id': 'near', 'displayName': 'Near', 'coordX': 1, 'coordY': 0, 'maxKWH': 100}
+        ],
+        'users': [{'id': 'u', 'displayName': 'U', 'coordX': 0, 'coordY': 0}],
+        'gridCells': [[[0, 0], [4, 0]]]
+    }
+    scenario = {
+        '%02d:00' % h: {'providerKWHs': {'far': 10, 'near': 10}, 'userKWHs': {'u': 5}} for h in range(24)
+    }
+
+    for energyLossPerCell in (0, -0.5, 1.5):
+        with pytest.raises(SystemExit):
+            Grid(gridData=dict(gridData, energyLossPerCell=energyLossPerCell), gridSize=5, scenario=scenario)
+
+    # the efficiency of the far provider underflows to 0, it is skipped instead of dividing by it
+    grid = Grid(gridData=dict(gridData, energyLossPerCell=1e-300), gridSize=5, scenario=scenario)
+    grid.step()
+    assert grid.dependencyMap['u'] == ['near']
+
+    # the supplier efficiencies follow a changed loss
+    grid = Grid(gridData=dict(gridData, energyLossPerCell=1), gridSize=5, scenario=scenario)
+    grid.step()
+    grid.energyLossPerCell = 0.5
+    grid.step()
+    plan = grid._getGroupPlans()[grid.groupOf(0, 0)]
+    assert plan.userProviderEfficiencies == [[0.5, 0.0625]]
+
+def test_capacities():
+    gridData = {
+        'providers': [{'id': 'provider', 'displayName': 'Provider', 'coordX': 0, 'coordY': 0, 'maxKWH': 100}],
+        'users': [
+            {'id': 'near', 'displayName': 'Near', 'coordX': 1, 'coordY': 0},
+            {'id': 'far', 'displayName': 'Far', 'coordX': 4, 'coordY': 0}
+        ],
+        'gridCells': [[[0, 0], [4, 0]]],
+        'energyLossPerCell': 1,
+        'edgeCapacities': [{'cells': [[2, 0], [1, 0]], 'maxKWH': 5}, {'cells': [[0, 0], [2, 2]], 'maxKWH': 1}]
+    }
+    scenario = {
+        '%02d:00' % h: {'providerKWHs': {'provider': 10}, 'userKWHs': {'near': 4, 'far': 10}} for h in range(24)
+    }
+
+    # the far user only gets what passes the bridge edge, the edge between cells that are no neighbours is skipped
+    for arrayBacked in (False, True):
+        grid = Grid(gridData=gridData, gridSize=5, scenario=scenario, arrayBacked=arrayBacked)
+        assert grid.edgeCapacities == {((1, 0), (2, 0)): 5}
+        grid.step()
+        near, far = grid.users
+        assert isclose(near.currentKWH, 4)
+        assert isclose(far.currentKWH, 5)
+        assert grid.getEdgeUtilisation() == {((1, 0), (2, 0)): 1.0}
+        assert grid.dependencyMap['far'] == ['provider']
+        assert grid.getRecord(1).edgeUtilisation == {((1, 0), (2, 0)): 1.0}
+
+    # a cell capacity limits everything that passes the cell
+    gridData['cellCapacities'] = [{'from': [3, 0], 'to': [3, 0], 'maxKWH': 4}]
+    grid = Grid(gridData=gridData, gridSize=5, scenario=scenario)
+    grid.step()
+    assert isclose(grid.users[1].currentKWH, 4)
+    assert grid.getCellUtilisation() == {(3, 0): 1.0}
+    assert grid.getEdgeUtilisation() == {((1, 0), (2, 0)): 0.8}
+
+    # groups without capacity limits are allocated by the dispatch strategy of the grid
+    del gridData['cellCapacities'], gridData['edgeCapacities']
+    grid = Grid(gridData=gridData, gridSize=5, scenario=scenario)
+    grid.step()
+    assert isclose(grid.users[1].currentKWH, 10)
+    assert grid.getEdgeUtilisation() == {}
+
+
+
+def test_capacitiesStorage():
+    gridData = {
+        'providers': [{'id': 'provider', 'displayName': 'Provider', 'coordX': 3, 'coordY': 0, 'maxKWH': 100}],
+        'users': [{'id': 'user', 'displayName': 'User', 'coordX': 1, 'coordY': 0}],
+        'storages': [{'id': 'storage', 'displayName': 'Storage', 'coordX': 0, 'coordY': 0, 'maxKWH': 100}],
+        'gridCells': [[[0, 0], [3, 0]]],
+        'energyLossPerCell': 1,
+        'edgeCapacities': [{'cells': [[1, 0], [2, 0]], 'maxKWH': 20}]
+    }
+    scenario = {'%02d:00' % h: {'providerKWHs': {'provider': 10}, 'userKWHs': {'user': 10}} for h in range(24)}
+
+    # a storage never supplies itself, even when the flow reroutes its stock into its own charge
+    grid = Grid(gridData=gridData, gridSize=4, scenario=scenario)
+    components = grid.providers + grid.users + grid.storages
+    grid.step()
+    for _ in range(2):
+        before = sum(component.currentKWH for component in components)
+        grid.step()
+        assert isclose(sum(component.currentKWH for component in components), before)
+        assert grid.dependencyMap['storage'] == []
+        assert grid.dependencyMap['user'] == ['provider']
+        assert grid.getEdgeUtilisation() == {((1, 0), (2, 0)): 0.5}
+
+def test_timestep():
+    gridData = {
+        'providers': [{'id': 'provider', 'displayName': 'Provider', 'coordX': 0, 'coordY': 0, 'maxKWH': 1000}],
+        'users': [{'id': 'user', 'displayName': 'User', 'coordX': 1, 'coordY': 0}],
+        'gridCells': [[[0, 0], [1, 0]]]
+    }
+
+    # a flat demand with a peak at noon
+    scenario = {
+        '%02d:00' % h: {'providerKWHs': {'provider': 5}, 'userKWHs': {'user': 8 if h == 12 else 2}} for h in range(24)
+    }
+
+    # scenario values are kWh per 15 minutes, shorter timesteps need less energy each
+    grid = Grid(gridData=gridData, gridSize=2, scenario=scenario, timestepMinutes=5)
+    start = grid.simulationDayTime
+    for _ in range(3):
+        grid.step()
+    assert grid.simulationDayTime - start == datetime.timedelta(minutes=15)
+    assert isclose(grid.users[0].desiredKWH, 2/3)
+
+    # the adaptive mode takes long steps while the demand is flat and short ones around the peak, and the demand of a
+    # day adds up to the same energy as with fixed steps
+    demands = {}
+    for adaptive in (False, True):
+        grid = Grid(gridData=gridData, gridSize=2, scenario=scenario, adaptiveTimestep=adaptive)
+        end = grid.simulationDayTime + datetime.timedelta(days=1)
+        demands[adaptive] = 0
+        timesteps = []
+        while grid.simulationDayTime < end:
+            grid.step()
+            demands[adaptive] += grid.users[0].desiredKWH
+            timesteps.append(grid.timestepMinutes)
+
+        assert grid.simulationDayTime == end
+        if adaptive:
+            assert len(timesteps) < 96 and max(timesteps) == 60 and min(timesteps) < 15
+
+    assert isclose(demands[False], demands[True])
+
+
+def test_adaptiveTimestepPeak():
+    # a single user among many flat ones has a peak at noon
+    gridData = {
+        'providers': [{'id': 'provider', 'displayName': 'Provider', 'coordX': 0, 'coordY': 0, 'maxKWH': 10000}],
+        'users': [
+            {'id': 'user_%d' % i, 'displayName': 'User %d' % i, 'coordX': 1 + i % 19, 'coordY': i // 19}
+            for i in range(300)
+        ],
+        'gridCells': [[[0, 0], [19, 19]]]
+    }
+    scenario = {}
+    for h in range(24):
+        userKWHs = {'user_%d' % i: 10 for i in range(300)}
+        userKWHs['user_0'] = 100 if h == 12 else 10
+        scenario['%02d:00' % h] = {'providerKWHs': {'provider': 5000}, 'userKWHs': userKWHs}
+
+    grid = Grid(gridData=gridData, gridSize=20, scenario=scenario, adaptiveTimestep=True)
+    end = grid.simulationDayTime + datetime.timedelta(hours=13)
+    peak = 0
+    timesteps = []
+    while grid.simulationDayTime < end:
+        grid.step()
+        timesteps.append(grid.timestepMinutes)
+        peak = max(peak, grid.users[0].desiredKWH*15/grid.timestepMinutes)
+
+    # the steps are refined around the peak instead of averaging it away
+    assert max(timesteps) == 60 and min(timesteps) == 1
+    assert peak > 95
+
+
+def test_fastForward():
+    gridData = loadSettings('assets/settings/grid.json')
+    scenario = loadSettings('assets/settings/scenario.json')
+
+    # groups whose inputs did not change reuse their previous result, which yields the same records as allocating
+    for strategy in ('greedy', 'minCostFlow'):
+        grid = Grid(gridData=gridData, gridSize=20, scenario=scenario, strategy=strategy)
+        fastGrid = Grid(gridData=gridData, gridSize=20, scenario=scenario, strategy=strategy, fastForward=True)
+        reusedGroupCount = 0
+        for i in range(96):
+            # results cached for the previous topology are not reused
+            if i == 48:
+                grid.setCell(10, 10, not grid.cells[10][10])
+                fastGrid.setCell(10, 10, not fastGrid.cells[10][10])
+
+            grid.step()
+            fastGrid.step()
+            reusedGroupCount += fastGrid.reusedGroupCount
+            record, fastRecord = grid.getRecord(i), fastGrid.getRecord(i)
+            assert fastRecord.equilibrium == record.equilibrium
+            assert fastRecord.runningEquilibrium == record.runningEquilibrium
+            assert (fastRecord.currentKWH == record.currentKWH).all()
+            assert fastRecord.dependencies == record.dependencies
+
+        if strategy == 'greedy':
+            assert reusedGroupCount > 0
@@ -0,0 +1,37 @@
+from profiling import Profiler
+from simulate import loadSettings
+from grid import Grid
+import json
+
+
+def test_profiler(tmp_path):
+    grid = Grid(
+        gridData=loadSettings('assets/settings/grid.json'),
+        gridSize=20,
+        scenario=loadSettings('assets/settings/scenario.json')
+    )
+    grid.profiler = Profiler(histograms=True)
+    for _ in range(10):
+        grid.step()
+
+    statistics = grid.profiler.getStatistics()
+    for phase in ('updateScenario', 'groupPlans', 'buildProblems', 'updateEquilibrium', 'step'):
+        assert statistics[phase]['count'] == 10
+        assert sum(count for _, count in statistics[phase]['histogram']) == 10
+    assert statistics['allocate']['count'] == statistics['applyResults']['count'] == 10*sum(plan is not None for plan in grid._getGroupPlans().values())
+    assert statistics['step']['min'] <= statistics['step']['mean'] <= statistics['step']['max']
+
+    # the phases of a step add up to the whole step
+    phases = sum(s['total'] for phase, s in statistics.items() if phase != 'step')
+    assert phases <= statistics['step']['total']
+
+    assert json.loads(grid.profiler.toJSON())['step']['count'] == 10
+
+    lines = grid.profiler.toPrometheus().splitlines()
+    assert '# TYPE ems_step_phase_seconds histogram' in lines
+    assert 'ems_step_phase_seconds_bucket{phase="step",le="+Inf"} 10' in lines
+    assert 'ems_step_phase_seconds_count{phase="step"} 10' in lines
+
+    # a grid without profiler is not profiled
+    grid.profiler = None
+    grid.step()
@@ -0,0 +1,67 @@
+from records import ColumnarSink, JSONLSink, RecordSink, loadColumnar
+from simulate import loadSettings
+from grid import Grid
+import json
+import numpy as np
+import pytest
+
+
+def test_records(tmp_path):
+    grid = Grid(
+        gridData=loadSettings('assets/settings/grid.json'),
+        gridSize=20,
+        scenario=loadSettings('assets/settings/scenario.json')
+    )
+
+    records = []
+    with ColumnarSink(tmp_path / 'columnar', bufferSteps=3) as columnar, JSONLSink(tmp_path / 'records.jsonl') as jsonl:
+        for record in grid.iterRecords(10):
+            columnar.write(record)
+            jsonl.write(record)
+            records.append(record)
+
+    assert records[-1].runningEquilibrium == grid.getRunningEquilibrium()
+
+    columns = loadColumnar(tmp_path / 'columnar')
+    assert columns['ids'] == records[0].ids
+    assert columns['step'].tolist() == list(range(1, 11))
+    assert columns['equilibrium'].tolist() == [r.equilibrium for r in records]
+    assert np.array_equal(columns['currentKWH'], np.array([r.currentKWH for r in records]))
+    assert np.array_equal(columns['satisfaction'], np.array([r.satisfaction for r in records]))
+
+    # dependencies of each step are stored as component indices
+    offsets = [0] + columns['dependencyOffsets'].tolist()
+    for i, r in enumerate(records):
+        edges = columns['dependencies'][offsets[i]:offsets[i+1]].tolist()
+        assert [(r.ids[c], r.ids[s]) for c, s in edges] == r.dependencies
+
+    with open(tmp_path / 'records.jsonl', 'r') as file:
+        lines = [json.loads(line) for line in file]
+    assert len(lines) == 10
+    assert lines[-1]['simulationDayTime'] == '0001-01-02T02:30:00'
+    assert [tuple(edge) for edge in lines[-1]['dependencies']] == records[-1].dependencies
+    assert lines[-1]['components'][records[-1].ids[0]]['currentKWH'] == records[-1].currentKWH[0]
+
+
+def test_arrayBackedRecords():
+    gridData = loadSettings('assets/settings/grid.json')
+    scenario = loadSettings('assets/settings/scenario.json')
+    grid = Grid(gridData=gridData, gridSize=20, scenario=scenario)
+    arrayBackedGrid = Grid(gridData=gridData, gridSize=20, scenario=scenario, arrayBacked=True)
+
+    for record, arrayBackedRecord in zip(grid.iterRecords(8), arrayBackedGrid.iterRecords(8)):
+        assert record.ids == arrayBackedRecord.ids
+        assert np.array_equal(record.currentKWH, arrayBackedRecord.currentKWH)
+        assert np.array_equal(record.desiredKWH, arrayBackedRecord.desiredKWH)
+        assert np.allclose(record.satisfaction, arrayBackedRecord.satisfaction)
+        assert record.dependencies == arrayBackedRecord.dependencies
+
+
+def test_recordSinkOverrides():
+    class PartialSink(RecordSink):
+        def write(self, record) -> None:
+            pass
+
+    # a sink that does not implement every method fails when it is created, not when it is closed
+    with pytest.raises(TypeError):
+        PartialSink()
@@ -0,0 +1,79 @@
+from scenario import ScenarioTimeline, headerAlignment, loadScenario, scenarioMagic
+from store import PROVIDER, USER
+from grid import Grid
+import datetime, json, math, struct
+import numpy as np
+import pytest
+
+
+def test_fromDict():
+    scenario = json.load(open('assets/settings/scenario.json', 'r'))
+    timeline = ScenarioTimeline.fromDict(scenario)
+
+    provider3 = timeline.columnOf[(PROVIDER, 'provider_3')]
+    user1 = timeline.columnOf[(USER, 'user_1')]
+
+    # HH:00 takes the value of the previous hour
+    assert timeline.getValues(0)[provider3] == scenario['23:00']['providerKWHs']['provider_3']
+
+    # 02:15 interpolates between 01:00 and 02:00
+    values = timeline.getValues(2*60 + 15)
+    assert values[provider3] == 0.75*scenario['01:00']['providerKWHs']['provider_3'] + \
+                                0.25*scenario['02:00']['providerKWHs']['provider_3']
+    assert values[user1] == 0.75*scenario['01:00']['userKWHs']['user_1'] + 0.25*scenario['02:00']['userKWHs']['user_1']
+
+    # hours that are missing in the scenario have no value
+    timeline = ScenarioTimeline.fromDict({'05:00': {'userKWHs': {'user_1': 3}}})
+    assert math.isnan(timeline.getValues(5*60 + 30)[0])
+
+
+def test_binaryScenario(tmp_path):
+    scenario = json.load(open('assets/settings/scenario.json', 'r'))
+    timeline = ScenarioTimeline.fromDict(scenario)
+    timeline.save(tmp_path / 'scenario.bin')
+
+    mapped = loadScenario(tmp_path / 'scenario.bin')
+    assert isinstance(mapped.values, np.memmap)
+    assert mapped.ids == timeline.ids
+    assert mapped.columnOf == timeline.columnOf
+    for minute in range(0, 24*60, 5):
+        assert np.array_equal(mapped.getValues(minute), timeline.getValues(minute), equal_nan=True)
+
+
+def test_calendarScenario(tmp_path):
+    # two days of 15 minute values, the second day doubles the first
+    start = datetime.datetime(year=2023, month=3, day=1)
+    timeline = ScenarioTimeline.create(tmp_path / 'calendar.bin', ['user_1'], [USER], 2*96, resolution=15, start=start)
+    timeline.values[:96, 0] = np.arange(96)
+    timeline.values[96:, 0] = 2*np.arange(96)
+
+    mapped = ScenarioTimeline.load(tmp_path / 'calendar.bin')
+    assert mapped.getValues(mapped.getMinute(start + datetime.timedelta(hours=1)))[0] == 4
+    assert math.isclose(
+        mapped.getValues(mapped.getMinute(start + datetime.timedelta(days=1, hours=1, minutes=5)))[0], 2*(4 + 1/3)
+    )
+
+    # the grid starts at the first day of the calendar
+    grid = Grid(gridData=json.load(open('assets/settings/grid.json', 'r')), scenario=mapped)
+    assert grid.simulationDayTime == start
+    grid.step()
+    grid.step()
+    assert grid.getComponent('user_1').desiredKWH == 1
+
+
+def test_emptyScenario(tmp_path):
+    # a timeline without rows has no period to repeat
+    with pytest.raises(SystemExit):
+        ScenarioTimeline(['u'], [USER], np.empty((0, 1)))
+    with pytest.raises(SystemExit):
+        ScenarioTimeline.create(tmp_path / 'created.bin', ['u'], [USER], rows=0)
+    assert not (tmp_path / 'created.bin').exists()
+
+    header = json.dumps({
+        'ids': ['u'], 'typeCodes': [USER], 'rows': 0, 'resolution': 15, 'lag': 0, 'start': None, 'dtype': '<f4'
+    }).encode('utf-8')
+    with open(tmp_path / 'empty.bin', 'wb') as file:
+        file.write(scenarioMagic + struct.pack('<Q', len(header)) + header)
+        file.write(bytes(-file.tell() % headerAlignment))
+    with pytest.raises(SystemExit):
+        loadScenario(tmp_path / 'empty.bin')
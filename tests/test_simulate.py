@@ -0,0 +1,26 @@
+from simulate import loadSettings, simulate
+from grid import Grid
+import csv, subprocess, sys
+
+
+def test_simulate(tmp_path):
+    grid = Grid(
+        gridData=loadSettings('assets/settings/grid.json'), 
+        gridSize=20, 
+        scenario=loadSettings('assets/settings/scenario.json')
+    )
+    outputPath = tmp_path / 'simulation.csv'
+
+    simulate(grid, 8, outputPath)
+
+    with open(outputPath, 'r', newline='') as file:
+        rows = list(csv.reader(file))
+
+    assert len(rows) == 9
+    assert rows[0][:4] == ['step', 'simulationDayTime', 'equilibrium', 'runningEquilibrium']
+    assert rows[-1][1] == '0001-01-02T02:00:00'
+    assert float(rows[-1][3]) == grid.getRunningEquilibrium()
+
+    # the headless runner must not depend on a display, checked in a fresh interpreter since other tests may import it
+    process = subprocess.run([sys.executable, '-c', 'import simulate, sys; assert "pygame" not in sys.modules'])
+    assert process.returncode == 0
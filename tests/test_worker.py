@@ -0,0 +1,73 @@
+from simulate import loadSettings
+from worker import GridSnapshot, SimulationWorker
+from grid import Grid
+import time
+
+
+def waitFor(condition, timeout=10):
+    startTime = time.time()
+    while not condition():
+        assert time.time() - startTime < timeout
+        time.sleep(0.01)
+
+
+def test_simulationWorker():
+    grid = Grid(
+        gridData=loadSettings('assets/settings/grid.json'),
+        gridSize=20,
+        scenario=loadSettings('assets/settings/scenario.json'),
+        timestepSize=0.01
+    )
+    worker = SimulationWorker(grid)
+    first = worker.snapshot
+    worker.start()
+
+    # the worker steps on its own and publishes a new snapshot after each step
+    waitFor(lambda: worker.snapshot.simulationDayTime > first.simulationDayTime)
+    assert worker.snapshot.cells is first.cells
+
+    # commands are applied on the simulation thread
+    worker.send('togglePause')
+    waitFor(lambda: worker.snapshot.paused)
+    paused = worker.snapshot
+    time.sleep(0.1)
+    assert worker.snapshot is paused
+
+    worker.send('setCell', 0, 0, not paused.cells[0][0])
+    waitFor(lambda: worker.snapshot is not paused)
+    assert worker.snapshot.cells[0][0] != paused.cells[0][0]
+    assert worker.snapshot.topologyVersion != paused.topologyVersion
+    assert worker.snapshot.simulationDayTime == paused.simulationDayTime
+
+    worker.send('stop')
+    worker.join(timeout=10)
+    assert not worker.is_alive()
+
+
+def test_gridSnapshot():
+    grid = Grid(
+        gridData=loadSettings('assets/settings/grid.json'),
+        gridSize=20,
+        scenario=loadSettings('assets/settings/scenario.json'),
+        arrayBacked=True
+    )
+    grid.step()
+    snapshot = GridSnapshot(grid)
+
+    for c in grid.providers + grid.users + grid.storages + grid.p2xs:
+        assert snapshot.getSatisfactionAt(c.coordX, c.coordY) == c.getSatisfaction()
+    assert len(snapshot.dependencies) == sum(len(ids) for ids in grid.dependencyMap.values())
+
+
+def test_getComponentsIn():
+    grid = Grid(
+        gridData=loadSettings('assets/settings/grid.json'),
+        gridSize=20,
+        scenario=loadSettings('assets/settings/scenario.json')
+    )
+    snapshot = GridSnapshot(grid)
+
+    for region in ((0, 0, 20, 20), (0, 0, 5, 5), (3, 2, 17, 9), (16, 16, 20, 20), (4, 4, 4, 4)):
+        left, top, right, bottom = region
+        expected = [c for c in snapshot.components if left <= c[1] < right and top <= c[2] < bottom]
+        assert sorted(snapshot.getComponentsIn(*region)) == sorted(expected)
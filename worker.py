@@ -0,0 +1,202 @@
+from grid import Grid
+from store import PROVIDER, USER, STORAGE, P2X
+import queue, threading, time
+
+
+# size of the square tiles of the spatial index of the snapshot components in cells
+tileSize = 16
+
+
+class GridSnapshot:
+    """Immutable copy of the grid state that is needed to render a frame. Snapshots are published by the simulation
+    worker after each change of the grid, so the renderer never reads the grid while it is being stepped.
+
+    The cells are only copied when the topology changed, otherwise they are shared with the previous snapshot. The
+    components are indexed by square tiles of tileSize cells, so that the components within a region can be found
+    without scanning all of them, see getComponentsIn().
+
+    Args:
+        grid(Grid): the grid to copy the state of
+        paused(bool): whether the simulation is paused
+        previous(GridSnapshot): the previously published snapshot, if any
+        stepTime(float): wall time of the last step in seconds
+    """
+
+    def __init__(self, grid: Grid, paused: bool = False, previous=None, stepTime: float = 0.0):
+        self.cellSize = grid.cellSize
+        self.timestepSize = grid.timestepSize
+        self.simulationDayTime = grid.simulationDayTime
+        self.stepCounter = grid.stepCounter
+        self.equilibrium = grid.getRunningEquilibrium()
+        self.paused = paused
+        self.stepTime = stepTime
+
+        self.topologyVersion = grid.topologyVersion
+        if previous is not None and previous.topologyVersion == self.topologyVersion:
+            self.cells = previous.cells
+        else:
+            self.cells = tuple(tuple(column) for column in grid.cells)
+
+        # type code and position of each component
+        components = []
+        for typeCode, gridComponents in ((PROVIDER, grid.providers), (USER, grid.users), (STORAGE, grid.storages),
+                                         (P2X, grid.p2xs)):
+            for c in gridComponents:
+                components.append((typeCode, c.coordX, c.coordY))
+        self.components = tuple(components)
+
+        if previous is not None and previous.components == self.components:
+            self.componentsByTile = previous.componentsByTile
+        else:
+            self.componentsByTile = {}
+            for component in self.components:
+                tile = (component[1] // tileSize, component[2] // tileSize)
+                self.componentsByTile.setdefault(tile, []).append(component)
+
+        # satisfaction of each component by position
+        if grid.store is not None:
+            satisfactions = grid.store.getSatisfactions().tolist()
+            self.satisfactions = {
+                (c.coordX, c.coordY): satisfactions[c.storeIndex] for c in grid.store.components
+            }
+        else:
+            self.satisfactions = {}
+            for gridComponents in (grid.providers, grid.users, grid.storages, grid.p2xs):
+                for c in gridComponents:
+                    self.satisfactions[(c.coordX, c.coordY)] = c.getSatisfaction()
+
+        # consumer and supplier position of each dependency
+        dependencies = []
+        for componentID in grid.dependencyMap:
+            for adjacentComponentID in grid.dependencyMap[componentID]:
+                dependencies.append((grid.getPositionOf(componentID), grid.getPositionOf(adjacentComponentID)))
+        self.dependencies = tuple(dependencies)
+
+
+    def getComponentsIn(self, left: int, top: int, right: int, bottom: int) -> list:
+        """Returns the components within the given region of cells.
+
+        Args:
+            left(int): smallest x position of the region
+            top(int): smallest y position of the region
+            right(int): x position after the region
+            bottom(int): y position after the region
+
+        Returns:
+            list: type code and position (typeCode, x, y) of each component in the region
+        """
+
+        components = []
+        for tileX in range(left // tileSize, (right-1) // tileSize + 1):
+            for tileY in range(top // tileSize, (bottom-1) // tileSize + 1):
+                for component in self.componentsByTile.get((tileX, tileY), ()):
+                    if left <= component[1] < right and top <= component[2] < bottom:
+                        components.append(component)
+        return components
+
+
+    def getSatisfactionAt(self, x: int, y: int):
+        """Returns the satisfaction of the component on the given cell in percent, None if the cell is not occupied."""
+        return self.satisfactions.get((x, y))
+
+
+class SimulationWorker(threading.Thread):
+    """Steps a grid on its own thread, so that a slow step does not freeze the renderer. After each step or command
+    the worker publishes a new GridSnapshot, the renderer reads the latest one at its own frame rate.
+
+    The grid must only be changed through commands, see send().
+
+    Commands:
+        setCell(x, y, active): activates or deactivates a cell and resets the equilibrium
+        increaseTickrate(): shortens the timestep
+        decreaseTickrate(): lengthens the timestep
+        togglePause(): pauses or resumes stepping
+        stop(): ends the thread
+
+    Args:
+        grid(Grid): the grid to simulate
+    """
+
+    def __init__(self, grid: Grid):
+        super().__init__(daemon=True)
+        self.grid = grid
+        self.commands = queue.Queue()
+        self.paused = False
+        self.running = True
+        self.stepTime = 0.0
+        self.snapshot = GridSnapshot(grid)
+
+
+    def send(self, command: str, *args) -> None:
+        """Queues a command for the simulation thread.
+
+        Args:
+            command(str): name of the command
+            args: arguments of the command
+        """
+
+        self.commands.put((command, args))
+
+
+    def publish(self) -> None:
+        """Replaces the published snapshot by one of the current grid state."""
+
+        self.snapshot = GridSnapshot(self.grid, self.paused, self.snapshot, self.stepTime)
+
+
+    def handleCommand(self, command: str, args: tuple) -> None:
+        grid = self.grid
+
+        if command == 'setCell':
+            x, y, active = args
+            grid.setCell(x, y, active)
+            grid.resetEquilibrium()
+
+        elif command == 'increaseTickrate':
+            if grid.timestepSize * 0.9 >= 1**(-8):
+                grid.timestepSize = 1**(-8)
+            else:
+                grid.timestepSize *= 0.9
+
+        elif command == 'decreaseTickrate':
+            if grid.timestepSize * 1.1 <= 2:
+                grid.timestepSize *= 1.1
+            else:
+                grid.timestepSize = 2
+
+        elif command == 'togglePause':
+            self.paused = not self.paused
+
+        elif command == 'stop':
+            self.running = False
+
+        else:
+            print('unknown simulation command ' + command)
+            return
+
+        self.publish()
+
+
+    def run(self) -> None:
+        startTime = time.time()
+
+        while self.running:
+            # wait for commands until the next step is due
+            if self.paused:
+                timeout = None
+            else:
+                timeout = max(0, startTime + self.grid.timestepSize - time.time())
+
+            try:
+                command, args = self.commands.get(timeout=timeout)
+                self.handleCommand(command, args)
+                continue
+            except queue.Empty:
+                pass
+
+            # execute next grid decision, the timestep is over
+            stepStart = time.perf_counter()
+            self.grid.step()
+            self.stepTime = time.perf_counter() - stepStart
+            self.publish()
+            startTime = time.time()